@@ -0,0 +1,229 @@
+"""Persistent microphone capture for Jarvis.
+
+One capture thread keeps a single microphone stream open for the lifetime of
+the process and copies every frame into a fixed-size ring buffer. Command
+recognition, wake word detection and calibration read from that buffer, so the
+stream is never reopened and nothing said between commands is dropped.
+"""
+import threading
+import time
+
+import speech_recognition as sr
+
+
+class RingBuffer:
+    """Fixed-size buffer of audio frames addressed by an ever-increasing frame index."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.frames = [None] * capacity
+        self.end = 0  # Index of the next frame to be written
+        self.closed = False
+        self.cond = threading.Condition()
+
+    @property
+    def start(self):
+        """Index of the oldest frame still held in the buffer."""
+        return max(0, self.end - self.capacity)
+
+    def write(self, frame):
+        with self.cond:
+            self.frames[self.end % self.capacity] = frame
+            self.end += 1
+            self.cond.notify_all()
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def read(self, position, timeout=None):
+        """Return (frame, next_position), waiting for the frame if it hasn't been captured yet.
+
+        Readers that fell behind by more than the buffer size skip ahead to the
+        oldest frame still available. Returns (None, position) on timeout or
+        once the buffer is closed and drained.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: position < self.end or self.closed, timeout):
+                return None, position
+            if position >= self.end:
+                return None, position
+            position = max(position, self.start)
+            return self.frames[position % self.capacity], position + 1
+
+    def read_segment(self, start, end):
+        """Return the raw bytes of frames [start, end) that are still in the buffer."""
+        with self.cond:
+            start = max(start, self.start)
+            end = min(end, self.end)
+            return b"".join(self.frames[i % self.capacity] for i in range(start, end))
+
+
+class _BufferReader:
+    """File-like stream over a RingBuffer, compatible with what sr.Recognizer reads from."""
+
+    def __init__(self, source):
+        self.source = source
+
+    def read(self, size):
+        # Like PyAudio, `size` is in samples; our frames are whole chunks.
+        wanted = size * self.source.SAMPLE_WIDTH
+        data = b""
+        while len(data) < wanted:
+            frame, self.source.position = self.source.audio_stream.buffer.read(self.source.position)
+            if frame is None:
+                break  # Capture stopped; an empty read ends sr.Recognizer.listen()
+            data += frame
+        self.source.audio_stream.cursor = max(self.source.audio_stream.cursor, self.source.position)
+        return data
+
+    def close(self):
+        pass
+
+
+class BufferedSource(sr.AudioSource):
+    """An sr.AudioSource that reads from the shared ring buffer instead of opening a device."""
+
+    def __init__(self, audio_stream, position):
+        self.audio_stream = audio_stream
+        self.position = position
+        self.SAMPLE_RATE = audio_stream.SAMPLE_RATE
+        self.SAMPLE_WIDTH = audio_stream.SAMPLE_WIDTH
+        self.CHUNK = audio_stream.CHUNK
+        self.stream = None
+
+    def __enter__(self):
+        self.stream = _BufferReader(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+class AudioStream:
+    """Keeps one microphone stream open and writes its frames into a ring buffer."""
+
+    def __init__(self, microphone=None, buffer_seconds=30, max_backlog_seconds=3):
+        self.microphone = microphone if microphone is not None else sr.Microphone()
+        self.SAMPLE_RATE = self.microphone.SAMPLE_RATE
+        self.SAMPLE_WIDTH = self.microphone.SAMPLE_WIDTH
+        self.CHUNK = self.microphone.CHUNK
+
+        frames_per_second = self.SAMPLE_RATE / self.CHUNK
+        self.buffer = RingBuffer(max(1, int(buffer_seconds * frames_per_second)))
+        self.max_backlog = max(1, int(max_backlog_seconds * frames_per_second))
+
+        # Position just past the last frame handed to a command reader
+        self.cursor = 0
+
+        self.ready = threading.Event()
+        self.stopping = threading.Event()
+        self.thread = None
+
+    def start(self, timeout=5):
+        """Start the capture thread and wait until the first frame has arrived."""
+        if self.thread and self.thread.is_alive():
+            return self
+        self.thread = threading.Thread(target=self._capture, name="jarvis-capture", daemon=True)
+        self.thread.start()
+        if not self.ready.wait(timeout):
+            print("Warning: microphone did not deliver audio in time.")
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.thread:
+            self.thread.join(timeout=2)
+
+    def _capture(self):
+        try:
+            with self.microphone as mic:
+                while not self.stopping.is_set():
+                    frame = mic.stream.read(mic.CHUNK)
+                    if not frame:
+                        break
+                    self.buffer.write(frame)
+                    self.ready.set()
+        except Exception as e:
+            print(f"Audio capture error: {e}")
+        finally:
+            self.buffer.close()
+            self.ready.set()
+
+    def source(self, resume=True):
+        """Return an audio source for sr.Recognizer.
+
+        With resume=True the source continues where the previous command reader
+        stopped (at most `max_backlog_seconds` back), so speech that started
+        while Jarvis was busy is still heard. Otherwise it starts at live audio.
+        """
+        position = self.buffer.end
+        if resume:
+            position = max(self.cursor, self.buffer.end - self.max_backlog)
+        return BufferedSource(self, position)
+
+    def live_source(self):
+        """Return an audio source starting at the newest frame, without touching the command cursor."""
+        return BufferedSource(self, self.buffer.end)
+
+
+class FakeMicrophone(sr.AudioSource):
+    """Microphone stand-in that produces silent frames in real time after a simulated device open delay."""
+
+    def __init__(self, open_delay=0.05, sample_rate=16000, chunk_size=1024):
+        self.open_delay = open_delay
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk_size
+        self.stream = None
+
+    def __enter__(self):
+        time.sleep(self.open_delay)  # Stands in for PortAudio device setup
+        self.stream = _FakeStream(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        time.sleep(self.open_delay / 2)  # Stands in for stream teardown
+        self.stream = None
+
+
+class _FakeStream:
+    def __init__(self, mic):
+        self.mic = mic
+        self.next_frame_at = time.perf_counter()
+
+    def read(self, size):
+        self.next_frame_at += size / self.mic.SAMPLE_RATE
+        delay = self.next_frame_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return b"\x00" * (size * self.mic.SAMPLE_WIDTH)
+
+
+def benchmark(utterances=20, open_delay=0.05):
+    """Compare open-to-first-frame latency of reopening the microphone per utterance vs. the shared stream."""
+    reopen = []
+    for _ in range(utterances):
+        started = time.perf_counter()
+        with FakeMicrophone(open_delay=open_delay) as source:
+            source.stream.read(source.CHUNK)
+            reopen.append(time.perf_counter() - started)
+
+    stream = AudioStream(FakeMicrophone(open_delay=open_delay)).start()
+    persistent = []
+    for _ in range(utterances):
+        started = time.perf_counter()
+        with stream.source() as source:
+            source.stream.read(source.CHUNK)
+            persistent.append(time.perf_counter() - started)
+    stream.stop()
+
+    for label, samples in (("reopen per utterance", reopen), ("persistent stream", persistent)):
+        samples.sort()
+        print(f"{label:>22}: median {samples[len(samples) // 2] * 1000:.2f} ms, "
+              f"max {samples[-1] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,395 @@
+"""Worker processes for CPU-heavy audio work.
+
+Resampling, voice activity detection, MFCC features and local speech
+recognition over whole recordings are NumPy- or C-bound, and in Jarvis's own
+process they compete for the GIL with capture, routing and speech synthesis.
+AudioWorkerPool runs them in separate processes instead. In Jarvis that means
+offline (vosk) recognition when "audio_workers" is set, and batch.py's voice
+detection and recognition. The live voice detector and wake word detector
+stay in-process: they keep state from frame to frame and cost about 2 ms per
+second of audio each, less than a round trip to a worker per 64 ms frame
+would add. Each worker owns a slot in one
+multiprocessing.shared_memory block: the audio for a job is copied into the
+slot once and the worker reads it in place, and array results (resampled
+audio, features) come back through the same slot. Only a small job header
+and small results are pickled over the worker's connection.
+
+Workers are started as `python audio_workers.py worker ...` rather than with
+multiprocessing's spawn, which would re-run the parent script (main.py) in
+every worker before it could start.
+
+    python audio_workers.py                  # scaling benchmark on synthetic WAVs
+    python audio_workers.py clips/ 1,2,4     # on a directory of WAV files ("" for synthetic ones)
+"""
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import wave
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import connection, shared_memory
+from pathlib import Path
+from queue import Queue
+
+import numpy as np
+
+import vad
+import wake_word
+
+
+def _task_resample(samples, sample_rate, to_rate=16000):
+    """int16 audio at `to_rate`."""
+    resampled = wake_word.resample(samples.astype(np.float32) / 32768.0, sample_rate, to_rate)
+    return (np.clip(resampled, -1, 1) * 32767).astype("<i2")
+
+
+def _task_vad(samples, sample_rate, frame_ms=20):
+    """[(start, end)] in seconds of each voiced stretch."""
+    detector = vad.VoiceActivityDetector(sample_rate, frame_ms=frame_ms)
+    voiced = np.concatenate(([False], detector.classify(samples), [False]))
+    edges = np.flatnonzero(voiced[1:] != voiced[:-1]) * detector.frame_seconds
+    return [(float(a), float(b)) for a, b in zip(edges[::2], edges[1::2])]
+
+
+def _task_features(samples, sample_rate, to_rate=16000):
+    """MFCC frames of the voiced part of the audio, resampled to `to_rate`."""
+    segments = _task_vad(samples, sample_rate)
+    audio = wake_word.resample(samples.astype(np.float32) / 32768.0, sample_rate, to_rate)
+    voiced = [audio[int(a * to_rate):int(b * to_rate)] for a, b in segments]
+    extractor = _state.get(("mfcc", to_rate))
+    if extractor is None:
+        extractor = _state[("mfcc", to_rate)] = wake_word.MFCC(to_rate)
+    if not voiced:
+        return np.zeros((0, extractor.dct.shape[0]), dtype=np.float32)
+    return np.concatenate([extractor(v) for v in voiced]).astype(np.float32)
+
+
+def _task_transcribe(samples, sample_rate, chunk=4000):
+    """The transcript from the recognizer named in the pool's settings, or None if nothing was understood."""
+    import speech_recognition as sr
+
+    import recognizers
+
+    backend = _state.get("recognizer")
+    if backend is None:
+        if "settings" not in _state:
+            raise RuntimeError("no recognizer settings in this process; transcribe through an AudioWorkerPool")
+        # A worker was asked for this backend; it never quietly switches to an online one
+        backend = _state["recognizer"] = recognizers.create_recognizer(_state["settings"], fallback=False)
+    session = backend.session(sample_rate, 2)
+    data = samples.tobytes()
+    for start in range(0, len(data), chunk * 2):
+        session.feed(data[start:start + chunk * 2])
+    try:
+        return session.finish()
+    except sr.UnknownValueError:
+        return None
+
+
+def _task_echo(samples, sample_rate):
+    """The audio itself; measures the cost of moving frames to a worker and back."""
+    return samples.copy()
+
+
+TASKS = {"resample": _task_resample, "vad": _task_vad, "features": _task_features, "transcribe": _task_transcribe,
+         "echo": _task_echo}
+
+# Per-worker state: the pool's settings, the recognizer and feature extractors, created once per process
+_state = {}
+
+# glibc hands allocations over 128 KB straight back to the system when they are freed, so
+# every job's NumPy temporaries were page-faulted in afresh; workers keep them in the heap.
+# Other C libraries ignore these variables.
+_WORKER_MALLOC_ENV = {"MALLOC_MMAP_THRESHOLD_": str(32 << 20), "MALLOC_TRIM_THRESHOLD_": str(64 << 20)}
+
+
+def run_task(task, audio, sample_rate, params=None):
+    """Run a task in this process; `audio` is raw int16 bytes or an int16 array."""
+    samples = np.frombuffer(audio, dtype="<i2") if isinstance(audio, (bytes, bytearray, memoryview)) else audio
+    return TASKS[task](samples, sample_rate, **(params or {}))
+
+
+def _attach(name):
+    """Open the parent's shared memory without letting this process's resource tracker delete it on exit."""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)  # Python 3.13+
+    except TypeError:
+        memory = shared_memory.SharedMemory(name=name)
+        if os.name == "posix":
+            from multiprocessing import resource_tracker
+            resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+def _worker(address, memory_name, offset, slot_bytes):
+    """Worker process: run jobs from the pool on the audio in this worker's slot."""
+    conn = connection.Client(address, authkey=bytes.fromhex(os.environ.pop("JARVIS_AUDIO_WORKER_KEY")))
+    if hasattr(os, "nice"):
+        os.nice(5)  # Capture, routing and speech in Jarvis's own process come first when cores are short
+    memory = _attach(memory_name)
+    _state["settings"] = conn.recv()
+    try:
+        while True:
+            try:
+                job = conn.recv()
+            except EOFError:
+                break
+            task, nbytes, sample_rate, params = job
+            samples = np.frombuffer(memory.buf, dtype="<i2", count=nbytes // 2, offset=offset)
+            try:
+                result = TASKS[task](samples, sample_rate, **params)
+            except Exception as e:
+                del samples
+                conn.send(("error", f"{type(e).__name__}: {e}"))
+                continue
+            del samples
+            if isinstance(result, np.ndarray) and result.nbytes <= slot_bytes:
+                result = np.ascontiguousarray(result)
+                np.frombuffer(memory.buf, dtype=result.dtype, count=result.size, offset=offset)[:] = result.ravel()
+                conn.send(("array", (result.dtype.str, result.shape)))
+            else:
+                conn.send(("value", result))
+    finally:
+        memory.close()
+
+
+class AudioWorkerPool:
+    """Runs audio tasks in `workers` processes, passing audio through shared memory.
+
+    A job's audio can be up to `slot_bytes` long (the default holds about four
+    minutes of 16 kHz audio). Jobs queue up while every worker is busy.
+    """
+
+    def __init__(self, workers=None, slot_bytes=8 << 20, settings=None, start_timeout=30):
+        self.workers = max(1, workers or (os.cpu_count() or 2) - 1)
+        self.slot_bytes = slot_bytes
+        self.settings = dict(settings or {})
+        self.start_timeout = start_timeout
+        self.memory = shared_memory.SharedMemory(create=True, size=self.workers * slot_bytes)
+        self.jobs = Queue()
+        self.closed = False
+        self.threads = []
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._serve, args=(index,), name=f"jarvis-audio-{index}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, task, audio, sample_rate, **params):
+        """Queue a task on raw int16 audio (bytes or array); returns a Future with its result."""
+        if task not in TASKS:
+            raise ValueError(f"Unknown audio task: {task}")
+        if isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio, dtype="<i2")
+        data = memoryview(audio).cast("B")
+        if data.nbytes > self.slot_bytes:
+            raise ValueError(f"{data.nbytes} bytes of audio don't fit the pool's {self.slot_bytes}-byte slots")
+        if self.closed:
+            raise RuntimeError("The audio worker pool is closed")
+        future = Future()
+        self.jobs.put((future, task, data, sample_rate, params))
+        return future
+
+    def run(self, task, audio, sample_rate, **params):
+        return self.submit(task, audio, sample_rate, **params).result()
+
+    def map(self, task, clips, **params):
+        """Results of `task` over [(audio, sample_rate)], in order, keeping every worker busy."""
+        futures = [self.submit(task, audio, rate, **params) for audio, rate in clips]
+        return [f.result() for f in futures]
+
+    def _start_worker(self, index):
+        key = secrets.token_bytes(16)
+        with connection.Listener(authkey=key) as listener:
+            process = subprocess.Popen(
+                [sys.executable, os.path.abspath(__file__), "worker", str(listener.address), self.memory.name,
+                 str(index * self.slot_bytes), str(self.slot_bytes)],
+                env=dict(os.environ, JARVIS_AUDIO_WORKER_KEY=key.hex(), **_WORKER_MALLOC_ENV))
+            # accept() can't time out, so it waits on its own thread while the worker is watched
+            accepted = []
+            acceptor = threading.Thread(target=lambda: accepted.append(listener.accept()), daemon=True)
+            acceptor.start()
+            deadline = time.monotonic() + self.start_timeout
+            while acceptor.is_alive() and process.poll() is None and time.monotonic() < deadline:
+                acceptor.join(0.05)
+            if not accepted:
+                process.kill()
+                connection.Client(listener.address, authkey=key).close()  # Wake the acceptor
+                acceptor.join()
+                raise OSError(f"exited with status {process.poll()} before connecting")
+        conn = accepted[0]
+        conn.send(self.settings)
+        return process, conn
+
+    def _serve(self, index):
+        """Feed one worker: copy each job's audio into its slot, send the header, collect the result."""
+        offset = index * self.slot_bytes
+        process = conn = None
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            future, task, data, sample_rate, params = job
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                if conn is None:
+                    process, conn = self._start_worker(index)
+                self.memory.buf[offset:offset + data.nbytes] = data
+                conn.send((task, data.nbytes, sample_rate, params))
+                kind, value = conn.recv()
+            except (EOFError, OSError) as e:
+                future.set_exception(RuntimeError(f"Audio worker {index} stopped: {e}"))
+                if process is not None:
+                    process.kill()
+                process = conn = None  # Started again for the next job
+                continue
+            if kind == "array":
+                dtype, shape = value
+                count = int(np.prod(shape))
+                value = np.frombuffer(self.memory.buf, dtype=dtype, count=count, offset=offset).reshape(shape).copy()
+            if kind == "error":
+                future.set_exception(RuntimeError(value))
+            else:
+                future.set_result(value)
+        if conn is not None:
+            conn.close()
+            process.wait(timeout=5)
+
+    def close(self):
+        """Finish queued jobs, stop the workers and free the shared memory."""
+        if self.closed:
+            return
+        self.closed = True
+        for _ in self.threads:
+            self.jobs.put(None)
+        for thread in self.threads:
+            thread.join(timeout=30)
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_clip(path):
+    """(raw int16 audio, sample rate) of a mono 16-bit WAV file, or None for other formats."""
+    with wave.open(str(path), "rb") as f:
+        if f.getnchannels() != 1 or f.getsampwidth() != 2:
+            return None
+        return f.readframes(f.getnframes()), f.getframerate()
+
+
+def write_clips(directory, count=32, seconds=6.0, sample_rate=44100, seed=3):
+    """Synthetic speech-like WAV files at a typical device rate, so resampling has work to do."""
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for n in range(count):
+        length = int(seconds * sample_rate)
+        audio = rng.normal(0, 0.003, length)
+        start = int(rng.uniform(0.5, 1.5) * sample_rate)
+        while start < length - sample_rate:
+            burst = min(int(rng.uniform(0.6, 1.4) * sample_rate), length - start)
+            audio[start:start + burst] += vad.synthetic_voice(burst, sample_rate, rng.uniform(100, 220))
+            start += burst + int(rng.uniform(0.6, 1.2) * sample_rate)
+        with wave.open(str(directory / f"clip_{n:03d}.wav"), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+
+def benchmark(directory=None, worker_counts=None, task="features"):
+    """Files per second on a directory of WAVs: in-process, threads, pickling process pool, shared-memory pool."""
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({1, 2, max(1, cores // 2), cores})
+    with tempfile.TemporaryDirectory(prefix="jarvis_audio_") as tmp:
+        if directory is None:
+            directory = tmp
+            write_clips(tmp)
+        clips = [clip for clip in (read_clip(p) for p in sorted(Path(directory).glob("*.wav"))) if clip]
+        if not clips:
+            print(f"No mono 16-bit WAV files in {directory}.")
+            return
+        seconds = sum(len(audio) / 2 / rate for audio, rate in clips)
+        print(f"{len(clips)} files, {seconds:.0f} s of audio, task '{task}', {cores} CPU cores")
+
+        def timed(label, work):
+            """Run work() while a 5 ms timer ticks in this process, like Jarvis's capture and routing threads."""
+            late = []
+            done = threading.Event()
+
+            def tick():
+                while not done.is_set():
+                    started = time.perf_counter()
+                    time.sleep(0.005)
+                    late.append(time.perf_counter() - started - 0.005)
+
+            ticker = threading.Thread(target=tick, daemon=True)
+            ticker.start()
+            started = time.perf_counter()
+            result = work()
+            elapsed = time.perf_counter() - started
+            done.set()
+            ticker.join()
+            late.sort()
+            print(f"  {label:>28}: {elapsed:6.2f} s, {len(clips) / elapsed:6.1f} files/s, "
+                  f"{seconds / elapsed:6.0f}x real time; timer p99 {late[int(len(late) * 0.99)] * 1000:5.1f} ms late")
+            return elapsed, result
+
+        inline, expected = timed("in-process", lambda: [run_task(task, audio, rate) for audio, rate in clips])
+
+        for workers in worker_counts:
+            with ThreadPoolExecutor(workers) as executor:
+                timed(f"{workers} threads", lambda: list(executor.map(lambda clip: run_task(task, *clip), clips)))
+
+            # Both pools run the task once per worker before timing. Forked ProcessPoolExecutor
+            # workers start with this process's imports and caches, pool workers start from
+            # scratch, and a cold first job made the shared-memory pool look slower than it is
+            with ProcessPoolExecutor(workers) as executor:
+                list(executor.map(run_task, [task] * workers, [clips[0][0]] * workers, [clips[0][1]] * workers))
+                timed(f"{workers} processes, pickled", lambda: list(executor.map(
+                    run_task, [task] * len(clips), [a for a, _ in clips], [r for _, r in clips])))
+
+            with AudioWorkerPool(workers) as pool:
+                pool.map(task, [clips[0]] * workers)
+                elapsed, results = timed(f"{workers} processes, shared memory", lambda: pool.map(task, clips))
+                print(f"  {'':>28}  {inline / elapsed:.2f}x the in-process throughput")
+                assert all(_same(a, b) for a, b in zip(results, expected))
+
+        # What moving a clip costs, without the work
+        audio, rate = max(clips, key=lambda clip: len(clip[0]))
+        with AudioWorkerPool(1) as pool, ProcessPoolExecutor(1) as executor:
+            pool.run("echo", audio, rate)
+            executor.submit(run_task, "echo", audio, rate).result()
+            rounds = 50
+            started = time.perf_counter()
+            for _ in range(rounds):
+                pool.run("echo", audio, rate)
+            shared = (time.perf_counter() - started) / rounds
+            started = time.perf_counter()
+            for _ in range(rounds):
+                executor.submit(run_task, "echo", audio, rate).result()
+            pickled = (time.perf_counter() - started) / rounds
+        print(f"Round trip of a {len(audio) // 1024} KB clip to a worker and back: shared memory "
+              f"{shared * 1000:.2f} ms, pickled {pickled * 1000:.2f} ms")
+
+
+def _same(a, b):
+    if isinstance(a, np.ndarray):
+        return a.shape == b.shape and np.allclose(a, b)
+    return a == b
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "worker":
+        _worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]))
+    else:
+        benchmark(sys.argv[1] or None if len(sys.argv) > 1 else None,
+                  [int(n) for n in sys.argv[2].split(",")] if len(sys.argv) > 2 else None)
@@ -0,0 +1,405 @@
+"""Run recorded audio (voice memos, call logs) through recognition and intent routing.
+
+Files come from a directory (every .wav, .aiff and .flac under it) or a
+manifest: a text file with one path per line, or JSONL lines like
+{"path": "memo.wav", "id": "memo-1", "transcript": "what time is it"}.
+Several files are processed at once. Voice detection and offline (vosk)
+recognition run in audio_workers processes; Google recognition, routing and
+answering run on threads. Each file becomes one JSONL line with its
+transcripts, intents and per-step timings.
+
+Commands are answered (with --respond) in a session of their own, as in
+server mode: what Jarvis would say is recorded instead of spoken, pages it
+would open are recorded as actions instead of opened, and commands that would
+launch programs are declined, and answers are neither looked up in nor added
+to the answer cache and archive, so nothing on this computer is touched.
+
+A checkpoint file next to the output records each finished file and the
+output's length after it; a rerun skips those files and drops any partial
+line written after the last checkpoint. An output with results but no
+checkpoint is left alone unless --overwrite is given.
+
+    python batch.py memos/ --output memos.jsonl --split
+    python batch.py calls.jsonl --backend fake --respond     # transcripts from the manifest
+    python batch.py --benchmark
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import speech_recognition as sr
+
+import audio_workers
+from pipeline import percentile
+
+AUDIO_SUFFIXES = {".wav", ".aiff", ".aif", ".flac"}
+
+
+class Item:
+    __slots__ = ("key", "path", "transcript")
+
+    def __init__(self, path, key=None, transcript=None):
+        self.path = Path(path)
+        self.key = key or str(self.path.resolve())
+        self.transcript = transcript  # Known transcript, used by the "fake" backend
+
+
+def list_items(source):
+    """Items for a directory of audio files or a manifest."""
+    source = Path(source)
+    if source.is_dir():
+        paths = sorted(p for p in source.rglob("*") if p.suffix.lower() in AUDIO_SUFFIXES)
+        items = []
+        for path in paths:
+            sidecar = path.with_suffix(".txt")
+            items.append(Item(path, transcript=sidecar.read_text().strip() if sidecar.exists() else None))
+        return items
+    items = []
+    for line in source.read_text().splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        entry = json.loads(line) if line.startswith("{") else {"path": line}
+        path = Path(entry["path"])
+        if not path.is_absolute():
+            path = source.parent / path
+        items.append(Item(path, entry.get("id"), entry.get("transcript")))
+    return items
+
+
+def load_audio(path):
+    """(mono int16 bytes, sample rate) of a WAV, AIFF or FLAC file."""
+    with sr.AudioFile(str(path)) as source:
+        audio = sr.Recognizer().record(source)
+    return audio.get_raw_data(convert_width=2), audio.sample_rate
+
+
+def utterances(voiced, duration, gap=0.8, pad=0.15, min_length=0.3):
+    """Merge voiced stretches closer than `gap` seconds into utterances, padded a little on both sides."""
+    merged = []
+    for start, end in voiced:
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(max(0.0, a - pad), min(duration, b + pad)) for a, b in merged if b - a >= min_length]
+
+
+class Checkpoint:
+    """Finished files and the output's length after each, so a rerun can pick up where this one stopped."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        self.offset = 0
+        if self.path.exists():
+            data = self.path.read_bytes()
+            # A line without its newline was cut off mid-write; its offset can't be trusted
+            complete = data[:data.rfind(b"\n") + 1]
+            for line in complete.decode("utf-8").splitlines():
+                key, _, offset = line.rpartition("\t")
+                if key and offset.isdigit():
+                    self.done.add(key)
+                    self.offset = int(offset)
+            if len(complete) != len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(len(complete))
+        self.file = open(self.path, "a", encoding="utf-8")
+
+    def mark(self, key, offset):
+        self.done.add(key)
+        self.offset = offset
+        self.file.write(f"{key}\t{offset}\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+class BatchRunner:
+    """Transcribes, routes and (optionally) answers a list of audio files in parallel."""
+
+    def __init__(self, jarvis, backend="google", split=False, respond=False, jobs=8, pool=None, settings=None):
+        self.jarvis = jarvis
+        self.backend = backend
+        self.split = split
+        self.respond = respond
+        self.jobs = jobs
+        self.pool = pool
+        # The same settings the pool's workers recognize with, so this process never picks another backend
+        self.settings = dict(settings if settings is not None else jarvis.get_settings(), recognizer_backend=backend)
+        self.recognizer = None
+        self.recognizer_lock = threading.Lock()
+
+    def fits_pool(self, audio):
+        return self.pool is not None and len(audio) <= self.pool.slot_bytes
+
+    def analyze(self, task, audio, rate):
+        """Run a CPU-bound task in the worker pool when there is one and the audio fits its slots."""
+        if self.fits_pool(audio):
+            return self.pool.run(task, audio, rate)
+        return audio_workers.run_task(task, audio, rate)
+
+    def local_recognizer(self):
+        """The configured recognizer in this process, created on first use (a vosk model is slow to load)."""
+        with self.recognizer_lock:
+            if self.recognizer is None:
+                import recognizers
+                self.recognizer = recognizers.create_recognizer(self.settings, fallback=False)
+            return self.recognizer
+
+    def transcribe(self, item, audio, rate):
+        if self.backend == "fake":
+            return item.transcript
+        if self.backend == "vosk" and self.fits_pool(audio):
+            return self.pool.run("transcribe", audio, rate)
+        try:
+            return self.local_recognizer().recognize(sr.AudioData(audio, rate, 2))
+        except sr.UnknownValueError:
+            return None
+
+    def process(self, item):
+        """The JSONL record for one file."""
+        import sessions
+
+        timings = {}
+        record = {"file": str(item.path), "id": item.key, "segments": [], "error": None}
+        started = time.perf_counter()
+        try:
+            audio, rate = load_audio(item.path)
+            duration = len(audio) / 2 / rate
+            record.update(duration_s=round(duration, 3), sample_rate=rate)
+            timings["load"] = time.perf_counter() - started
+
+            step = time.perf_counter()
+            voiced = self.analyze("vad", audio, rate)
+            timings["vad"] = time.perf_counter() - step
+            record["speech_s"] = round(sum(b - a for a, b in voiced), 3)
+            spans = utterances(voiced, duration) if self.split and self.backend != "fake" else [(0.0, duration)]
+
+            session = sessions.Session(self.jarvis.get_settings(), user="batch", keep_answers=False) if self.respond else None
+            for key in ("stt", "route", "respond"):
+                timings[key] = 0.0
+            for start, end in spans:
+                step = time.perf_counter()
+                piece = audio[int(start * rate) * 2:int(end * rate) * 2]
+                transcript = self.transcribe(item, piece, rate)
+                timings["stt"] += time.perf_counter() - step
+                segment = {"start": round(start, 3), "end": round(end, 3), "transcript": transcript, "intent": None}
+                if transcript:
+                    step = time.perf_counter()
+                    segment["intent"] = self.jarvis.command_router.route(transcript)
+                    timings["route"] += time.perf_counter() - step
+                    if session is not None:
+                        step = time.perf_counter()
+                        with sessions.active(session):
+                            self.jarvis.handle_command(transcript, segment["intent"])
+                        segment["replies"], segment["actions"] = session.drain()
+                        timings["respond"] += time.perf_counter() - step
+                record["segments"].append(segment)
+        except Exception as e:
+            record["error"] = f"{type(e).__name__}: {e}"
+        timings["total"] = time.perf_counter() - started
+        record["timings_ms"] = {k: round(v * 1000, 2) for k, v in timings.items()}
+        return record
+
+    def run(self, items, output, checkpoint_path=None, overwrite=False):
+        """Process every item not in the checkpoint, appending records to `output`. Returns the new records.
+
+        Without a checkpoint, an `output` that already has results is only
+        replaced if `overwrite` is set; otherwise FileExistsError is raised.
+        """
+        checkpoint_path = Path(checkpoint_path or f"{output}.checkpoint")
+        if not (overwrite or checkpoint_path.exists()) and os.path.exists(output) and os.path.getsize(output):
+            raise FileExistsError(f"{output} already has results and no checkpoint to resume from")
+        checkpoint = Checkpoint(checkpoint_path)
+        with open(output, "ab") as f:
+            f.truncate(checkpoint.offset)  # Lines after the last checkpoint are written again
+        pending = [item for item in items if item.key not in checkpoint.done]
+        skipped = len(items) - len(pending)
+        if skipped:
+            print(f"Resuming: {skipped} of {len(items)} files already done.")
+        records = []
+        try:
+            with open(output, "a", encoding="utf-8") as out, ThreadPoolExecutor(self.jobs) as executor:
+                queued = iter(pending)
+                running = set()
+                while True:
+                    # Only a few files in flight at a time, so a long list isn't all loaded at once
+                    for item in queued:
+                        running.add(executor.submit(self.process, item))
+                        if len(running) >= self.jobs * 2:
+                            break
+                    if not running:
+                        break
+                    finished, running = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        record = future.result()
+                        out.write(json.dumps(record) + "\n")
+                        out.flush()
+                        checkpoint.mark(record["id"], out.tell())
+                        records.append(record)
+        finally:
+            checkpoint.close()
+        return records
+
+
+def summarize(records, elapsed):
+    audio = sum(r.get("duration_s", 0) for r in records)
+    intents = {}
+    for r in records:
+        for segment in r["segments"]:
+            intent = segment["intent"] or ("chat" if segment["transcript"] else "(not understood)")
+            intents[intent] = intents.get(intent, 0) + 1
+    steps = {}
+    for key in ("load", "vad", "stt", "route", "respond", "total"):
+        values = [r["timings_ms"][key] for r in records if key in r["timings_ms"]]
+        if values and any(values):
+            steps[key] = {"p50": percentile(values, 0.5), "p95": percentile(values, 0.95)}
+    return {"files": len(records), "errors": sum(bool(r["error"]) for r in records), "seconds": elapsed,
+            "files_per_second": len(records) / elapsed if elapsed else 0.0,
+            "audio_seconds": audio, "realtime_factor": audio / elapsed if elapsed else 0.0,
+            "intents": intents, "steps_ms": steps}
+
+
+def print_summary(summary):
+    print(f"{summary['files']} files ({summary['audio_seconds']:.0f} s of audio) in {summary['seconds']:.2f} s: "
+          f"{summary['files_per_second']:.1f} files/s, {summary['realtime_factor']:.0f}x real time, "
+          f"{summary['errors']} errors")
+    print("Intents: " + ", ".join(f"{k} {v}" for k, v in sorted(summary["intents"].items(), key=lambda kv: -kv[1])))
+    for key, values in summary["steps_ms"].items():
+        print(f"  {key:>8}: p50 {values['p50']:.1f} ms, p95 {values['p95']:.1f} ms per file")
+
+
+def run_batch(args):
+    items = list_items(args.source)
+    if not items:
+        print(f"No audio files in {args.source}.")
+        return 1
+    import main as jarvis  # After the arguments are checked
+
+    backend = args.backend or jarvis.get_settings().get("recognizer_backend", "google")
+    settings = dict(jarvis.get_settings(), recognizer_backend=backend)
+    pool = audio_workers.AudioWorkerPool(args.workers, slot_bytes=args.max_minutes * 60 * 48000 * 2,
+                                         settings=settings) if args.workers != 0 else None
+    try:
+        runner = BatchRunner(jarvis, backend, args.split, args.respond, args.jobs, pool, settings)
+        started = time.perf_counter()
+        try:
+            records = runner.run(items, args.output, args.checkpoint, args.overwrite)
+        except FileExistsError as e:
+            print(f"{e}; pass --overwrite to replace it.")
+            return 1
+        summary = summarize(records, time.perf_counter() - started)
+    finally:
+        if pool is not None:
+            pool.close()
+    if records:
+        print_summary(summary)
+    else:
+        print("Every file was already done.")
+    print(f"Results in {args.output}")
+    return 1 if summary["errors"] else 0
+
+
+def benchmark(files=64, worker_counts=None):
+    """Files per second over synthetic memos by worker count, and a resumed run after an interruption."""
+    cores = os.cpu_count() or 1
+    worker_counts = worker_counts or sorted({0, 1, 2, cores})
+    commands = ["what time is it", "open youtube", "tell me the news", "what's the weather in london",
+                "play some jazz", "what is quantum computing"]
+    with tempfile.TemporaryDirectory(prefix="jarvis_batch_") as tmp:
+        audio_dir = Path(tmp) / "memos"
+        audio_workers.write_clips(audio_dir, count=files, seconds=8.0)
+        for i, path in enumerate(sorted(audio_dir.glob("*.wav"))):
+            path.with_suffix(".txt").write_text(commands[i % len(commands)])
+        cwd = os.getcwd()
+        os.chdir(tmp)  # main.py keeps its settings and caches in the working directory
+        try:
+            Path("jarvis_settings.json").write_text(json.dumps({"persist_chat": False, "response_cache": False}))
+            import http_client
+            import main as jarvis
+            from harness import StubSession
+            jarvis.get_settings()  # Read from this directory, not the one Jarvis runs in
+            jarvis.api_available = False  # Answers come from the offline responses
+            jarvis.http = http_client.HttpClient()
+            jarvis.http.session = StubSession(latency=0)  # Canned weather and news
+
+            items = list_items(audio_dir)
+            print(f"{files} memos of 8 s, transcripts known (fake recognizer), answered offline; {cores} CPU cores")
+            for workers in worker_counts:
+                output = Path(tmp) / f"run_{workers}.jsonl"
+                pool = audio_workers.AudioWorkerPool(workers) if workers else None
+                if pool is not None:
+                    pool.map("echo", [(b"\0\0", 16000)] * workers)  # Start the workers before timing
+                runner = BatchRunner(jarvis, "fake", respond=True, jobs=max(2, workers * 2), pool=pool)
+                started = time.perf_counter()
+                records = runner.run(items, output)
+                summary = summarize(records, time.perf_counter() - started)
+                if pool is not None:
+                    pool.close()
+                print(f"  {workers or 'no'} worker processes: {summary['files_per_second']:6.1f} files/s, "
+                      f"{summary['realtime_factor']:5.0f}x real time, vad p50 {summary['steps_ms']['vad']['p50']:.1f} ms, "
+                      f"{summary['errors']} errors")
+
+            # Interrupted after a third of the files, with half a line written after the last checkpoint
+            output = Path(tmp) / "resumed.jsonl"
+            runner = BatchRunner(jarvis, "fake", respond=True, jobs=2)
+            runner.run(items[:files // 3], output)
+            with open(output, "a") as f:
+                f.write('{"file": "half a line')
+            records = runner.run(items, output)
+            lines = [json.loads(line) for line in output.read_text().splitlines()]
+            print(f"Resumed run processed {len(records)} more files; {len(lines)} lines, "
+                  f"{len({r['id'] for r in lines})} distinct files in the output")
+            assert len(lines) == files == len({r["id"] for r in lines})
+            Path(f"{output}.checkpoint").unlink()
+            try:
+                runner.run(items, output)
+            except FileExistsError:
+                print("Without its checkpoint, the finished output is kept rather than overwritten")
+            assert len(output.read_text().splitlines()) == files
+            actions = sum(len(s.get("actions", [])) for r in lines for s in r["segments"])
+            print(f"{actions} pages recorded instead of opened; nothing was spoken, opened or launched")
+        finally:
+            os.chdir(cwd)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Transcribe and route a directory or manifest of audio files.")
+    parser.add_argument("source", nargs="?", help="directory of audio files, or a manifest (paths or JSONL)")
+    parser.add_argument("--output", default="jarvis_batch.jsonl")
+    parser.add_argument("--checkpoint", help="checkpoint file (default: <output>.checkpoint)")
+    parser.add_argument("--overwrite", action="store_true",
+                        help="replace an output that has results but no checkpoint, instead of stopping")
+    parser.add_argument("--backend", choices=["google", "vosk", "fake"],
+                        help="speech recognition backend (default: the recognizer_backend setting); "
+                             "fake uses the manifest's transcripts or .txt files next to the audio")
+    parser.add_argument("--split", action="store_true", help="cut long recordings into utterances at pauses")
+    parser.add_argument("--respond", action="store_true",
+                        help="also answer each command, with speech and other side effects recorded, not performed")
+    parser.add_argument("--jobs", type=int, default=8, help="files processed at once")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="audio worker processes (default: one per core but one; 0 runs everything on threads)")
+    parser.add_argument("--max-minutes", type=int, default=10,
+                        help="longest file handed to the workers; longer ones are processed on a thread")
+    parser.add_argument("--benchmark", action="store_true", help="measure throughput on synthetic memos")
+    args = parser.parse_args(argv)
+    if args.benchmark:
+        benchmark()
+        return 0
+    if not args.source:
+        parser.error("a directory or manifest is needed")
+    return run_batch(args)
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    os._exit(code)  # Don't wait for the speech and background threads
@@ -0,0 +1,332 @@
+"""Circuit breaker and request budget for the OpenAI API.
+
+Transient failures (rate limits, timeouts, 5xx) are retried with jittered
+exponential backoff, honoring Retry-After. Repeated failures open the circuit:
+Jarvis answers offline while a background probe checks the API, and the
+circuit closes again as soon as a probe succeeds. In the half-open state
+exactly one call - the background probe or the first caller after the wait -
+tests the API; everyone else fails fast until it resolves. A per-minute request and
+token budget spaces calls out so rate limits are rarely hit in the first place.
+"""
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling the API while the circuit is open."""
+
+
+class BudgetExceededError(Exception):
+    """Raised when a request would have to wait too long for the per-minute budget."""
+
+
+def is_api_error(error):
+    """True for errors the API itself reported (an HTTP status, a timeout, a lost connection)."""
+    if getattr(error, "status_code", None) is not None:
+        return True
+    try:
+        import openai
+        if isinstance(error, (openai.APIStatusError, openai.APITimeoutError, openai.APIConnectionError)):
+            return True
+    except ImportError:
+        pass
+    name = type(error).__name__
+    return "Timeout" in name or "Connection" in name or isinstance(error, (TimeoutError, ConnectionError))
+
+
+def classify(error):
+    """Return "transient", "quota" or "fatal" for an exception from the OpenAI client."""
+    status = getattr(error, "status_code", None)
+    name = type(error).__name__
+    text = str(error).lower()
+    if status == 429 and "insufficient_quota" in text:
+        return "quota"  # Out of credit; retrying won't help for a long while
+    if status in (401, 403) or "api key" in text:
+        return "fatal"
+    if status == 429 or (status is not None and status >= 500):
+        return "transient"
+    if "Timeout" in name or "Connection" in name or isinstance(error, (TimeoutError, ConnectionError)):
+        return "transient"
+    return "fatal" if status is not None else "transient"
+
+
+def retry_after(error):
+    """Seconds the server asked us to wait, from Retry-After / retry-after-ms headers."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except (TypeError, ValueError):
+        pass
+    return None
+
+
+class RateBudget:
+    """Sliding one-minute window of requests and tokens."""
+
+    def __init__(self, requests_per_minute=60, tokens_per_minute=40000):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.window = deque()  # (timestamp, tokens)
+        self.lock = threading.Lock()
+
+    def _wait_time(self, tokens, now):
+        while self.window and now - self.window[0][0] >= 60:
+            self.window.popleft()
+        if not self.window:
+            return 0.0
+        used = sum(t for _, t in self.window)
+        wait = 0.0
+        if len(self.window) >= self.requests_per_minute:
+            wait = self.window[len(self.window) - self.requests_per_minute][0] + 60 - now
+        if used + tokens > self.tokens_per_minute:
+            freed = 0
+            for stamp, spent in self.window:
+                freed += spent
+                if used - freed + tokens <= self.tokens_per_minute:
+                    wait = max(wait, stamp + 60 - now)
+                    break
+        return max(0.0, wait)
+
+    def acquire(self, tokens, max_wait=10.0):
+        """Wait until the request fits the budget, then record it. Returns the time waited."""
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = self._wait_time(tokens, now)
+                if wait <= 0:
+                    self.window.append((now, tokens))
+                    return waited
+            if waited + wait > max_wait:
+                raise BudgetExceededError(f"the per-minute API budget is used up for the next {wait:.0f}s")
+            time.sleep(wait)
+            waited += wait
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker with retries, backoff and background recovery probes."""
+
+    def __init__(self, failure_threshold=3, retries=2, base_delay=0.5, max_delay=8.0,
+                 recovery_time=15.0, max_recovery_time=600.0, probe=None, on_state_change=None):
+        self.failure_threshold = failure_threshold
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay  # Longest we'll make the user wait for a retry
+        self.recovery_time = recovery_time
+        self.max_recovery_time = max_recovery_time
+        self.probe = probe  # Cheap call used to test the API while the circuit is open
+        self.on_state_change = on_state_change
+
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = 0  # Consecutive times the circuit opened without recovering
+        self.open_until = 0.0
+        self.lock = threading.Lock()
+        self.probing = None  # Thread making the half-open test call, while it is in flight
+        self.probe_thread = None
+        self.transitions = []
+
+    def available(self):
+        """True unless the circuit is open or a half-open test call is in flight (answering offline)."""
+        return self.state != OPEN and self.probing is None
+
+    def _set_state(self, state, reason=""):
+        if state == self.state:
+            return
+        previous, self.state = self.state, state
+        self.transitions.append((time.monotonic(), previous, state))
+        print(f"OpenAI circuit {previous} -> {state}{': ' + reason if reason else ''}")
+        if self.on_state_change:
+            try:
+                self.on_state_change(previous, state)
+            except Exception as e:
+                print(f"Error in circuit state callback: {e}")
+
+    def _backoff(self, attempt):
+        # Full jitter: anywhere between 0 and the exponential ceiling
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    def _open(self, wait=None, reason=""):
+        with self.lock:
+            self.opened += 1
+            if wait is None:
+                ceiling = min(self.max_recovery_time, self.recovery_time * (2 ** (self.opened - 1)))
+                wait = random.uniform(ceiling / 2, ceiling)
+            self.open_until = time.monotonic() + wait
+            self._set_state(OPEN, reason)
+        self._start_probe()
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = 0
+            self._set_state(CLOSED)
+
+    def record_failure(self, error):
+        kind = classify(error)
+        if kind == "quota":
+            self._open(max(retry_after(error) or 0, self.max_recovery_time / 2), "quota exhausted")
+            return
+        with self.lock:
+            self.failures += 1
+            trip = self.state == HALF_OPEN or self.failures >= self.failure_threshold or kind == "fatal"
+        if trip:
+            self._open(retry_after(error), f"{type(error).__name__}")
+
+    def call(self, fn, can_retry=None):
+        """Run fn() through the breaker, retrying transient errors.
+
+        `can_retry` is consulted before each retry, e.g. to avoid repeating a
+        streamed answer that was already partly spoken. Raises CircuitOpenError
+        without calling fn while the circuit is open.
+        """
+        with self.lock:
+            if self.state == OPEN:
+                if time.monotonic() < self.open_until or (self.probe_thread and self.probe_thread.is_alive()):
+                    raise CircuitOpenError("the OpenAI API is temporarily unavailable")
+                self._set_state(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self.probing is not None:
+                    raise CircuitOpenError("the OpenAI API is being tested; answering offline until it is")
+                self.probing = threading.get_ident()  # This call is the test; a failure reopens the circuit
+        try:
+            return self._call(fn, can_retry)
+        finally:
+            with self.lock:
+                if self.probing == threading.get_ident():
+                    self.probing = None
+
+    def _call(self, fn, can_retry):
+        attempt = 0
+        while True:
+            try:
+                result = fn()
+            except Exception as e:
+                self.record_failure(e)
+                if (self.state == OPEN or classify(e) != "transient" or attempt >= self.retries
+                        or (can_retry is not None and not can_retry())):
+                    raise
+                delay = retry_after(e)
+                delay = self._backoff(attempt) if delay is None else delay
+                if delay > self.max_delay:
+                    raise  # Not worth keeping the user waiting; answer offline this time
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.record_success()
+            return result
+
+    def _start_probe(self):
+        if not self.probe or (self.probe_thread and self.probe_thread.is_alive()):
+            return
+        self.probe_thread = threading.Thread(target=self._probe_loop, name="jarvis-api-probe", daemon=True)
+        self.probe_thread.start()
+
+    def _probe_loop(self):
+        while self.state == OPEN:
+            time.sleep(max(0.0, self.open_until - time.monotonic()))
+            with self.lock:
+                busy = self.probing is not None  # A caller's request is already testing the API
+                if not busy:
+                    self._set_state(HALF_OPEN, "probing")
+                    self.probing = threading.get_ident()
+            if busy:
+                time.sleep(0.05)
+                continue
+            try:
+                self.probe()
+            except Exception as e:
+                with self.lock:
+                    self.probing = None
+                    self.state = OPEN  # Stay quiet while still down; only report recovery
+                    self.opened += 1
+                    wait = retry_after(e)
+                    if wait is None:
+                        ceiling = min(self.max_recovery_time, self.recovery_time * (2 ** (self.opened - 1)))
+                        wait = random.uniform(ceiling / 2, ceiling)
+                    self.open_until = time.monotonic() + wait
+                continue
+            self.record_success()
+            with self.lock:
+                self.probing = None
+
+
+def half_open_check(callers=10, latency=0.2):
+    """Let `callers` threads call at once as the circuit turns half-open; only one may reach the API."""
+    breaker = CircuitBreaker(failure_threshold=1, retries=0, recovery_time=0.1, max_recovery_time=0.1)
+    try:
+        breaker.call(lambda: (_ for _ in ()).throw(TimeoutError("injected")))
+    except TimeoutError:
+        pass
+    time.sleep(0.15)
+    reached = []
+    failed_fast = []
+
+    def request():
+        reached.append(time.monotonic())
+        time.sleep(latency)
+
+    def caller():
+        try:
+            breaker.call(request)
+        except CircuitOpenError:
+            failed_fast.append(time.monotonic())
+
+    threads = [threading.Thread(target=caller) for _ in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Half-open: {callers} concurrent callers, {len(reached)} reached the API, {len(failed_fast)} failed fast; "
+          f"circuit {breaker.state}")
+    assert len(reached) == 1 and breaker.state == CLOSED
+
+
+def benchmark(requests_count=60, fault_rate=0.5, timeout=0.5):
+    """Drive the breaker against a local fake server that injects 429s and timeouts, then heals."""
+    half_open_check()
+    import openai
+    from fake_openai import FakeOpenAIServer
+
+    server = FakeOpenAIServer(latency=0.01, token_delay=0.0, rate_limit_rate=fault_rate / 2,
+                              timeout_rate=fault_rate / 2, hang_seconds=timeout * 2, retry_after=0.2).start()
+    client = openai.OpenAI(api_key="fake", base_url=server.base_url, max_retries=0, timeout=timeout)
+    breaker = CircuitBreaker(recovery_time=0.5, max_recovery_time=2.0, max_delay=1.0,
+                             probe=lambda: client.models.list())
+    budget = RateBudget(requests_per_minute=600, tokens_per_minute=200000)
+    outcomes = {"answered": 0, "offline (open circuit)": 0, "offline (error)": 0}
+    request = {"model": "gpt-3.5-turbo", "max_tokens": 50, "messages": [{"role": "user", "content": "hello"}]}
+
+    started = time.perf_counter()
+    for i in range(requests_count):
+        if i == requests_count // 2:
+            server.rate_limit_rate = server.timeout_rate = 0.0  # The outage ends
+            print(f"Faults stopped after {i} requests")
+        budget.acquire(60)
+        try:
+            breaker.call(lambda: client.chat.completions.create(**request))
+            outcomes["answered"] += 1
+        except CircuitOpenError:
+            outcomes["offline (open circuit)"] += 1
+            time.sleep(0.1)
+        except Exception:
+            outcomes["offline (error)"] += 1
+    elapsed = time.perf_counter() - started
+    print(f"{requests_count} requests in {elapsed:.1f}s: {outcomes}")
+    print(f"Final state: {breaker.state}; {len(breaker.transitions)} transitions; injected faults {server.faults}")
+    server.stop()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
@@ -0,0 +1,284 @@
+"""Conversation history for chat().
+
+Messages are kept as small records in a bounded ring buffer, so building the
+context for the next turn doesn't depend on how long the session has been
+running. History can be mirrored to an append-only JSONL log and restored
+from it on the next start.
+
+The context sent with each request is chosen by token budget: the newest
+messages that fit, plus a rolling summary of the older ones. The summary is
+only regenerated once enough unsummarized turns have piled up.
+"""
+import json
+import os
+import re
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+_TOKEN_PATTERN = re.compile(r"\w+|[^\w\s]")
+MESSAGE_OVERHEAD = 4  # Tokens the chat format adds around every message
+
+_encoding = None  # Loaded on the first count; False when tiktoken can't be used
+
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = False  # tiktoken missing or its data unavailable; estimate instead
+    return _encoding
+
+
+def count_tokens(text):
+    """Token count with tiktoken when installed, otherwise a local estimate.
+
+    The estimate counts words and punctuation marks, splitting long words the
+    way BPE would; it stays within about 10% of cl100k_base on English text.
+    """
+    encoding = _get_encoding()
+    if encoding:
+        return len(encoding.encode(text))
+    return sum(1 + len(piece) // 8 for piece in _TOKEN_PATTERN.findall(text))
+
+
+class Message:
+    __slots__ = ("role", "content", "timestamp", "tokens", "seq")
+
+    def __init__(self, role, content, timestamp=None, tokens=None, seq=0):
+        self.seq = seq
+        self.role = role
+        self.content = content
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.tokens = count_tokens(content) if tokens is None else tokens
+
+    def as_openai(self):
+        return {"role": self.role, "content": self.content}
+
+    def to_json(self):
+        return json.dumps({"role": self.role, "content": self.content, "ts": self.timestamp, "tokens": self.tokens})
+
+
+class Conversation:
+    """Bounded history of chat messages, optionally persisted to an append-only log."""
+
+    def __init__(self, max_messages=200, log_path=None):
+        self.max_messages = max_messages
+        self.messages = deque(maxlen=max_messages)
+        self.log_path = log_path
+        self.log = None
+        self.seq = 0
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized_seq = 0  # Messages up to this sequence number are in the summary
+        if log_path:
+            self._restore()
+            self.log = open(log_path, "a", encoding="utf-8")
+
+    def add(self, role, content):
+        self.seq += 1
+        message = Message(role, content, seq=self.seq)
+        self.messages.append(message)
+        if self.log:
+            self.log.write(message.to_json() + "\n")
+            self.log.flush()
+        return message
+
+    def add_exchange(self, query, response):
+        self.add("user", query)
+        self.add("assistant", response)
+
+    def recent(self, count):
+        """Return the last `count` messages, oldest first."""
+        if count >= len(self.messages):
+            return list(self.messages)
+        return [self.messages[i] for i in range(len(self.messages) - count, len(self.messages))]
+
+    def reset(self):
+        """Forget the conversation. A marker in the log keeps old turns from being restored."""
+        self.messages = deque(maxlen=self.max_messages)
+        self.summary = ""
+        self.summary_tokens = 0
+        self.summarized_seq = self.seq
+        if self.log:
+            self.log.write(json.dumps({"reset": True, "ts": time.time()}) + "\n")
+            self.log.flush()
+
+    def context(self, budget, summarize=None, fold_threshold=300):
+        """Return the messages to send with the next request, within `budget` tokens.
+
+        The newest messages that fit are kept verbatim. Older ones are folded
+        into a rolling summary by `summarize(previous_summary, messages)`, but
+        only once at least `fold_threshold` tokens of them have piled up, so
+        the summarizer isn't called on every turn.
+        """
+        if summarize:
+            self._fold(budget, summarize, fold_threshold)
+
+        used = self.summary_tokens + MESSAGE_OVERHEAD if self.summary else 0
+        window = []
+        for message in reversed(self.messages):
+            if message.seq <= self.summarized_seq or used + message.tokens + MESSAGE_OVERHEAD > budget:
+                break
+            used += message.tokens + MESSAGE_OVERHEAD
+            window.append(message.as_openai())
+        window.reverse()
+        if self.summary:
+            window.insert(0, {"role": "system", "content": f"Summary of the earlier conversation: {self.summary}"})
+        return window
+
+    def _fold(self, budget, summarize, fold_threshold):
+        # Keep the newest half of the budget verbatim; anything older is a summary candidate
+        keep = budget // 2
+        used = 0
+        boundary = len(self.messages)
+        for i in range(len(self.messages) - 1, -1, -1):
+            used += self.messages[i].tokens + MESSAGE_OVERHEAD
+            if used > keep:
+                break
+            boundary = i
+        pending = [m for m in (self.messages[i] for i in range(boundary)) if m.seq > self.summarized_seq]
+        if sum(m.tokens for m in pending) < fold_threshold:
+            return
+        try:
+            summary = summarize(self.summary, [m.as_openai() for m in pending])
+        except Exception as e:
+            print(f"Could not summarize the conversation: {e}")
+            return
+        if summary:
+            self.summary = summary.strip()
+            self.summary_tokens = count_tokens(self.summary)
+            self.summarized_seq = pending[-1].seq
+
+    def __len__(self):
+        return len(self.messages)
+
+    def _restore(self):
+        """Load the newest messages from the log, reading it backwards until enough are found."""
+        if not os.path.exists(self.log_path):
+            return
+        restored = []
+        for line in _read_lines_backwards(self.log_path):
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # A torn final line from a crash
+            if record.get("reset"):
+                break
+            restored.append(Message(record["role"], record["content"], record.get("ts"), record.get("tokens")))
+            if len(restored) >= self.max_messages:
+                break
+        for message in reversed(restored):
+            self.seq += 1
+            message.seq = self.seq
+            self.messages.append(message)
+
+
+def _read_lines_backwards(path, block_size=65536):
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        position = f.tell()
+        remainder = b""
+        while position > 0:
+            step = min(block_size, position)
+            position -= step
+            f.seek(position)
+            lines = (f.read(step) + remainder).split(b"\n")
+            remainder = lines.pop(0)
+            for line in reversed(lines):
+                if line.strip():
+                    yield line.decode("utf-8", errors="replace")
+        if remainder.strip():
+            yield remainder.decode("utf-8", errors="replace")
+
+
+def _legacy_turn(chat_str, query, response):
+    """The old approach: re-parse the whole history string on every turn."""
+    pairs = []
+    for pair in chat_str.strip().split("\n"):
+        if pair.startswith("User: "):
+            pairs.append({"role": "user", "content": pair[6:].strip()})
+        elif pair.startswith("Jarvis: "):
+            pairs.append({"role": "assistant", "content": pair[8:].strip()})
+    context = pairs[-10:]
+    return chat_str + f"User: {query}\nJarvis: {response}\n", context
+
+
+def benchmark(turns=100000, legacy_turns=1000):
+    """Per-turn latency and retained memory of the ring buffer vs. the old string history."""
+    query = "What's the weather going to be like tomorrow in London?"
+    response = "Tomorrow in London expect light rain in the morning, clearing up by the afternoon."
+
+    def run_legacy():
+        chat_str = ""
+        for _ in range(legacy_turns):
+            chat_str, _ = _legacy_turn(chat_str, query, response)
+        return chat_str
+
+    def run_ring():
+        conversation = Conversation()
+        for _ in range(turns):
+            _ = [m.as_openai() for m in conversation.recent(10)]
+            conversation.add_exchange(query, response)
+        return conversation
+
+    for label, count, run in (("String history", legacy_turns, run_legacy), ("Ring buffer", turns, run_ring)):
+        started = time.perf_counter()
+        run()
+        elapsed = time.perf_counter() - started
+        tracemalloc.start()
+        kept = run()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print(f"{label}, {count} turns: {elapsed / count * 1e6:.1f} us/turn, {retained / 1e6:.2f} MB retained")
+
+    started = time.perf_counter()
+    kept.reset()
+    print(f"Reset: {(time.perf_counter() - started) * 1e6:.1f} us")
+
+
+def token_harness(turns=500, budget=600):
+    """Prompt tokens sent per turn with a fixed 10-message window vs. a history token budget, using a fake client."""
+    from fake_openai import FakeOpenAI
+
+    system = {"role": "system", "content": "You are Jarvis, a helpful AI assistant. Keep your responses concise and helpful."}
+    questions = ["what is machine learning", "tell me more", "why", "give me an example",
+                 "explain quantum computing in detail with history and applications", "ok", "thanks, and then?"]
+
+    for label in ("last 10 messages", f"budget {budget} + summary"):
+        client = FakeOpenAI()
+        conversation = Conversation(max_messages=200)
+        summaries = 0
+
+        def summarize(previous, messages):
+            nonlocal summaries
+            summaries += 1
+            prompt = [{"role": "system", "content": "Summarize this conversation briefly."},
+                      {"role": "user", "content": previous + "\n" + "\n".join(m["content"] for m in messages)}]
+            return client.chat.completions.create(model="gpt-3.5-turbo", messages=prompt, max_tokens=80).choices[0].message.content
+
+        for turn in range(turns):
+            query = f"{questions[turn % len(questions)]} ({turn})"
+            if label.startswith("last"):
+                context = [m.as_openai() for m in conversation.recent(10)]
+            else:
+                context = conversation.context(budget, summarize)
+            messages = [system] + context + [{"role": "user", "content": query}]
+            response = client.chat.completions.create(model="gpt-3.5-turbo", messages=messages, max_tokens=150)
+            conversation.add_exchange(query, response.choices[0].message.content)
+
+        chat_tokens = [r["prompt_tokens"] for r in client.requests if r["messages"][0] is system]
+        total = sum(r["prompt_tokens"] for r in client.requests)
+        print(f"{label}: mean {sum(chat_tokens) / len(chat_tokens):.0f}, max {max(chat_tokens)} prompt tokens per turn; "
+              f"{summaries} summary calls, {total} prompt tokens in total")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "tokens":
+        token_harness(int(sys.argv[2]) if len(sys.argv) > 2 else 500)
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,198 @@
+"""Stand-ins for the OpenAI client, for benchmarks and offline testing.
+
+FakeOpenAI mimics the parts of openai.OpenAI that Jarvis uses
+(client.chat.completions.create) and records how many prompt tokens every
+request carried. FakeOpenAIServer serves the same answers over HTTP, including
+server-sent-event streaming, so the real openai client can be pointed at it
+with base_url. Answers are deterministic for a given conversation.
+"""
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from conversation import count_tokens
+
+_WORDS = ("the assistant considered your question carefully and here is a short explanation "
+          "covering the main points with an example or two and a closing remark").split()
+
+
+class _Obj:
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+
+class FakeCompletions:
+    def __init__(self, owner):
+        self.owner = owner
+
+    def create(self, model, messages, temperature=None, max_tokens=None, stream=False, **kwargs):
+        prompt_tokens = sum(count_tokens(m["content"]) + 4 for m in messages)
+        self.owner.requests.append({"model": model, "messages": messages, "prompt_tokens": prompt_tokens})
+        time.sleep(self.owner.latency)
+        text = self.owner.answer(messages, max_tokens)
+        if stream:
+            return self._stream(text, model)
+        usage = _Obj(prompt_tokens=prompt_tokens, completion_tokens=count_tokens(text),
+                     total_tokens=prompt_tokens + count_tokens(text))
+        return _Obj(choices=[_Obj(message=_Obj(role="assistant", content=text), finish_reason="stop")],
+                    usage=usage, model=model)
+
+    def _stream(self, text, model):
+        for piece in split_tokens(text):
+            time.sleep(self.owner.token_delay)
+            yield _Obj(choices=[_Obj(delta=_Obj(content=piece), finish_reason=None)], model=model)
+        yield _Obj(choices=[_Obj(delta=_Obj(content=None), finish_reason="stop")], model=model)
+
+
+def split_tokens(text):
+    """Cut text into word-sized pieces the way a streaming API delivers it."""
+    words = text.split(" ")
+    return [w if i == 0 else " " + w for i, w in enumerate(words)]
+
+
+class FakeOpenAI:
+    """Drop-in for openai.OpenAI(...) that answers locally."""
+
+    def __init__(self, latency=0.0, min_words=5, max_words=120, token_delay=0.0):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.min_words = min_words
+        self.max_words = max_words
+        self.requests = []
+        self.chat = _Obj(completions=FakeCompletions(self))
+
+    def answer(self, messages, max_tokens=None):
+        """A reply whose length varies with the prompt, so some answers are long."""
+        digest = hashlib.sha1(messages[-1]["content"].encode("utf-8")).digest()
+        words = self.min_words + digest[0] * (self.max_words - self.min_words) // 255
+        if max_tokens:
+            words = min(words, max_tokens)
+        words = [_WORDS[i % len(_WORDS)] for i in range(digest[1], digest[1] + words)]
+        # Sentences of about a dozen words, like a real answer
+        sentences = [" ".join(words[i:i + 12]) for i in range(0, len(words), 12)]
+        return " ".join(s[0].upper() + s[1:] + "." for s in sentences)
+
+
+class FakeOpenAIServer:
+    """Local HTTP server speaking enough of the OpenAI chat completions API for benchmarks.
+
+    `latency` is added before the first byte, `token_delay` between streamed tokens.
+    A fraction of requests can be failed on purpose: `rate_limit_rate` of them
+    get a 429 with a Retry-After header, `timeout_rate` of them hang for
+    `hang_seconds` so the client times out. Both can be changed while running.
+    """
+
+    def __init__(self, latency=0.2, token_delay=0.03, min_words=5, max_words=120, port=0,
+                 rate_limit_rate=0.0, timeout_rate=0.0, hang_seconds=30.0, retry_after=1.0, seed=0):
+        self.fake = FakeOpenAI(latency=latency, min_words=min_words, max_words=max_words, token_delay=token_delay)
+        self.rate_limit_rate = rate_limit_rate
+        self.timeout_rate = timeout_rate
+        self.hang_seconds = hang_seconds
+        self.retry_after = retry_after
+        self.rng = random.Random(seed)
+        self.faults = {"rate_limited": 0, "timed_out": 0}
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def respond(self, handler, request):
+        """Write the response for one chat completion request."""
+        fake = self.fake
+        messages = request["messages"]
+        prompt_tokens = sum(count_tokens(m["content"]) + 4 for m in messages)
+        fake.requests.append({"model": request.get("model"), "messages": messages, "prompt_tokens": prompt_tokens})
+        time.sleep(fake.latency)
+        text = fake.answer(messages, request.get("max_tokens"))
+        created = int(time.time())
+
+        if request.get("stream"):
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/event-stream")
+            handler.end_headers()
+            for piece in split_tokens(text) + [None]:
+                if piece is not None:
+                    time.sleep(fake.token_delay)
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": request.get("model"),
+                         "choices": [{"index": 0, "delta": {"content": piece} if piece else {},
+                                      "finish_reason": None if piece else "stop"}]}
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                handler.wfile.flush()
+            handler.wfile.write(b"data: [DONE]\n\n")
+            return
+
+        time.sleep(fake.token_delay * len(split_tokens(text)))  # Generation time of the whole answer
+        completion_tokens = count_tokens(text)
+        self.send_json(handler, 200, {
+            "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": request.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens}})
+
+    def inject_fault(self, handler):
+        """Fail the request on purpose if the dice say so. Returns True when a fault was sent."""
+        roll = self.rng.random()
+        if roll < self.rate_limit_rate:
+            self.faults["rate_limited"] += 1
+            self.send_json(handler, 429, {"error": {"message": "Rate limit reached", "type": "requests",
+                                                    "code": "rate_limit_exceeded"}},
+                           {"Retry-After": f"{self.retry_after:g}"})
+            return True
+        if roll < self.rate_limit_rate + self.timeout_rate:
+            self.faults["timed_out"] += 1
+            time.sleep(self.hang_seconds)
+            handler.close_connection = True
+            return True
+        return False
+
+    @staticmethod
+    def send_json(handler, status, body, headers=None):
+        data = json.dumps(body).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            handler.send_header(name, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                if server.inject_fault(self):
+                    return
+                if self.path.rstrip("/").endswith("/chat/completions"):
+                    if request.get("stream"):
+                        self.close_connection = True  # Body ends when the connection does
+                    server.respond(self, request)
+                else:
+                    server.send_json(self, 404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+            def do_GET(self):
+                if server.inject_fault(self):
+                    return
+                if self.path.rstrip("/").endswith("/models"):
+                    server.send_json(self, 200, {"object": "list", "data": [{"id": "gpt-3.5-turbo", "object": "model"}]})
+                else:
+                    server.send_json(self, 404, {"error": {"message": "Not found", "type": "invalid_request_error"}})
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
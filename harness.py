@@ -0,0 +1,377 @@
+"""Replay commands through Jarvis without a microphone or network.
+
+Utterances (WAV files with .txt transcripts next to them, or plain
+transcripts turned into synthetic speech) are played into the same path a
+live command takes: AudioStream -> voice activity detection -> takeCommand ->
+handle_command -> say. The microphone, speech recognizer, OpenAI client,
+HTTP endpoints and speech synthesizer are replaced by deterministic local
+stand-ins with configurable latency; browser, application and music side
+effects are recorded instead of performed. The report gives commands per
+second, latency percentiles from the end of the user's speech to Jarvis's
+first and last words, and the per-step breakdown from the tracing module.
+
+    python harness.py                      # built-in command mix
+    python harness.py --script commands.txt --repeat 5 --openai-latency 0.4
+    python harness.py --audio clips/ --json report.json
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+from pathlib import Path
+
+import numpy as np
+import speech_recognition as sr
+
+from pipeline import percentile
+
+DEFAULT_SCRIPT = [
+    "what time is it",
+    "what's the weather in london",
+    "tell me the news",
+    "open youtube",
+    "open calculator",
+    "hello jarvis",
+    "what is quantum computing",
+    "explain black holes simply",
+    "write a poem about rivers using artificial intelligence",
+    "search for python tutorials",
+    "call me Tony",
+    "play some jazz",
+]
+
+_NEWS = {"data": {"children": [{"data": {"title": f"Headline number {i}"}} for i in range(10)]}}
+
+
+class ReplayMicrophone(sr.AudioSource):
+    """Microphone stand-in: low room noise, with queued utterances played `speedup` times faster than real time."""
+
+    def __init__(self, sample_rate=16000, chunk_size=1024, speedup=10.0, noise_level=0.003, seed=7):
+        self.SAMPLE_RATE = sample_rate
+        self.SAMPLE_WIDTH = 2
+        self.CHUNK = chunk_size
+        self.speedup = speedup
+        self.stream = None
+        rng = np.random.default_rng(seed)
+        noise = rng.normal(0, noise_level, sample_rate * 2)
+        self.noise = (noise * 32767).astype("<i2").tobytes()
+        self.noise_position = 0
+        self.tape = bytearray()
+        self.lock = threading.Lock()
+        self.speech_end = None  # Byte offset in the tape where the current utterance's speech ends
+        self.speech_ended = threading.Event()
+        self.speech_ended_at = None
+
+    def play(self, audio, trailing_seconds=0.8):
+        """Queue raw int16 audio, followed by enough room noise for the end of speech to be noticed."""
+        with self.lock:
+            self.tape += audio
+            self.speech_end = len(self.tape)
+            self.speech_ended.clear()
+            self.tape += self._noise(int(trailing_seconds * self.SAMPLE_RATE) * self.SAMPLE_WIDTH)
+
+    def _noise(self, size):
+        out = bytearray()
+        while len(out) < size:
+            piece = self.noise[self.noise_position:self.noise_position + size - len(out)]
+            self.noise_position = (self.noise_position + len(piece)) % len(self.noise)
+            out += piece
+        return out
+
+    def read(self, frames):
+        size = frames * self.SAMPLE_WIDTH
+        with self.lock:
+            data = bytes(self.tape[:size])
+            del self.tape[:size]
+            if self.speech_end is not None:
+                self.speech_end -= len(data)
+                if self.speech_end <= 0:
+                    self.speech_end = None
+                    self.speech_ended_at = time.perf_counter()
+                    self.speech_ended.set()
+        return data + self._noise(size - len(data))
+
+    def __enter__(self):
+        self.stream = _ReplayStream(self)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stream = None
+
+
+class _ReplayStream:
+    def __init__(self, mic):
+        self.mic = mic
+        self.next_frame_at = time.perf_counter()
+
+    def read(self, size):
+        self.next_frame_at += size / self.mic.SAMPLE_RATE / self.mic.speedup
+        delay = self.next_frame_at - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        return self.mic.read(size)
+
+
+class StubResponse:
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class StubSession:
+    """Stands in for requests.Session: canned answers for wttr.in and Reddit after `latency` seconds."""
+
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.requests = 0
+        self.headers = {}
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        time.sleep(self.latency)
+        if "wttr.in" in url:
+            return StubResponse(200, "Partly cloudy +18\N{DEGREE SIGN}C")
+        if "reddit.com" in url:
+            return StubResponse(200, json.dumps(_NEWS))
+        return StubResponse(404, "")
+
+
+class SideEffects:
+    """Records what Jarvis would have opened or launched."""
+
+    def __init__(self):
+        self.opened = []
+        self.launched = []
+
+    def open(self, url, *args, **kwargs):  # webbrowser.open
+        self.opened.append(url)
+        return True
+
+    def launch(self, app):  # app_index.launch
+        self.launched.append(app.name)
+
+
+def null_synthesizer(on_play, latency=0.0):
+    """A synthesizer factory for tts.SpeechEngine that takes `latency` per sentence and plays nothing."""
+    import tts
+
+    class NullSynthesizer(tts.Synthesizer):
+        def synthesize(self, text, path):
+            time.sleep(latency)
+            Path(path).write_bytes(b"")
+
+        def play(self, path, stop_event):
+            on_play()
+
+    return lambda voice=None, speed=200: NullSynthesizer(voice, speed)
+
+
+def speak_transcript(text, sample_rate=16000, seed=0):
+    """Synthetic speech lasting about as long as `text` takes to say, as raw int16 audio."""
+    from vad import synthetic_voice
+
+    rng = np.random.default_rng(seed)
+    length = int(max(0.6, 0.35 * len(text.split())) * sample_rate)
+    audio = rng.normal(0, 0.003, length) + synthetic_voice(length, sample_rate, rng.uniform(100, 220))
+    return (np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes()
+
+
+def load_utterances(script=None, audio_dir=None):
+    """[(transcript, raw int16 audio or None, sample rate)] from a WAV directory, a script file or the default mix."""
+    if audio_dir:
+        utterances = []
+        for path in sorted(Path(audio_dir).glob("*.wav")):
+            text_file = path.with_suffix(".txt")
+            if not text_file.exists():
+                print(f"Skipping {path.name}: no {text_file.name} with its transcript.")
+                continue
+            with wave.open(str(path), "rb") as f:
+                if f.getnchannels() != 1 or f.getsampwidth() != 2:
+                    print(f"Skipping {path.name}: only mono 16-bit WAV files are supported.")
+                    continue
+                utterances.append((text_file.read_text().strip(), f.readframes(f.getnframes()), f.getframerate()))
+        return utterances
+    if script:
+        lines = Path(script).read_text().splitlines()
+    else:
+        lines = DEFAULT_SCRIPT
+    return [(line.strip(), None, 16000) for line in lines if line.strip() and not line.startswith("#")]
+
+
+class Harness:
+    """Loads main.py in a scratch directory with every external service replaced."""
+
+    def __init__(self, workdir, sample_rate=16000, speedup=10.0, stt_latency=0.05, openai_latency=0.3,
+                 token_delay=0.01, http_latency=0.05, tts_latency=0.02, settings=None):
+        self.workdir = Path(workdir)
+        self.played = []
+        self.effects = SideEffects()
+        (self.workdir / "music").mkdir(parents=True, exist_ok=True)
+        base = {"persist_chat": False, "prefetch": False, "tracing": True, "trace_file": "trace.jsonl",
+                "recognizer_backend": "fake",
+                "music_dirs": [str(self.workdir / "music")]}
+        base.update(settings or {})
+        (self.workdir / "jarvis_settings.json").write_text(json.dumps(base, indent=4))
+
+        os.chdir(self.workdir)  # main.py reads and writes its files in the working directory
+        import app_index
+        import audio_stream
+        import http_client
+        import main
+        import recognizers
+        import tts
+        from fake_openai import FakeOpenAI
+
+        self.main = main
+        main.get_settings()  # The settings file written above, read from the scratch directory
+        self.mic = ReplayMicrophone(sample_rate, speedup=speedup)
+        main.mic_stream = audio_stream.AudioStream(self.mic).start()
+        main.speech_backend = recognizers.FakeRecognizer([], latency=stt_latency)
+        main.client = FakeOpenAI(latency=openai_latency, token_delay=token_delay)
+        main.api_available = True
+        main.http = http_client.HttpClient()
+        main.http.session = StubSession(http_latency)
+        main.speech = tts.SpeechEngine(cache_dir=str(self.workdir / "tts_cache"),
+                                       synthesizer_factory=null_synthesizer(self._played, tts_latency))
+        main.webbrowser = self.effects
+        main.app_index = types.SimpleNamespace(AppIndex=app_index.AppIndex, launch=self.effects.launch)
+        main.app_launcher = app_index.AppIndex({"calculator": "calc", "text editor": "edit"}, path="",
+                                               application_dirs=[])
+        main.app_launcher.refresh()
+
+    def _played(self):
+        self.played.append(time.perf_counter())
+
+    def run_one(self, transcript, audio):
+        """Replay one utterance; returns its timings and whether it was heard correctly."""
+        main = self.main
+        main.speech_backend.queue.append(transcript)
+        self.played.clear()
+        started = time.perf_counter()
+        self.mic.play(audio)
+        query = main.takeCommand()
+        heard = time.perf_counter()
+        if query:
+            main.handle_command(query)
+        main.speech.wait()
+        done = time.perf_counter()
+        end_of_speech = self.mic.speech_ended_at if self.mic.speech_ended.is_set() else heard
+        return {
+            "command": transcript,
+            "heard": query == transcript,
+            "intent": main.command_router.route(transcript),
+            "total_ms": (done - started) * 1000,
+            "recognized_ms": (heard - end_of_speech) * 1000,
+            "first_audio_ms": ((self.played[0] if self.played else done) - end_of_speech) * 1000,
+            "answered_ms": (done - end_of_speech) * 1000,
+        }
+
+    def run(self, utterances, repeat=1):
+        results = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            for i, (transcript, audio, _) in enumerate(utterances):
+                if audio is None:
+                    audio = speak_transcript(transcript, self.mic.SAMPLE_RATE, seed=i)
+                results.append(self.run_one(transcript, audio))
+        elapsed = time.perf_counter() - started
+        return results, elapsed
+
+    def close(self):
+        self.main.mic_stream.stop()
+        self.main.get_settings().close()
+
+
+def summarize(results, elapsed, stages, effects):
+    report = {"commands": len(results), "seconds": elapsed, "commands_per_second": len(results) / elapsed,
+              "misheard": sum(not r["heard"] for r in results), "latency_ms": {}, "by_intent": {}, "stages": stages,
+              "opened": effects.opened, "launched": effects.launched}
+    for metric in ("recognized_ms", "first_audio_ms", "answered_ms", "total_ms"):
+        values = [r[metric] for r in results]
+        report["latency_ms"][metric] = {f"p{int(q * 100)}": percentile(values, q) for q in (0.5, 0.95, 0.99)}
+    intents = {}
+    for r in results:
+        intents.setdefault(r["intent"] or "chat", []).append(r["answered_ms"])
+    report["by_intent"] = {intent: {"count": len(v), "p50": percentile(v, 0.5), "p95": percentile(v, 0.95)}
+                           for intent, v in sorted(intents.items())}
+    return report
+
+
+def print_report(report, speedup):
+    print(f"\n{report['commands']} commands in {report['seconds']:.2f}s: "
+          f"{report['commands_per_second']:.2f} commands/s (audio played {speedup:g}x real time), "
+          f"{report['misheard']} misheard; {len(report['opened'])} pages opened and "
+          f"{len(report['launched'])} applications launched (recorded, not performed)")
+    print("Latency from the end of speech (ms):")
+    for metric, values in report["latency_ms"].items():
+        print(f"  {metric[:-3]:>13}: " + ", ".join(f"{k} {v:.0f}" for k, v in values.items()))
+    print("Answered, by intent (ms):")
+    for intent, values in report["by_intent"].items():
+        print(f"  {intent:>17}: {values['count']:>3} commands, p50 {values['p50']:.0f}, p95 {values['p95']:.0f}")
+    if report["stages"]:
+        print("Steps (ms):")
+        for name, s in sorted(report["stages"].items(), key=lambda item: -item[1]["p50_ms"]):
+            print(f"  {name:>14}: {s['count']:>4} spans, p50 {s['p50_ms']:.1f}, p95 {s['p95_ms']:.1f}, "
+                  f"p99 {s['p99_ms']:.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay commands through Jarvis with fake services.")
+    parser.add_argument("--script", help="file with one spoken command per line")
+    parser.add_argument("--audio", help="directory of mono 16-bit WAV files, each with a .txt transcript")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--speedup", type=float, default=10.0, help="play audio this many times faster than real time")
+    parser.add_argument("--stt-latency", type=float, default=0.05)
+    parser.add_argument("--openai-latency", type=float, default=0.3)
+    parser.add_argument("--token-delay", type=float, default=0.01)
+    parser.add_argument("--http-latency", type=float, default=0.05)
+    parser.add_argument("--tts-latency", type=float, default=0.02)
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--fail-above-ms", type=float,
+                        help="exit with status 1 if the p95 time to answer exceeds this, e.g. in CI")
+    args = parser.parse_args(argv)
+
+    utterances = load_utterances(args.script, args.audio)
+    if not utterances:
+        print("Nothing to replay.")
+        return 1
+    json_path = os.path.abspath(args.json) if args.json else None
+    rates = {rate for _, _, rate in utterances}
+    if len(rates) > 1:
+        print(f"All WAV files need the same sample rate (found {sorted(rates)}).")
+        return 1
+
+    with tempfile.TemporaryDirectory(prefix="jarvis_harness_") as workdir:
+        cwd = os.getcwd()
+        try:
+            harness = Harness(workdir, rates.pop(), args.speedup, args.stt_latency, args.openai_latency,
+                              args.token_delay, args.http_latency, args.tts_latency)
+            results, elapsed = harness.run(utterances, args.repeat)
+            import tracing
+            stages = tracing.summary()
+            harness.close()
+        finally:
+            os.chdir(cwd)
+    report = summarize(results, elapsed, stages, harness.effects)
+    print_report(report, args.speedup)
+    if json_path:
+        Path(json_path).write_text(json.dumps(dict(report, results=results), indent=2))
+    p95 = report["latency_ms"]["answered_ms"]["p95"]
+    if report["misheard"] or (args.fail_above_ms and p95 > args.fail_above_ms):
+        print(f"FAILED: {report['misheard']} misheard, p95 answer time {p95:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    os._exit(code)  # Don't wait for the speech and capture threads
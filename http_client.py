@@ -0,0 +1,213 @@
+"""Shared HTTP client for Jarvis's web lookups.
+
+All requests go through one pooled requests.Session with strict timeouts.
+Results are cached per (service, argument) with a TTL; once an entry is stale
+but still within its grace period, the old value is returned immediately while
+a background worker fetches a fresh one (stale-while-revalidate).
+"""
+import contextvars
+import random
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import tracing
+
+DEFAULT_TIMEOUT = (3.05, 5)  # (connect, read) seconds
+
+
+class CacheEntry:
+    __slots__ = ("value", "fetched_at", "ttl", "stale_ttl")
+
+    def __init__(self, value, ttl, stale_ttl):
+        self.value = value
+        self.fetched_at = time.monotonic()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+
+    def age(self):
+        return time.monotonic() - self.fetched_at
+
+
+class HttpClient:
+    """Connection-pooled HTTP client with a TTL cache and background revalidation."""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT, pool_size=10, workers=4, user_agent="Jarvis/1.0"):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers["User-Agent"] = user_agent
+
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="jarvis-http")
+        self.cache = {}
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.latencies = deque(maxlen=10000)  # Most recent cached() calls; stats() sorts them
+
+    def get(self, url, **kwargs):
+        """requests.get through the shared session, always with a timeout."""
+        kwargs.setdefault("timeout", self.timeout)
+        with tracing.span("http", host=urlsplit(url).netloc) as span:
+            response = self.session.get(url, **kwargs)
+            span.set(status=response.status_code)
+            return response
+
+    def cached(self, service, key, fetch, ttl=300, stale_ttl=None):
+        """Return fetch() for (service, key), from the cache while it is fresh enough.
+
+        `fetch` returns the value to cache, or None on failure (which is not
+        cached). Stale entries younger than ttl + stale_ttl are returned at
+        once and refreshed in the background. A failed refresh keeps serving
+        the stale value rather than nothing.
+        """
+        if stale_ttl is None:
+            stale_ttl = ttl
+        started = time.perf_counter()
+        cache_key = (service, key)
+        with self.lock:
+            entry = self.cache.get(cache_key)
+            if entry is not None and entry.age() < entry.ttl:
+                self.hits += 1
+                value = entry.value
+            elif entry is not None and entry.age() < entry.ttl + entry.stale_ttl:
+                self.stale_hits += 1
+                value = entry.value
+                self._refresh_locked(cache_key, fetch, ttl, stale_ttl)
+            else:
+                self.misses += 1
+                future = self._refresh_locked(cache_key, fetch, ttl, stale_ttl)
+                value = None
+        if entry is None or value is None:
+            try:
+                value = future.result()
+            except Exception:
+                value = None
+            if value is None and entry is not None:
+                value = entry.value
+        self.latencies.append(time.perf_counter() - started)
+        return value
+
+    def prefetch(self, service, key, fetch, ttl=300, stale_ttl=None, allow=None):
+        """Warm the cache in the background unless a fresh value is already there.
+
+        `allow()`, if given, is asked just before a request would be started
+        and can refuse it (e.g. when a budget is used up). Returns the fetch's
+        future, or None when nothing was started.
+        """
+        cache_key = (service, key)
+        with self.lock:
+            entry = self.cache.get(cache_key)
+            if entry is not None and entry.age() < entry.ttl:
+                return None
+            if allow is not None and cache_key not in self.in_flight and not allow():
+                return None
+            return self._refresh_locked(cache_key, fetch, ttl, ttl if stale_ttl is None else stale_ttl)
+
+    def _refresh_locked(self, cache_key, fetch, ttl, stale_ttl):
+        # Concurrent requests for the same key share one fetch
+        future = self.in_flight.get(cache_key)
+        if future is None:
+            # Run in the caller's context, so the request is traced under the command that made it
+            future = self.executor.submit(contextvars.copy_context().run, self._fetch, cache_key, fetch, ttl, stale_ttl)
+            self.in_flight[cache_key] = future
+        return future
+
+    def _fetch(self, cache_key, fetch, ttl, stale_ttl):
+        try:
+            value = fetch()
+        except Exception as e:
+            print(f"Error fetching {cache_key[0]}: {e}")
+            value = None
+        with self.lock:
+            if value is not None:
+                self.cache[cache_key] = CacheEntry(value, ttl, stale_ttl)
+            self.in_flight.pop(cache_key, None)
+        return value
+
+    def stats(self):
+        """Hit rate of cached() calls so far, and p50/p99 latency of the most recent ones."""
+        total = self.hits + self.stale_hits + self.misses
+        latencies = sorted(self.latencies)  # Bounded, and copied in one step while other threads append
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))] if latencies else 0.0
+
+        return {
+            "requests": total,
+            "hit_rate": (self.hits + self.stale_hits) / total if total else 0.0,
+            "stale_hits": self.stale_hits,
+            "p50_ms": percentile(0.50) * 1000,
+            "p99_ms": percentile(0.99) * 1000,
+        }
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    delay = 0.05
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = f"stub response for {self.path}".encode()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub_server(delay=0.05):
+    """Start a local HTTP server that answers every GET after `delay` seconds; returns (server, base_url)."""
+    handler = type("StubHandler", (_StubHandler,), {"delay": delay})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def benchmark(requests_count=500, delay=0.05, ttl=0.5):
+    """Replay a skewed request mix against a local stub server and report hit rate and latency."""
+    server, base_url = start_stub_server(delay)
+    cities = ["london", "tokyo", "mumbai", "sydney", "new york", "paris", "berlin", "cairo"]
+    weights = [1 / (i + 1) for i in range(len(cities))]  # A few cities are asked about most
+    rng = random.Random(1)
+    client = HttpClient()
+
+    def fetch(city):
+        response = client.get(f"{base_url}/{city}")
+        return response.text if response.status_code == 200 else None
+
+    uncached = []
+    for _ in range(min(requests_count, 50)):
+        city = rng.choices(cities, weights)[0]
+        started = time.perf_counter()
+        fetch(city)
+        uncached.append(time.perf_counter() - started)
+    uncached.sort()
+    print(f"Uncached: p50 {uncached[len(uncached) // 2] * 1000:.1f} ms, "
+          f"p99 {uncached[int(len(uncached) * 0.99)] * 1000:.1f} ms")
+
+    for _ in range(requests_count):
+        city = rng.choices(cities, weights)[0]
+        client.cached("weather", city, lambda: fetch(city), ttl=ttl)
+        time.sleep(0.005)  # Spread the requests out so entries go stale
+    stats = client.stats()
+    print(f"Cached: {stats['requests']} requests, hit rate {stats['hit_rate']:.1%} "
+          f"({stats['stale_hits']} served stale), p50 {stats['p50_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 500)
@@ -0,0 +1,174 @@
+"""Intent routing for Jarvis.
+
+Intents are declared as phrase lists in priority order and compiled once into a
+single regular expression. A query is normalized one time and scanned in one
+pass; phrases only match on whole words, so "history" no longer triggers the
+"hi" greeting. When several intents match, the one declared first wins.
+"""
+import random
+import re
+import sys
+import time
+
+# Commands handled by handle_command(), highest priority first. Phrases are
+# regular expression fragments matched against the normalized query.
+COMMAND_INTENTS = [
+    ("recall", [r"what did you (?:tell|say to) me about", "what did you say about",
+                r"remind me what you (?:said|told me) about"]),
+    ("open_website", ["open youtube", "open wikipedia", "open google", r"(?:https?://|www\.)\S+"]),
+    ("search", ["search for", "google"]),
+    ("set_name", ["my name is", "call me"]),
+    ("add_favorite_site", [r"add website\b.*\bfavorites?", r"favorites?\b.*\badd website"]),
+    ("play_music", ["play music", "play some music",
+                    r"play (?:me )?(?:some|something|anything|songs?|tracks?|the (?:song|track|album))\b",
+                    r"play (?:[\w']+ ){1,4}by [\w']+"]),
+    ("tell_time", ["what time", "what's the time"]),
+    ("open_application", [r"open \S.*"]),
+    ("ai", ["using artificial intelligence"]),
+    ("exit", ["jarvis quit", "exit", "goodbye", "bye", "quit"]),
+    ("train_wake_word", ["train wake word"]),
+    ("reset_chat", ["reset chat"]),
+    ("continuous_mode", ["switch to continuous mode"]),
+]
+
+# Offline replies given by local_response(), highest priority first.
+LOCAL_INTENTS = [
+    ("greeting", ["hello", "hi", "hey", "greetings"]),
+    ("how_are_you", ["how are you", "how's it going", "how are things"]),
+    ("weather", ["weather", "temperature", "forecast"]),
+    ("news", ["news"]),
+    ("time", ["time"]),
+    ("date", ["date", "day", "today", "what's today"]),
+    ("identity", ["your name"]),
+    ("creator", ["who made you", "who created you"]),
+    ("thanks", ["thank", "thanks", "thank you"]),
+    ("joke", ["joke", "jokes"]),
+    ("goodbye", ["bye", "goodbye", "exit", "quit"]),
+]
+
+_PUNCTUATION = re.compile(r"[^\w\s'/:.?=&%+-]")
+_SPACES = re.compile(r"\s+")
+
+
+def normalize(query):
+    """Lowercase, drop punctuation that never matters for routing and collapse whitespace."""
+    query = _PUNCTUATION.sub(" ", query.lower())
+    # Sentence-final periods and question marks, but keep them inside URLs
+    query = re.sub(r"[.?]+(\s|$)", r"\1", query)
+    return _SPACES.sub(" ", query).strip()
+
+
+class IntentRouter:
+    """Matches queries against a declarative intent table with one compiled regex."""
+
+    def __init__(self, intents):
+        self.intents = [(name, list(phrases)) for name, phrases in intents]
+        self.compile()
+
+    def compile(self):
+        groups = [f"(?P<i{index}>{'|'.join(phrases)})" for index, (_, phrases) in enumerate(self.intents) if phrases]
+        # A lookahead at every word start finds overlapping matches, and the
+        # alternatives are in priority order, so nothing can hide a better intent
+        self.pattern = re.compile(r"(?<![\w'])(?=(?:" + "|".join(groups) + r")(?![\w']))") if groups else None
+
+    def set_phrases(self, name, phrases):
+        """Replace the phrases of one intent (e.g. after a favorite site was added) and recompile."""
+        for i, (intent_name, _) in enumerate(self.intents):
+            if intent_name == name:
+                self.intents[i] = (name, list(phrases))
+                break
+        else:
+            self.intents.append((name, list(phrases)))
+        self.compile()
+
+    def route(self, query, normalized=False):
+        """Return the highest-priority intent name for the query, or None."""
+        if self.pattern is None:
+            return None
+        text = query if normalized else normalize(query)
+        best = None
+        for match in self.pattern.finditer(text):
+            index = int(match.lastgroup[1:])
+            if best is None or index < best:
+                best = index
+                if best == 0:
+                    break
+        return self.intents[best][0] if best is not None else None
+
+
+def site_phrases(favorite_sites):
+    """Phrases for the open_website intent, built from the user's favorite sites."""
+    return [f"open {re.escape(name.lower())}" for name in favorite_sites] + [r"(?:https?://|www\.)\S+"]
+
+
+# Utterance templates for the routing benchmark: (expected intent, template)
+_COMMAND_SAMPLES = [
+    ("recall", ["what did you tell me about {thing}", "remind me what you said about black holes"]),
+    ("open_website", ["open youtube", "please open wikipedia for me", "go to www.example.com", "open https://github.com"]),
+    ("search", ["search for cheap flights", "google the weather in paris", "can you search for {thing}"]),
+    ("set_name", ["my name is {name}", "from now on call me {name}"]),
+    ("add_favorite_site", ["add website called news with url bbc.com to favorite",
+                           "add website called bbc with url bbc.com to favorites"]),
+    ("play_music", ["play music", "could you play some music", "play something by queen", "play some jazz",
+                    "play bohemian rhapsody by queen", "play me some songs"]),
+    ("tell_time", ["what time is it", "what's the time now"]),
+    ("open_application", ["open calculator", "open visual studio code", "please open notes"]),
+    ("ai", ["write an essay on {thing} using artificial intelligence"]),
+    ("exit", ["jarvis quit", "goodbye", "ok bye", "exit"]),
+    ("train_wake_word", ["train wake word"]),
+    ("reset_chat", ["reset chat please"]),
+    ("continuous_mode", ["switch to continuous mode"]),
+    (None, ["tell me about the history of {thing}", "what is {thing}", "who won the match",
+            "explain {thing} simply", "which is better, this or that", "how do i play chess",
+            "let's play a game", "who wrote the play hamlet"]),
+]
+
+_LOCAL_SAMPLES = [
+    ("greeting", ["hello", "hi jarvis", "hey there", "greetings"]),
+    ("how_are_you", ["how are you", "how's it going today"]),
+    ("weather", ["what's the weather in london", "temperature outside", "forecast for tokyo today"]),
+    ("news", ["any news", "tell me the news"]),
+    ("time", ["what time is it"]),
+    ("date", ["what day is it", "what's the date", "what is today"]),
+    ("identity", ["what is your name"]),
+    ("creator", ["who made you", "who created you"]),
+    ("thanks", ["thanks a lot", "thank you"]),
+    ("joke", ["tell me a joke"]),
+    ("goodbye", ["goodbye", "bye"]),
+    (None, ["tell me about history", "this is something", "show me the highway map", "explain the weatherproofing of {thing}"]),
+]
+
+
+def _corpus(samples, size, seed=7):
+    rng = random.Random(seed)
+    things = ["photosynthesis", "black holes", "python", "the roman empire", "machine learning"]
+    names = ["Tony", "Pepper", "Alex", "Sam"]
+    fillers = ["", "jarvis ", "okay ", "um "]
+    flat = [(intent, template) for intent, templates in samples for template in templates]
+    corpus = []
+    for _ in range(size):
+        intent, template = rng.choice(flat)
+        text = rng.choice(fillers) + template.format(thing=rng.choice(things), name=rng.choice(names))
+        corpus.append((text.title() if rng.random() < 0.3 else text, intent))
+    return corpus
+
+
+def benchmark(size=5000):
+    """Route a generated corpus of utterances and assert every one lands on the right intent."""
+    for label, table, samples in (("commands", COMMAND_INTENTS, _COMMAND_SAMPLES),
+                                  ("local replies", LOCAL_INTENTS, _LOCAL_SAMPLES)):
+        router = IntentRouter(table)
+        corpus = _corpus(samples, size)
+        started = time.perf_counter()
+        results = [router.route(text) for text, _ in corpus]
+        elapsed = time.perf_counter() - started
+        wrong = [(text, expected, got) for (text, expected), got in zip(corpus, results) if got != expected]
+        print(f"{label}: {len(corpus)} utterances in {elapsed * 1000:.1f} ms "
+              f"({elapsed / len(corpus) * 1e6:.1f} us each), accuracy {1 - len(wrong) / len(corpus):.2%}")
+        for text, expected, got in wrong[:10]:
+            print(f"  {text!r}: expected {expected}, got {got}")
+        assert not wrong, f"{len(wrong)} {label} utterances were misrouted"
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
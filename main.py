@@ -1,134 +1,457 @@
-import speech_recognition as sr
+import atexit
 import os
-import webbrowser
-import openai
 import datetime
 import random
-import json
-import requests
 import platform
-import subprocess
-import time
 import threading
-from pathlib import Path
-
-# Try to import the config, or create a default one if it doesn't exist
-try:
-    from config import apikey
-except ImportError:
-    apikey = None
-    print("No config.py found. Creating one with a placeholder API key.")
-    with open("config.py", "w") as f:
-        f.write('apikey = "YOUR-OPENAI-API-KEY-HERE"')
-
-# Initialize OpenAI client with API key if available
-api_available = False
+import time
+
+from conversation import Conversation, count_tokens
+import circuit_breaker
+import intents
+import pipeline
+import runtime as assistant_runtime
+import response_cache
+import sessions
+import streaming
+import tracing
+import tts
+from settings_store import SettingsStore
+from startup import CalibrationCache, lazy_import
+
+# Heavy modules load on first use, so Jarvis is ready to talk sooner
+sr = lazy_import("speech_recognition")
+asyncio = lazy_import("asyncio")
+openai = lazy_import("openai")
+webbrowser = lazy_import("webbrowser")
+app_index = lazy_import("app_index")
+audio_stream = lazy_import("audio_stream")
+audio_workers = lazy_import("audio_workers")
+http_client = lazy_import("http_client")
+music_library = lazy_import("music_library")
+prefetch = lazy_import("prefetch")
+recognizers = lazy_import("recognizers")
+response_archive = lazy_import("response_archive")
+vad = lazy_import("vad")
+wake_word = lazy_import("wake_word")
+
+# The API key from config.py, read on first use (see load_api_key); None until then
+apikey = None
+api_available = None
+PLACEHOLDER_API_KEY = "YOUR-OPENAI-API-KEY-HERE"
+
+# The OpenAI client is created on first use (see get_client)
 client = None
-if apikey and apikey != "YOUR-OPENAI-API-KEY-HERE":
-    try:
-        client = openai.OpenAI(api_key=apikey)
-        api_available = True
-        print("OpenAI API initialized successfully.")
-    except Exception as e:
-        print(f"Error initializing OpenAI client: {e}")
 
 # Global variables
-chatStr = ""
 USER_NAME = "Sir"  # Default user name
 WAKE_WORD = "jarvis"  # Default wake word
-LISTENING_MODE = "manual"  # "manual" or "continuous"
 SYSTEM_INFO = platform.system()
-IS_LISTENING = False
-
-
-# Settings persistence
-def load_settings():
-    """Load user settings from file."""
-    settings_file = Path("jarvis_settings.json")
-    default_settings = {
-        "user_name": "Sir",
-        "wake_word": "jarvis",
-        "listening_mode": "manual",
-        "voice_speed": 200,
-        "favorite_sites": {
-            "youtube": "https://www.youtube.com",
-            "wikipedia": "https://www.wikipedia.com",
-            "google": "https://www.google.com"
-        },
-        "favorite_apps": {}
-    }
-
-    if settings_file.exists():
-        try:
-            with open(settings_file, "r") as f:
-                return json.load(f)
-        except:
-            return default_settings
-    else:
-        with open(settings_file, "w") as f:
-            json.dump(default_settings, f, indent=4)
-        return default_settings
-
-
-def save_settings(settings):
-    """Save user settings to file."""
-    with open("jarvis_settings.json", "w") as f:
-        json.dump(settings, f, indent=4)
 
-
-# Load settings
-settings = load_settings()
-USER_NAME = settings["user_name"]
-WAKE_WORD = settings["wake_word"]
-LISTENING_MODE = settings["listening_mode"]
+# One microphone stream, recognizer and voice activity detector shared by every listener
+mic_stream = None
+recognizer = None
+voice_detector = None
+calibration = CalibrationCache()
+
+# Pooled, cached HTTP client for weather and news, created on first use
+http = None
+
+# Worker processes for offline speech recognition, when "audio_workers" is set
+audio_pool = None
+
+# Guards the objects above that are created on first use from several threads
+_init_lock = threading.RLock()
+
+# Indexed music library, opened on the first "play music"
+music_index = None
+
+# Installed applications by spoken name, scanned in the background at startup
+app_launcher = None
+
+# Answers given by ai(), searchable with "what did you tell me about ..."
+archive = None
+
+# Learns which commands usually follow which and warms their answers while idle
+prefetcher = None
+
+
+# Settings, with these defaults filling in keys missing from the file
+DEFAULT_SETTINGS = {
+    "user_name": "Sir",
+    "wake_word": "jarvis",
+    "listening_mode": "manual",
+    "voice_speed": 200,
+    "recognizer_backend": "google",  # "google", "vosk" (offline) or "fake"
+    "recognizer_language": "en-in",
+    "vosk_model_path": "models/vosk",
+    "audio_workers": 0,  # Processes that run offline (vosk) recognition; 0 runs it in Jarvis's own process
+    "voice": None,  # Synthesizer voice name, None for the system default
+    "barge_in": False,  # Listen while speaking and stop talking when the user does (best with a headset)
+    "tts_cache_size": 200,
+    "wake_word_engine": "local",  # "local" (enrolled samples) or "google"
+    "wake_word_sensitivity": 0.5,
+    "vad_hangover_ms": 300,  # Silence that ends an utterance
+    "favorite_sites": {
+        "youtube": "https://www.youtube.com",
+        "wikipedia": "https://www.wikipedia.com",
+        "google": "https://www.google.com"
+    },
+    # Spoken name -> program; Office's executables aren't named after what people call them
+    "favorite_apps": {"word": "winword.exe", "excel": "excel.exe"} if SYSTEM_INFO == "Windows" else {},
+    "music_dirs": [],  # Empty means ~/Music and ~/Downloads
+    "persist_chat": True,  # Keep the conversation in jarvis_history.jsonl across restarts
+    "context_token_budget": 1000,  # Tokens of history sent with each chat request
+    "summary_trigger_tokens": 300,  # Fold older turns into the summary once this many have piled up
+    "stream_responses": True,  # Speak answers sentence by sentence while they are generated
+    "response_cache": True,  # Reuse earlier OpenAI answers to repeated questions
+    "cache_ttl_hours": 24,
+    "cache_max_entries": 1000,
+    "cache_similarity": 0.0,  # Trigram similarity for near-duplicate questions (e.g. 0.9); 0 for exact matches only
+    "cache_bypass_intents": [],  # e.g. ["chat"] to always ask the API in conversation
+    "api_requests_per_minute": 60,  # Spread requests out to stay under the account's rate limits
+    "api_tokens_per_minute": 40000,
+    "prefetch": True,  # Fetch and pre-synthesize the likely next answers between commands
+    "prefetch_requests_per_minute": 4,  # Network budget for guesses
+    "prefetch_tts_ms_per_minute": 3000,  # Synthesis time budget for guesses
+    "usage_log": "jarvis_usage.jsonl",  # Which commands were used when; what prefetching learns from
+    "tracing": False,  # Time each step of a command; summarized when Jarvis exits
+    "trace_file": "jarvis_trace.jsonl"
+}
+
+# jarvis_settings.json, read (and written, if missing) on first use
+settings = None
+atexit.register(tracing.shutdown)  # Print p50/p95/p99 per step
+
+# Listening mode and state, shared by the worker threads; the saved mode is applied with the settings
+runtime = assistant_runtime.AssistantRuntime()
+
+# Chat history, restored from the log when persistence is on; opened on first use
+conversation = None
+
+# Earlier OpenAI answers, reused for repeated questions; opened on first use
+answers = None
+
+# Intent tables compiled once; the website phrases follow the favorite sites
+command_router = intents.IntentRouter(intents.COMMAND_INTENTS)
+command_router.set_phrases("open_website", intents.site_phrases(DEFAULT_SETTINGS["favorite_sites"]))
+local_router = intents.IntentRouter(intents.LOCAL_INTENTS)
+
+# Speech-to-text backend chosen in the settings, created on first use
+speech_backend = None
+
+
+# One speech engine per process, speaking from its own thread, started on first use
+speech = None
+
+
+def get_speech():
+    """Return the speech engine, starting its thread (and cache directory) on first use."""
+    global speech
+    with _init_lock:
+        if speech is None:
+            options = get_settings()
+            speech = tts.SpeechEngine(voice=options.get("voice"), speed=options.get("voice_speed", 200),
+                                      cache_size=options.get("tts_cache_size", 200))
+        return speech
+
+
+def get_conversation():
+    """Return the local user's chat history, reading its log on first use."""
+    global conversation
+    with _init_lock:
+        if conversation is None:
+            conversation = Conversation(max_messages=200,
+                                        log_path="jarvis_history.jsonl" if get_settings().get("persist_chat", True) else None)
+        return conversation
+
+
+def get_answers():
+    """Return the response cache, opening it on first use, or None when "response_cache" is off."""
+    global answers
+    options = get_settings()
+    if not options.get("response_cache", True):
+        return None
+    with _init_lock:
+        if answers is None:
+            answers = response_cache.ResponseCache(
+                ttl=options.get("cache_ttl_hours", 24) * 3600,
+                max_entries=options.get("cache_max_entries", 1000),
+                similarity=options.get("cache_similarity", 0.0)
+            )
+            atexit.register(answers.close)
+            atexit.register(lambda: print(answers.summary()))
+        return answers
 
 
 def say(text):
-    """Uses the appropriate command to speak text based on the OS."""
+    """Queues text to be spoken and returns without waiting for the speech to finish."""
     if not text:
         return
 
+    pipeline.check_cancelled()  # A newer utterance took over; stop this answer here
+    session = sessions.current()
+    if session is not None:
+        session.reply(text)  # Sent back to the client, which speaks it
+        return
     print(f"Jarvis: {text}")
+    get_speech().say(text)
+
+
+def get_settings():
+    """Return the shared settings, reading jarvis_settings.json (and creating it) on first use."""
+    global settings, USER_NAME, WAKE_WORD
+    with _init_lock:
+        if settings is None:
+            loaded = SettingsStore("jarvis_settings.json", DEFAULT_SETTINGS)
+            atexit.register(loaded.close)  # Write out changes still waiting for their debounced save
+            USER_NAME = loaded["user_name"]
+            WAKE_WORD = loaded["wake_word"]
+            if loaded["tracing"]:
+                tracing.configure(True, loaded["trace_file"])
+            runtime.set_mode(loaded["listening_mode"])
+            command_router.set_phrases("open_website", intents.site_phrases(loaded["favorite_sites"]))
+            api_budget.requests_per_minute = loaded["api_requests_per_minute"]
+            api_budget.tokens_per_minute = loaded["api_tokens_per_minute"]
+            settings = loaded
+        return settings
+
+
+def load_api_key():
+    """Return the API key from config.py, reading it on first use and creating a placeholder config.py if missing."""
+    global apikey, api_available
+    with _init_lock:
+        if api_available is None:
+            try:
+                from config import apikey
+            except ImportError:
+                apikey = None
+                print("No config.py found. Creating one with a placeholder API key.")
+                with open("config.py", "w") as f:
+                    f.write(f'apikey = "{PLACEHOLDER_API_KEY}"')
+            api_available = bool(apikey) and apikey != PLACEHOLDER_API_KEY
+        return apikey
+
+
+def user_name():
+    """The name of the user being answered: the client's in server mode, else USER_NAME."""
+    session = sessions.current()
+    if session is not None:
+        return session.settings["user_name"]
+    get_settings()  # USER_NAME comes from the settings file
+    return USER_NAME
+
+
+def current_settings():
+    """The settings to answer with: the client's in server mode, else the shared settings."""
+    session = sessions.current()
+    return session.settings if session is not None else get_settings()
+
+
+def current_conversation():
+    session = sessions.current()
+    return session.conversation if session is not None else get_conversation()
+
+
+def current_router():
+    session = sessions.current()
+    return session.router if session is not None and session.router is not None else command_router
+
+
+def update_site_phrases():
+    """Route "open <site>" to the favorite sites, giving a client its own router once it has its own sites."""
+    session = sessions.current()
+    if session is None:
+        command_router.set_phrases("open_website", intents.site_phrases(get_settings()["favorite_sites"]))
+        return
+    if session.router is None:
+        session.router = intents.IntentRouter(command_router.intents)
+    session.router.set_phrases("open_website", intents.site_phrases(session.settings["favorite_sites"]))
+
+
+def api_state_changed(previous, state):
+    """Tell the user when Jarvis drops to offline mode and when it recovers."""
+    if state == circuit_breaker.OPEN and previous == circuit_breaker.CLOSED:
+        say("I'm switching to offline mode due to API limitations. I'll reconnect when the API is available again.")
+    elif state == circuit_breaker.CLOSED and previous == circuit_breaker.HALF_OPEN:
+        say("I'm back online.")
+
+
+# Retries, backoff and offline fallback for the OpenAI API; a background probe brings it back
+api_breaker = circuit_breaker.CircuitBreaker(probe=lambda: get_client().models.list(), on_state_change=api_state_changed)
+api_budget = circuit_breaker.RateBudget(DEFAULT_SETTINGS["api_requests_per_minute"],
+                                        DEFAULT_SETTINGS["api_tokens_per_minute"])
+
+
+def get_client():
+    """Return the OpenAI client, creating it on first use; retries are left to the circuit breaker."""
+    global client, api_available
+    with _init_lock:
+        if client is None:
+            try:
+                client = openai.OpenAI(api_key=load_api_key(), max_retries=0, timeout=20)
+                print("OpenAI API initialized successfully.")
+            except Exception as e:
+                print(f"Error initializing OpenAI client: {e}")
+                api_available = False
+                raise
+        return client
+
+
+def get_http():
+    """Return the shared HTTP client, creating it on first use."""
+    global http
+    with _init_lock:
+        if http is None:
+            http = http_client.HttpClient()
+        return http
+
+
+def get_recognizer():
+    global recognizer
+    with _init_lock:
+        if recognizer is None:
+            recognizer = sr.Recognizer()
+        return recognizer
+
+
+def get_audio_pool():
+    """Return the audio worker pool, starting it on first use."""
+    global audio_pool
+    with _init_lock:
+        if audio_pool is None:
+            options = get_settings()
+            audio_pool = audio_workers.AudioWorkerPool(options.get("audio_workers", 0), settings=dict(options))
+            atexit.register(audio_pool.close)
+        return audio_pool
+
+
+def get_speech_backend():
+    global speech_backend
+    with _init_lock:
+        if speech_backend is None:
+            options = get_settings()
+            if options.get("audio_workers", 0) and options.get("recognizer_backend") == "vosk":
+                # Each worker loads its own copy of the model
+                speech_backend = recognizers.PooledRecognizer(get_audio_pool(), "vosk")
+            else:
+                speech_backend = recognizers.create_recognizer(options)
+        return speech_backend
 
-    if SYSTEM_INFO == "Darwin":  # macOS
-        os.system(f'say "{text}"')
-    elif SYSTEM_INFO == "Windows":
-        try:
-            from win32com.client import Dispatch
-            speak = Dispatch("SAPI.SpVoice")
-            speak.Speak(text)
-        except:
-            os.system(f'powershell -command "Add-Type -AssemblyName System.Speech; ' +
-                      f'(New-Object System.Speech.Synthesis.SpeechSynthesizer).Speak(\'{text}\')"')
-    elif SYSTEM_INFO == "Linux":
-        try:
-            os.system(f'espeak "{text}"')
-        except:
-            print("Could not find a speech synthesizer. Text-to-speech is unavailable.")
+
+def api_online():
+    """True when an API key is configured and the circuit breaker isn't holding requests back."""
+    load_api_key()
+    return api_available and api_breaker.available()
+
+
+def call_api(request, fn, can_retry=None):
+    """Run fn() within the per-minute budget and through the circuit breaker."""
+    tokens = sum(count_tokens(m["content"]) for m in request["messages"]) + request.get("max_tokens", 0)
+    with tracing.span("openai", model=request["model"], tokens=tokens):
+        api_budget.acquire(tokens)
+        return api_breaker.call(fn, can_retry)
+
+
+def get_mic_stream():
+    """Return the shared microphone stream, opening it on first use."""
+    global mic_stream
+    with _init_lock:
+        if mic_stream is None:
+            mic_stream = audio_stream.AudioStream().start()
+        return mic_stream
+
+
+def get_voice_detector():
+    """Return the shared voice activity detector, matched to the microphone format."""
+    global voice_detector
+    with _init_lock:
+        if voice_detector is None:
+            stream = get_mic_stream()
+            voice_detector = vad.VoiceActivityDetector(stream.SAMPLE_RATE, stream.SAMPLE_WIDTH,
+                                                       hangover_ms=get_settings().get("vad_hangover_ms", 300))
+        return voice_detector
+
+
+def calibration_key(stream):
+    return f"{stream.SAMPLE_RATE}Hz/{stream.SAMPLE_WIDTH * 8}bit"
 
 
 def adjust_mic_sensitivity():
-    """Adjust microphone sensitivity based on environmental noise."""
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
+    """Adjust microphone sensitivity based on environmental noise, and remember the result."""
+    stream = get_mic_stream()
+    r = get_recognizer()
+    with stream.live_source() as source:
         print("Calibrating microphone for ambient noise... Please remain quiet for a moment.")
+        start = source.position
         r.adjust_for_ambient_noise(source, duration=2)
+        # The same stretch of room noise seeds the detector's noise floor; it keeps adapting after that
+        noise_floor = get_voice_detector().calibrate(stream.buffer.read_segment(start, source.position))
         print("Microphone calibrated.")
+    try:
+        calibration.save(calibration_key(stream), energy_threshold=r.energy_threshold, noise_floor_db=noise_floor)
+    except OSError as e:
+        print(f"Could not save the microphone calibration: {e}")
     return r
 
 
-def takeCommand(timeout=5):
-    """Captures user speech input and returns the recognized query."""
-    r = sr.Recognizer()
-    with sr.Microphone() as source:
+def start_calibration():
+    """Apply the last saved calibration now and recalibrate in the background."""
+    def run():
+        try:
+            stream = get_mic_stream()
+            cached = calibration.load(calibration_key(stream))
+            if cached:
+                get_recognizer().energy_threshold = cached["energy_threshold"]
+                if cached.get("noise_floor_db") is not None and get_voice_detector().noise_floor is None:
+                    get_voice_detector().noise_floor = cached["noise_floor_db"]
+            adjust_mic_sensitivity()
+        except Exception as e:
+            print(f"Microphone calibration failed: {e}")
+
+    thread = threading.Thread(target=run, name="jarvis-calibration", daemon=True)
+    thread.start()
+    return thread
+
+
+def takeCommand(timeout=5, on_partial=None):
+    """Captures user speech input and returns the recognized query.
+
+    Only the voiced audio found by the voice activity detector is fed to the
+    speech backend, while the user is still talking; streaming backends
+    report partial transcripts to `on_partial`.
+    """
+    detector = get_voice_detector()
+    barge_in = get_settings().get("barge_in", False)
+    speech = get_speech()
+    was_speaking = speech.busy()
+    if not barge_in:
+        # Don't transcribe Jarvis's own voice: wait, then start from live audio
+        speech.wait()
+    with get_mic_stream().source(resume=barge_in or not was_speaking) as source:
         print("Listening...")
         try:
-            audio = r.listen(source, timeout=timeout)
+            session = get_speech_backend().session(source.SAMPLE_RATE, source.SAMPLE_WIDTH)
+            feed_seconds = 0.0
+            with tracing.span("capture"):
+                chunks = detector.listen(lambda: source.stream.read(source.CHUNK), timeout=timeout,
+                                         phrase_time_limit=30)
+                for i, chunk in enumerate(chunks):
+                    if i == 0 and barge_in:
+                        speech.interrupt()  # The user started talking over Jarvis
+                    started = time.perf_counter()
+                    partial = session.feed(chunk)
+                    feed_seconds += time.perf_counter() - started
+                    if partial and on_partial:
+                        on_partial(partial)
+            tracing.record("vad", detector.classify_seconds)
             print("Recognizing...")
-            query = r.recognize_google(audio, language="en-in")
+            # What's left of recognition once the user stops talking; the rest overlapped with capture
+            with tracing.span("stt", streamed_ms=round(feed_seconds * 1000, 1)):
+                query = session.finish()
             print(f"User said: {query}")
             return query
-        except sr.WaitTimeoutError:
+        except TimeoutError:
             print("Listening timed out.")
             return None
         except sr.UnknownValueError:
@@ -146,108 +469,233 @@ def takeCommand(timeout=5):
 
 def continuous_listening():
     """Continuously listens for the wake word."""
-    global IS_LISTENING
-
-    r = sr.Recognizer()
-    r.energy_threshold = 4000  # Adjust based on your environment
-    r.dynamic_energy_threshold = True
+    stream = get_mic_stream()
+    detector = wake_word.load_wake_word_engine(get_settings(), stream.SAMPLE_RATE)
 
     say(f"Continuous listening mode activated. Say '{WAKE_WORD}' to activate me.")
 
-    while True:
-        if not IS_LISTENING:
-            with sr.Microphone() as source:
+    if detector:
+        listen_for_local_wake_word(stream, detector)
+    else:
+        print("No wake word samples enrolled. Say 'train wake word' to stop using online recognition for it.")
+        listen_for_online_wake_word(stream)
+
+
+def activate():
+    """Respond to the wake word and handle commands until told to stop."""
+    if not runtime.transition(assistant_runtime.ACTIVE):
+        return  # The mode changed in the meantime
+
+    say("Yes, I'm listening.")
+    process_commands()
+
+
+def listen_for_local_wake_word(stream, detector):
+    """Runs the local wake word detector over raw frames; nothing leaves the machine until it fires."""
+    print("Waiting for wake word...")
+    position = stream.buffer.end
+    while runtime.is_mode("continuous"):
+        frame, position = stream.buffer.read(position, timeout=1)
+        if frame is None:
+            continue
+        if detector.process(frame):
+            print("Wake word detected.")
+            # The command starts right after the wake word, even without a pause
+            stream.cursor = position
+            activate()
+            detector.reset()
+            position = stream.buffer.end
+            print("Waiting for wake word...")
+
+
+def listen_for_online_wake_word(stream):
+    """Fallback that transcribes every phrase with Google to look for the wake word."""
+    detector = get_voice_detector()
+
+    while runtime.is_mode("continuous"):
+        if runtime.state == assistant_runtime.WAITING:
+            with stream.source() as source:
                 try:
                     print("Waiting for wake word...")
-                    audio = r.listen(source)
+                    # Short phrases only; only their voiced part is uploaded
+                    voiced = b"".join(detector.listen(lambda: source.stream.read(source.CHUNK),
+                                                      timeout=5, phrase_time_limit=5))
+                    audio = sr.AudioData(voiced, source.SAMPLE_RATE, source.SAMPLE_WIDTH)
                     try:
-                        text = r.recognize_google(audio).lower()
+                        text = get_recognizer().recognize_google(audio).lower()
                         print(f"Heard: {text}")
 
                         if WAKE_WORD.lower() in text:
-                            say("Yes, I'm listening.")
-                            IS_LISTENING = True
-                            process_commands()
-                            IS_LISTENING = False
+                            activate()
                     except sr.UnknownValueError:
                         pass
                     except Exception as e:
                         print(f"Error: {e}")
+                except TimeoutError:
+                    pass  # Quiet; check the mode and listen again
                 except Exception as e:
                     print(f"Listening error: {e}")
-        time.sleep(0.1)
+
+
+def train_wake_word():
+    """Record a few samples of the wake word for local detection."""
+    say(f"I'll record you saying '{WAKE_WORD}' three times. Say it after each prompt.")
+    try:
+        with get_mic_stream().live_source() as source:
+            wake_word.enroll(source, get_recognizer(), WAKE_WORD, count=3)
+        say("Wake word samples saved. They'll be used next time continuous mode starts.")
+        return True
+    except Exception as e:
+        print(f"Error recording wake word samples: {e}")
+        say("I couldn't record the wake word samples.")
+        return False
 
 
 def process_commands():
     """Process user commands during active listening state."""
-    while IS_LISTENING:
-        query = takeCommand()
+    def stop_listening():
+        if runtime.transition(assistant_runtime.WAITING):
+            say("Exiting active listening mode.")
+
+    run_command_pipeline(lambda: runtime.state == assistant_runtime.ACTIVE, stop_listening)
+
+
+def run_command_pipeline(running, stop_listening=None):
+    """Listen, route and answer as overlapping stages until running() returns False.
+
+    Jarvis listens for the next utterance while it is still answering; a new
+    utterance cancels the answer in progress and stops its speech.
+    """
+    def listen():
+        # Partial transcripts are routed while the user is still talking, and
+        # what the command will need is started as soon as its intent is known
+        early = {}
+
+        def on_partial(text):
+            normalized = intents.normalize(text)
+            intent = command_router.route(normalized, normalized=True)
+            local = local_router.route(normalized, normalized=True) if intent is None else None
+            needs = (intent, local, weather_city(normalized) if local == "weather" else None)
+            if early.get("needs") != needs:
+                threading.Thread(target=prepare_intent, args=(text, intent), name="jarvis-prepare",
+                                 daemon=True).start()
+            early.update(text=normalized, intent=intent, needs=needs)
+
+        query = takeCommand(on_partial=on_partial)
         if not query:
-            continue
+            return None
+        # The last partial usually is the final transcript; then it is routed already
+        return query, early["intent"] if early.get("text") == intents.normalize(query) else None
+
+    def route(heard):
+        query, intent = heard
+        if stop_listening and "stop listening" in query.lower():
+            stop_listening()
+            return None
+        return query, intent if intent is not None else command_router.route(query)
+
+    def respond(routed):
+        handle_command(*routed)
+        return routed
+
+    commands = pipeline.Pipeline(
+        listen,
+        [pipeline.Stage("route", route, blocking=False),
+         pipeline.Stage("respond", respond, preemptive=True)],
+        running=running, on_preempt=get_speech().interrupt,
+        gauges={"speak": lambda: get_speech().pending})
+    try:
+        asyncio.run(commands.run())
+    finally:
+        print(commands.report())
+
+
+# Cities the offline weather reply recognizes
+WEATHER_CITIES = ["new york", "london", "tokyo", "sydney", "mumbai"]
+
+
+def weather_city(query_lower):
+    return next((city for city in WEATHER_CITIES if city in query_lower), None)
+
+
+def fetch_weather(city):
+    response = get_http().get(f"https://wttr.in/{city}?format=%C+%t")
+    return response.text if response.status_code == 200 else None
 
-        if "stop listening" in query.lower():
-            say("Exiting active listening mode.")
-            break
 
-        # Process the command
-        handle_command(query)
+def fetch_news():
+    response = get_http().get("https://www.reddit.com/r/news/.json")
+    if response.status_code != 200:
+        return None
+    news_data = response.json()
+    return [post['data']['title'] for post in news_data['data']['children'][:5]]
+
+
+def prepare_intent(query, intent):
+    """Start what a command will need while the user is still saying it (from a partial transcript)."""
+    try:
+        if intent == "play_music":
+            get_music_library()
+        elif intent == "open_application":
+            get_app_launcher()
+        elif intent == "recall":
+            get_archive()
+        elif intent is None and api_online():
+            get_client()
+        elif intent is None:
+            # Answered by local_response: fetch the weather or news it is going to read out
+            query_lower = intents.normalize(query)
+            local = local_router.route(query_lower, normalized=True)
+            city = weather_city(query_lower) if local == "weather" else None
+            if city:  # Not before the city is said: "the weather in ..." usually names one
+                get_http().prefetch("weather", city, lambda: fetch_weather(city), ttl=600, stale_ttl=1800)
+            elif local == "news":
+                get_http().prefetch("news", "top", fetch_news, ttl=300, stale_ttl=900)
+    except Exception as e:
+        print(f"Error preparing {intent or 'an answer'}: {e}")
 
 
+@tracing.traced("weather")
 def get_weather(city="New York"):
     """Get current weather information."""
-    try:
-        url = f"https://wttr.in/{city}?format=%C+%t"
-        response = requests.get(url)
-        if response.status_code == 200:
-            return response.text
-        else:
-            return None
-    except:
-        return None
+    return get_http().cached("weather", city.lower(), lambda: fetch_weather(city), ttl=600, stale_ttl=1800)
 
 
+@tracing.traced("news")
 def get_news():
     """Get top headlines."""
-    try:
-        url = "https://www.reddit.com/r/news/.json"
-        headers = {'User-Agent': 'Jarvis/1.0'}
-        response = requests.get(url, headers=headers)
-        if response.status_code == 200:
-            news_data = response.json()
-            headlines = []
-            for post in news_data['data']['children'][:5]:
-                headlines.append(post['data']['title'])
-            return headlines
-        return None
-    except:
-        return None
+    return get_http().cached("news", "top", fetch_news, ttl=300, stale_ttl=900)
+
+
+def greeting_replies(name):
+    return [f"Hello {name}! How can I help you today?",
+            f"Hi there {name}! What can I do for you?",
+            f"Hey {name}! I'm here to assist you."]
 
 
 def local_response(query):
     """Provides basic responses without using the OpenAI API."""
-    query_lower = query.lower()
+    query_lower = intents.normalize(query)
+    intent = local_router.route(query_lower, normalized=True)
 
     # Greetings
-    if any(word in query_lower for word in ["hello", "hi", "hey", "greetings"]):
-        responses = [f"Hello {USER_NAME}! How can I help you today?",
-                     f"Hi there {USER_NAME}! What can I do for you?",
-                     f"Hey {USER_NAME}! I'm here to assist you."]
-        return random.choice(responses)
+    if intent == "greeting":
+        return random.choice(greeting_replies(user_name()))
 
     # How are you responses
-    elif any(phrase in query_lower for phrase in ["how are you", "how's it going", "how are things"]):
+    elif intent == "how_are_you":
         responses = ["I'm functioning well, thank you for asking!",
                      "All systems operational. How may I assist you?",
                      "I'm doing great! Ready to help with whatever you need."]
         return random.choice(responses)
 
     # Weather request
-    elif any(word in query_lower for word in ["weather", "temperature", "forecast"]):
-        for city in ["new york", "london", "tokyo", "sydney", "mumbai"]:
-            if city in query_lower:
-                weather = get_weather(city)
-                if weather:
-                    return f"The current weather in {city.title()} is {weather}"
+    elif intent == "weather":
+        city = weather_city(query_lower)
+        if city:
+            weather = get_weather(city)
+            if weather:
+                return f"The current weather in {city.title()} is {weather}"
 
         # Default to local weather
         weather = get_weather()
@@ -257,7 +705,7 @@ def local_response(query):
             return "I'm sorry, I couldn't retrieve the weather information."
 
     # News request
-    elif "news" in query_lower:
+    elif intent == "news":
         news = get_news()
         if news:
             headlines = ". ".join(news[:3])
@@ -266,7 +714,7 @@ def local_response(query):
             return "I'm sorry, I couldn't retrieve the latest news."
 
     # Time request
-    elif "time" in query_lower:
+    elif intent == "time":
         current_time = datetime.datetime.now()
         hour = current_time.strftime("%I")
         minute = current_time.strftime("%M")
@@ -274,26 +722,26 @@ def local_response(query):
         return f"The time is {hour}:{minute} {am_pm}."
 
     # Date request
-    elif "date" in query_lower or "day" in query_lower:
+    elif intent == "date":
         current_date = datetime.datetime.now().strftime("%A, %B %d, %Y")
         return f"Today is {current_date}."
 
     # Identity questions
-    elif "your name" in query_lower:
+    elif intent == "identity":
         return f"I am Jarvis, your personal AI assistant."
 
-    elif "who made you" in query_lower or "who created you" in query_lower:
+    elif intent == "creator":
         return "I was created by a developer who was inspired by the AI assistant from Iron Man."
 
     # Gratitude
-    elif any(word in query_lower for word in ["thank", "thanks"]):
+    elif intent == "thanks":
         responses = ["You're welcome! Is there anything else I can help you with?",
                      "My pleasure. What else can I do for you?",
                      "Happy to help. What's next on your mind?"]
         return random.choice(responses)
 
     # Jokes
-    elif "joke" in query_lower:
+    elif intent == "joke":
         jokes = [
             "Why don't scientists trust atoms? Because they make up everything!",
             "Why was the math book sad? Because it had too many problems.",
@@ -304,8 +752,8 @@ def local_response(query):
         return random.choice(jokes)
 
     # Goodbye
-    elif any(word in query_lower for word in ["bye", "goodbye", "exit", "quit"]):
-        responses = [f"Goodbye {USER_NAME}! Have a great day!",
+    elif intent == "goodbye":
+        responses = [f"Goodbye {user_name()}! Have a great day!",
                      "See you later!",
                      "Until next time!"]
         return random.choice(responses)
@@ -315,127 +763,230 @@ def local_response(query):
         return "I'm currently operating in offline mode. I can help with basic tasks like telling the time, weather, news, opening websites or applications. For more complex tasks, I need API access."
 
 
+def keeps_answers():
+    """False while answering for a session that must leave the answer cache and archive as they were."""
+    session = sessions.current()
+    return session is None or session.keep_answers
+
+
+def cached_answer(intent, prompt, system, model="gpt-3.5-turbo"):
+    """Look up an earlier answer unless caching is off or bypassed for this intent."""
+    cache = get_answers() if keeps_answers() else None
+    if cache is None:
+        return None
+    if intent in current_settings().get("cache_bypass_intents", []):
+        cache.bypassed += 1
+        return None
+    return cache.get(prompt, system, model)
+
+
+def store_answer(intent, prompt, system, response_text, model="gpt-3.5-turbo"):
+    cache = get_answers() if keeps_answers() else None
+    if cache is not None and intent not in current_settings().get("cache_bypass_intents", []):
+        cache.put(prompt, system, model, response_text)
+
+
+def summarize_history(previous_summary, messages):
+    """Fold older chat turns into the rolling conversation summary."""
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    request = dict(
+        model="gpt-3.5-turbo",
+        messages=[
+            {"role": "system", "content": "Update the running summary of a conversation between a user and the "
+                                          "assistant Jarvis. Keep names, facts and open questions. Reply with the "
+                                          "summary only, in under 100 words."},
+            {"role": "user", "content": f"Current summary: {previous_summary or '(none)'}\n\nNew turns:\n{transcript}"}
+        ],
+        temperature=0.2,
+        max_tokens=150
+    )
+    response = call_api(request, lambda: get_client().chat.completions.create(**request))
+    return response.choices[0].message.content
+
+
+@tracing.traced("chat")
 def chat(query):
     """Handles conversation with OpenAI's GPT chat model with fallback to local responses."""
-    global chatStr
-    global api_available
+    system_prompt = f"You are Jarvis, a helpful AI assistant. You are talking to a user named {user_name()}. Keep your responses concise and helpful."
+    conversation = current_conversation()
+    options = current_settings()
+    # Follow-up questions depend on the previous answer, so it is part of the cache scope
+    previous = conversation.recent(1)
+    cache_scope = system_prompt + "\n" + (previous[0].content if previous else "")
+
+    response_text = cached_answer("chat", query, cache_scope)
+    if response_text:
+        say(response_text)
+        conversation.add_exchange(query, response_text)
+        return response_text
 
-    if not api_available:
+    if not api_online():
         response_text = local_response(query)
         say(response_text)
-        chatStr += f"User: {query}\nJarvis: {response_text}\n"
+        conversation.add_exchange(query, response_text)
         return response_text
 
     try:
         chat_history = [
-            {"role": "system",
-             "content": f"You are Jarvis, a helpful AI assistant. You are talking to a user named {USER_NAME}. Keep your responses concise and helpful."}
+            {"role": "system", "content": system_prompt}
         ]
 
-        # Parse chat history
-        chat_pairs = []
-        for pair in chatStr.strip().split("\n"):
-            if pair.startswith("User: "):
-                chat_pairs.append({"role": "user", "content": pair[6:].strip()})
-            elif pair.startswith("Jarvis: "):
-                chat_pairs.append({"role": "assistant", "content": pair[8:].strip()})
-
-        # Only use the most recent conversation context to avoid token limits
-        recent_pairs = chat_pairs[-10:] if len(chat_pairs) > 10 else chat_pairs
-        chat_history.extend(recent_pairs)
+        # Recent turns that fit the token budget, plus a rolling summary of older ones
+        chat_history.extend(conversation.context(options.get("context_token_budget", 1000), summarize_history,
+                                                 options.get("summary_trigger_tokens", 300)))
 
         # Add current query
         chat_history.append({"role": "user", "content": query})
 
-        response = client.chat.completions.create(
+        request = dict(
             model="gpt-3.5-turbo",
             messages=chat_history,
             temperature=0.7,
             max_tokens=150  # Keeping it shorter to conserve tokens
         )
-
-        response_text = response.choices[0].message.content.strip()
-        say(response_text)
-        chatStr += f"User: {query}\nJarvis: {response_text}\n"
+        spoken = []
+
+        def speak(sentence):
+            spoken.append(sentence)
+            say(sentence)
+
+        # Each sentence is spoken as soon as it has been generated; a failed
+        # request is only retried if nothing was said yet
+        result = call_api(request, lambda: streaming.speak_completion(
+            get_client(), speak, stream=options.get("stream_responses", True), **request),
+            can_retry=lambda: not spoken)
+        tracing.annotate(first_audio_ms=round((result.first_audio or result.total) * 1000, 1))
+
+        response_text = result.text
+        store_answer("chat", query, cache_scope, response_text)
+        conversation.add_exchange(query, response_text)
         return response_text
 
     except Exception as e:
         print(f"Error during chat: {e}")
-        if "quota" in str(e).lower() or "429" in str(e) or "api key" in str(e).lower():
-            api_available = False
-            say("I'm switching to offline mode due to API limitations.")
-            response_text = local_response(query)
-            say(response_text)
-            chatStr += f"User: {query}\nJarvis: {response_text}\n"
-            return response_text
-        else:
-            say("An error occurred. Switching to offline mode.")
-            response_text = local_response(query)
-            say(response_text)
-            return response_text
+        # When the circuit opened, api_state_changed has already announced offline mode
+        if api_breaker.available():
+            say("An error occurred, so I'll answer offline this time.")
+        response_text = local_response(query)
+        say(response_text)
+        conversation.add_exchange(query, response_text)
+        return response_text
 
 
+@tracing.traced("ai")
 def ai(prompt):
     """Handles AI-based tasks using GPT chat model with fallback."""
-    global api_available
+    # Create a system message that encourages concise, useful outputs
+    system_prompt = "You are an expert AI assistant. Provide concise, accurate information."
 
-    if not api_available:
+    # Speak the opening sentences (about 100 characters) while the rest is generated
+    spoken = 0
+
+    def speak_opening(sentence):
+        nonlocal spoken
+        if spoken < 100:
+            say(sentence)
+            spoken += len(sentence)
+
+    response_text = cached_answer("ai", prompt, system_prompt)
+    if not response_text and not api_online():
         say("I'm sorry, but I'm currently in offline mode due to API limitations.")
         return None
 
     try:
-        # Create a system message that encourages concise, useful outputs
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are an expert AI assistant. Provide concise, accurate information."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=200
-        )
+        if response_text:
+            for sentence in streaming.SentenceSplitter().feed(response_text + "\n"):
+                speak_opening(sentence)
+        else:
+            request = dict(
+                model="gpt-3.5-turbo",
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.7,
+                max_tokens=200
+            )
+            result = call_api(request, lambda: streaming.speak_completion(
+                get_client(), speak_opening, stream=current_settings().get("stream_responses", True), **request),
+                can_retry=lambda: spoken == 0)
+            response_text = result.text
+            store_answer("ai", prompt, system_prompt, response_text)
+
+        if keeps_answers():
+            # Saved with the next batch; "what did you tell me about ..." finds it again
+            get_archive().add(prompt, response_text, source=archive_sources()[0])
+            say("I've saved the full response.")
+        return response_text
 
-        response_text = response.choices[0].message.content.strip()
+    except Exception as e:
+        print(f"Error during AI processing: {e}")
+        # When the circuit opened, api_state_changed has already announced offline mode
+        if api_breaker.available():
+            say("There was an error processing your request.")
+        return None
 
-        # Create directory for AI responses if it doesn't exist
-        if not os.path.exists("Jarvis_Responses"):
-            os.mkdir("Jarvis_Responses")
 
-        # Create a cleaned filename from the prompt
-        timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename_part = ''.join(prompt.split('intelligence')[1:]).strip() if 'intelligence' in prompt else prompt
-        filename_part = ''.join(e for e in filename_part if e.isalnum() or e.isspace())
-        filename_part = filename_part[:30].strip().replace(" ", "_") or "response"
-        file_name = f"Jarvis_Responses/{timestamp}_{filename_part}.txt"
+def get_archive():
+    """Return the response archive, opening it on first use."""
+    global archive
+    with _init_lock:
+        if archive is None:
+            archive = response_archive.ResponseArchive()
+            atexit.register(archive.close)  # Write the last batch
+        return archive
 
-        # Save the response
-        with open(file_name, "w") as f:
-            f.write(f"Query: {prompt}\n\nResponse:\n{response_text}")
 
-        say("I've processed your request and saved the response.")
-        say(response_text[:100] + "..." if len(response_text) > 100 else response_text)
-        return response_text
+def archive_sources():
+    """Archive sources whose answers the current user may recall; new answers get the first."""
+    session = sessions.current()
+    return (session.archive_source,) if session is not None else ("ai", "import")
+
 
+def import_saved_responses():
+    """Move the answers ai() used to save as text files into the archive (once)."""
+    try:
+        get_archive().import_directory("Jarvis_Responses")
     except Exception as e:
-        print(f"Error during AI processing: {e}")
-        if "quota" in str(e).lower() or "429" in str(e) or "api key" in str(e).lower():
-            api_available = False
-            say("I'm switching to offline mode due to API limitations.")
-        else:
-            say("There was an error processing your request.")
-        return None
+        print(f"Could not import saved responses: {e}")
+
+
+def recall(query):
+    """Answer "what did you tell me about X" from the archive, without the API."""
+    topic = query.lower().rsplit(" about ", 1)[-1].strip()
+    matches = get_archive().search(topic, limit=1, sources=archive_sources()) if keeps_answers() else []
+    if not matches:
+        say(f"I don't remember telling you anything about {topic}.")
+        return False
+    created, prompt, response = matches[0]
+    when = datetime.datetime.fromtimestamp(created)
+    day = f"{when:%B} {when.day}"
+    if sessions.current() is None:
+        print(f"[{day}] {prompt}\n{response}")  # The whole answer, on screen
+    opening = streaming.SentenceSplitter().feed(response + "\n") or [response[:200]]
+    say(f"On {day}, you asked: {prompt}. I said: {' '.join(opening[:2])}")
+    return True
+
+
+def open_url(url):
+    """Open a page in the browser; in server mode the client opens it."""
+    session = sessions.current()
+    if session is not None:
+        session.act("open_url", url=url)
+    else:
+        webbrowser.open(url)
 
 
 def open_website(query):
     """Opens websites based on user commands."""
-    sites = settings["favorite_sites"]
+    sites = current_settings()["favorite_sites"]
     query_lower = query.lower()
 
     # Check for "open [site]" commands
     for site_name, url in sites.items():
         if f"open {site_name}" in query_lower:
             say(f"Opening {site_name}...")
-            webbrowser.open(url)
+            open_url(url)
             return True
 
     # Check for direct URLs mentioned
@@ -447,7 +998,7 @@ def open_website(query):
             if not url.startswith(("http://", "https://")):
                 url = "https://" + url
             say(f"Opening {url}...")
-            webbrowser.open(url)
+            open_url(url)
             return True
 
     # Check for search queries
@@ -456,39 +1007,35 @@ def open_website(query):
         if search_terms:
             say(f"Searching for {search_terms}...")
             search_url = f"https://www.google.com/search?q={search_terms.replace(' ', '+')}"
-            webbrowser.open(search_url)
+            open_url(search_url)
             return True
 
     return False
 
 
+def get_music_library():
+    """Return the music index, starting its background scan and watcher on first use."""
+    global music_index
+    with _init_lock:
+        if music_index is None:
+            dirs = get_settings().get("music_dirs") or [os.path.expanduser("~/Music"), os.path.expanduser("~/Downloads")]
+            music_index = music_library.MusicLibrary(dirs)
+            music_index.watch()  # Its first pass builds the index; nothing here waits for it
+        return music_index
+
+
 def play_music(query):
-    """Plays music based on the user's query."""
-    music_dirs = []
-
-    # OS-specific music directories
-    if SYSTEM_INFO == "Darwin":  # macOS
-        music_dirs = [os.path.expanduser("~/Music"), os.path.expanduser("~/Downloads")]
-    elif SYSTEM_INFO == "Windows":
-        music_dirs = [os.path.expanduser("~/Music"), os.path.expanduser("~/Downloads")]
-    elif SYSTEM_INFO == "Linux":
-        music_dirs = [os.path.expanduser("~/Music"), os.path.expanduser("~/Downloads")]
-
-    # Look for music files
-    music_files = []
-    for directory in music_dirs:
-        if os.path.exists(directory):
-            for root, dirs, files in os.walk(directory):
-                for file in files:
-                    if file.endswith(('.mp3', '.wav', '.ogg', '.m4a')):
-                        music_files.append(os.path.join(root, file))
-
-    if not music_files:
-        say("I couldn't find any music files in your music directories.")
+    """Plays music based on the user's query, e.g. "play music by Queen" or "play some jazz"."""
+    library = get_music_library()
+    music_file = library.find(query)
+
+    if not music_file:
+        if not library.scanned.is_set():
+            say("I'm still looking through your music. Ask me again in a moment.")
+        else:
+            say("I couldn't find any music files in your music directories.")
         return False
 
-    # Play a random music file
-    music_file = random.choice(music_files)
     try:
         say(f"Playing music.")
 
@@ -519,12 +1066,22 @@ def tell_time():
     time_str = f"{hour}:{minute} {am_pm}"
     date_str = f"{day_name}, {month} {day}"
 
-    say(f"{USER_NAME}, the time is {time_str} on {date_str}.")
+    say(f"{user_name()}, the time is {time_str} on {date_str}.")
     return True
 
 
+def get_app_launcher():
+    """Return the application index, starting its background scan on first use."""
+    global app_launcher
+    with _init_lock:
+        if app_launcher is None:
+            app_launcher = app_index.AppIndex(get_settings()["favorite_apps"], SYSTEM_INFO)
+            app_launcher.watch()
+        return app_launcher
+
+
 def open_application(query):
-    """Opens specific applications based on OS."""
+    """Opens an installed application by (approximately) its spoken name."""
     query_lower = query.lower()
 
     # Check for "open [app]" pattern
@@ -535,96 +1092,38 @@ def open_application(query):
     if not app_name:
         return False
 
-    try:
-        if SYSTEM_INFO == "Darwin":  # macOS
-            # First try user's favorite apps
-            if app_name in settings.get("favorite_apps", {}):
-                app_path = settings["favorite_apps"][app_name]
-                subprocess.Popen(["open", app_path])
-                say(f"Opening {app_name}.")
-                return True
-
-            # Try common macOS applications
-            if app_name == "safari":
-                subprocess.Popen(["open", "-a", "Safari"])
-            elif app_name == "mail":
-                subprocess.Popen(["open", "-a", "Mail"])
-            elif app_name == "calendar":
-                subprocess.Popen(["open", "-a", "Calendar"])
-            elif app_name == "notes":
-                subprocess.Popen(["open", "-a", "Notes"])
-            elif app_name == "photos":
-                subprocess.Popen(["open", "-a", "Photos"])
-            elif app_name == "messages":
-                subprocess.Popen(["open", "-a", "Messages"])
-            elif app_name == "facetime":
-                subprocess.Popen(["open", "-a", "FaceTime"])
-            elif app_name == "maps":
-                subprocess.Popen(["open", "-a", "Maps"])
-            else:
-                # Try to open by name
-                subprocess.Popen(["open", "-a", app_name.capitalize()])
-
-        elif SYSTEM_INFO == "Windows":
-            # Common Windows applications
-            win_apps = {
-                "notepad": "notepad.exe",
-                "calculator": "calc.exe",
-                "paint": "mspaint.exe",
-                "file explorer": "explorer.exe",
-                "edge": "msedge.exe",
-                "word": "winword.exe",
-                "excel": "excel.exe"
-            }
-
-            if app_name in win_apps:
-                subprocess.Popen([win_apps[app_name]])
-            elif app_name in settings.get("favorite_apps", {}):
-                app_path = settings["favorite_apps"][app_name]
-                subprocess.Popen([app_path])
-            else:
-                # Try to start by name
-                subprocess.Popen([app_name + ".exe"])
-
-        elif SYSTEM_INFO == "Linux":
-            # Common Linux applications
-            linux_apps = {
-                "firefox": "firefox",
-                "chrome": "google-chrome",
-                "terminal": "gnome-terminal",
-                "files": "nautilus"
-            }
-
-            if app_name in linux_apps:
-                subprocess.Popen([linux_apps[app_name]])
-            elif app_name in settings.get("favorite_apps", {}):
-                app_path = settings["favorite_apps"][app_name]
-                subprocess.Popen([app_path])
-            else:
-                # Try to start by name
-                subprocess.Popen([app_name])
+    app = get_app_launcher().find(app_name)
+    if app is None:
+        say(f"I couldn't find an application called {app_name}.")
+        return False
 
-        say(f"Opening {app_name}.")
+    try:
+        app_index.launch(app)
+        say(f"Opening {app.name}.")
         return True
 
     except Exception as e:
         print(f"Error opening application: {e}")
-        say(f"I couldn't open {app_name}.")
+        say(f"I couldn't open {app.name}.")
         return False
 
 
 def set_name(query):
     """Set the user's name."""
     global USER_NAME
-    global settings
 
     name = query.split("my name is", 1)[1].strip() if "my name is" in query.lower() else \
         query.split("call me", 1)[1].strip() if "call me" in query.lower() else None
 
     if name:
-        USER_NAME = name
-        settings["user_name"] = name
-        save_settings(settings)
+        session = sessions.current()
+        if session is not None:
+            session.settings["user_name"] = name
+        else:
+            options = get_settings()
+            with options.lock:
+                USER_NAME = name
+                options["user_name"] = name
         say(f"I'll call you {name} from now on.")
         return True
     return False
@@ -632,8 +1131,6 @@ def set_name(query):
 
 def add_favorite_site(query):
     """Add a website to favorites."""
-    global settings
-
     if "add website" in query.lower() and "favorite" in query.lower():
         try:
             # Extract site name and URL
@@ -646,9 +1143,11 @@ def add_favorite_site(query):
                 if not url_part.startswith(("http://", "https://")):
                     url_part = "https://" + url_part
 
-                # Add to favorites
-                settings["favorite_sites"][name_part] = url_part
-                save_settings(settings)
+                # Add to favorites; a client's copy of the shared sites is its own
+                options = current_settings()
+                with options.lock:
+                    options["favorite_sites"] = dict(options["favorite_sites"], **{name_part: url_part})
+                    update_site_phrases()
                 say(f"Added {name_part} to your favorite websites.")
                 return True
         except Exception as e:
@@ -656,86 +1155,183 @@ def add_favorite_site(query):
     return False
 
 
-def handle_command(query):
+def apply_settings(changed):
+    """Apply settings edited in jarvis_settings.json while Jarvis is running."""
+    global USER_NAME, WAKE_WORD, speech_backend
+    options = get_settings()
+    if "user_name" in changed:
+        USER_NAME = options["user_name"]
+    if "wake_word" in changed:
+        WAKE_WORD = options["wake_word"]
+    if "favorite_sites" in changed:
+        command_router.set_phrases("open_website", intents.site_phrases(options["favorite_sites"]))
+    if changed & {"tracing", "trace_file"}:
+        if options["tracing"]:
+            tracing.configure(True, options["trace_file"])
+        else:
+            tracing.shutdown()
+    if "favorite_apps" in changed and app_launcher is not None:
+        app_launcher.set_favorites(options["favorite_apps"])
+    if "listening_mode" in changed:
+        runtime.set_mode(options["listening_mode"])
+    if changed & {"recognizer_backend", "recognizer_language", "vosk_model_path"}:
+        with _init_lock:
+            speech_backend = None  # Recreated with the new settings on next use
+    if "api_requests_per_minute" in changed:
+        api_budget.requests_per_minute = options["api_requests_per_minute"]
+    if "api_tokens_per_minute" in changed:
+        api_budget.tokens_per_minute = options["api_tokens_per_minute"]
+    if prefetcher is not None:
+        if "prefetch_requests_per_minute" in changed:
+            prefetcher.network.requests_per_minute = options["prefetch_requests_per_minute"]
+        if "prefetch_tts_ms_per_minute" in changed:
+            prefetcher.synthesis.tokens_per_minute = options["prefetch_tts_ms_per_minute"]
+    # Everything else is read when it is used, except these
+    pending = changed & {"voice", "voice_speed", "tts_cache_size", "persist_chat",
+                         "cache_ttl_hours", "cache_max_entries", "cache_similarity", "vad_hangover_ms",
+                         "audio_workers", "prefetch", "usage_log"}
+    print(f"Settings reloaded: {', '.join(sorted(changed)) or 'no changes'}")
+    if pending:
+        print(f"Restart Jarvis to apply: {', '.join(sorted(pending))}")
+
+
+def get_prefetcher():
+    """Return the prefetcher, training its usage model from the log on first use."""
+    global prefetcher
+    with _init_lock:
+        if prefetcher is None:
+            def weather_fetch(city, allow):
+                return get_http().prefetch("weather", city or "new york", lambda: fetch_weather(city or "New York"),
+                                           ttl=600, stale_ttl=1800, allow=allow)
+
+            def weather_replies(city):
+                return [local_response(f"weather in {city}" if city else "weather")]
+
+            # Online, chat() answers weather, news and greetings through the API, which needs none of this
+            def answered_locally():
+                return not api_online()
+
+            actions = {
+                "weather": prefetch.Action(weather_fetch, weather_replies, answered_locally),
+                "news": prefetch.Action(lambda _, allow: get_http().prefetch("news", "top", fetch_news, ttl=300,
+                                                                             stale_ttl=900, allow=allow),
+                                        lambda _: [local_response("news")], answered_locally),
+                "greeting": prefetch.Action(replies=lambda _: greeting_replies(user_name()), when=answered_locally),
+            }
+            options = get_settings()
+            log = prefetch.UsageLog(options["usage_log"])
+            prefetcher = prefetch.Prefetcher(prefetch.load_model(log), actions, get_speech(), log,
+                                             requests_per_minute=options["prefetch_requests_per_minute"],
+                                             tts_ms_per_minute=options["prefetch_tts_ms_per_minute"])
+            atexit.register(prefetcher.stop)
+        return prefetcher
+
+
+def record_usage(query, intent):
+    """Log what was asked for, by command intent or else by offline-reply intent, and prefetch what's next."""
+    argument = None
+    if intent is None:
+        query_lower = intents.normalize(query)
+        intent = local_router.route(query_lower, normalized=True) or "chat"
+        if intent == "weather":
+            argument = weather_city(query_lower)
+    get_prefetcher().record(intent, argument)
+
+
+# Commands that act on the computer Jarvis runs on, which a remote client can't use
+LOCAL_ONLY_INTENTS = {"play_music", "open_application", "train_wake_word", "continuous_mode"}
+
+
+@tracing.traced("handle_command")
+def handle_command(query, intent=None):
     """Handle user commands based on query."""
     if not query:
         return
 
-    # Check for website opening commands
-    if open_website(query):
-        return
-
-    # User customization
-    if "my name is" in query.lower() or "call me" in query.lower():
+    if intent is None:
+        with tracing.span("route"):
+            intent = current_router().route(query)
+    tracing.annotate(intent=intent)
+    session = sessions.current()
+
+    if session is not None and intent in LOCAL_ONLY_INTENTS:
+        say("That only works on the computer I'm running on.")
+    elif intent == "recall":
+        recall(query)
+    elif intent in ("open_website", "search"):
+        if not open_website(query):
+            chat(query)
+    elif intent == "set_name":
         set_name(query)
-        return
-
-    # Add favorite website
-    if "add website" in query.lower() and "favorite" in query.lower():
+    elif intent == "add_favorite_site":
         add_favorite_site(query)
-        return
-
-    # Check for other commands
-    if "play music" in query.lower() or "play some music" in query.lower():
+    elif intent == "play_music":
         play_music(query)
-    elif "what time" in query.lower() or "what's the time" in query.lower():
+    elif intent == "tell_time":
         tell_time()
-    elif "open " in query.lower():
+    elif intent == "open_application":
         open_application(query)
-    elif "using artificial intelligence" in query.lower() and api_available:
+    elif intent == "ai" and api_online():
         ai(prompt=query)
-    elif any(cmd in query.lower() for cmd in ["jarvis quit", "exit", "goodbye", "bye", "quit"]):
-        say(f"Goodbye, {USER_NAME}. Have a great day!")
-        exit()
-    elif "reset chat" in query.lower():
-        global chatStr
-        chatStr = ""
+    elif intent == "exit":
+        say(f"Goodbye, {user_name()}. Have a great day!")
+        if session is not None:
+            session.ended = True
+        else:
+            get_speech().wait()
+            runtime.stop()
+    elif intent == "train_wake_word":
+        train_wake_word()
+    elif intent == "reset_chat":
+        current_conversation().reset()
         say("Chat history reset.")
-    elif "switch to continuous mode" in query.lower():
-        global LISTENING_MODE
-        LISTENING_MODE = "continuous"
-        settings["listening_mode"] = "continuous"
-        save_settings(settings)
-        say("Switching to continuous listening mode.")
-        continuous_thread = threading.Thread(target=continuous_listening)
-        continuous_thread.daemon = True
-        continuous_thread.start()
+    elif intent == "continuous_mode":
+        if runtime.set_mode("continuous"):
+            get_settings()["listening_mode"] = "continuous"
+            say("Switching to continuous listening mode.")
+        else:
+            say("I'm already in continuous listening mode.")
     else:
         chat(query)
 
+    # Only the local user's habits; clients' replies aren't spoken here
+    if session is None and get_settings()["prefetch"]:
+        record_usage(query, intent)
+
 
 if __name__ == '__main__':
     print('Welcome to Jarvis A.I - Enhanced Edition')
     print(f"System: {SYSTEM_INFO}")
+    options = get_settings()
+    key = load_api_key()
 
-    # Initial microphone calibration
-    r = adjust_mic_sensitivity()
+    # Calibrate the microphone in the background; last run's values apply meanwhile
+    start_calibration()
+    get_app_launcher()  # Scan installed applications in the background
+    threading.Thread(target=import_saved_responses, name="jarvis-archive-import", daemon=True).start()
+    if options["prefetch"]:
+        get_prefetcher().start()  # Warm the usual first commands of a sitting while idle
 
-    say(f"Jarvis A.I is online and ready, {USER_NAME}.")
+    say(f"Jarvis A.I is online and ready, {user_name()}.")
 
     if not api_available:
         print("Warning: OpenAI API is not available. Running in offline mode.")
-        if apikey == "YOUR-OPENAI-API-KEY-HERE":
+        if key == PLACEHOLDER_API_KEY:
             say("I notice you haven't set up your OpenAI API key yet. I'll operate in offline mode with limited capabilities.")
         else:
             say("Running in offline mode due to API limitations.")
 
-    # Start in continuous mode if configured
-    if LISTENING_MODE == "continuous":
-        continuous_thread = threading.Thread(target=continuous_listening)
-        continuous_thread.daemon = True
-        continuous_thread.start()
-        # Main thread will continue to allow keyboard interrupts
+    # Pick up edits to jarvis_settings.json without a restart
+    options.on_change(apply_settings)
+    options.watch()
 
-    try:
-        while LISTENING_MODE == "manual":
-            query = takeCommand()
-            if query:
-                handle_command(query)
+    # One worker per mode; each runs while its mode is active
+    runtime.add_worker("manual", lambda: run_command_pipeline(lambda: runtime.is_mode("manual")))
+    runtime.add_worker("continuous", continuous_listening)
 
-        # If in continuous mode, main thread just keeps the program alive
-        while LISTENING_MODE == "continuous":
-            time.sleep(1)
+    try:
+        # The main thread only waits, so keyboard interrupts still reach it
+        runtime.wait_until_stopped()
 
     except KeyboardInterrupt:
         say("Shutting down. Goodbye!")
@@ -743,3 +1339,4 @@ if __name__ == '__main__':
     except Exception as e:
         print(f"Unexpected error: {e}")
         say("An unexpected error occurred. Shutting down.")
+    get_speech().wait(timeout=10)
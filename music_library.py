@@ -0,0 +1,315 @@
+"""Indexed music library for Jarvis.
+
+Music files are kept in a SQLite index (path, mtime, duration and basic tags)
+that is built once and then updated incrementally: directories whose mtime
+hasn't changed are not listed again. A background watcher keeps the index
+current, so "play music" is a single query instead of a walk over the disk.
+"""
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import wave
+
+MUSIC_EXTENSIONS = (".mp3", ".wav", ".ogg", ".m4a", ".flac")
+
+# Words in a spoken request that say nothing about which track to play
+_FILLER_WORDS = {"play", "some", "music", "song", "songs", "track", "tracks", "by", "please", "jarvis",
+                 "me", "a", "an", "the", "for", "can", "you", "could", "would", "something", "from"}
+
+
+def read_tags(path):
+    """Return (title, artist, album, genre, duration) for a music file, using mutagen when installed."""
+    title = artist = album = genre = None
+    duration = None
+    try:
+        import mutagen
+        audio = mutagen.File(path, easy=True)
+        if audio is not None:
+            tags = audio.tags or {}
+            title = (tags.get("title") or [None])[0]
+            artist = (tags.get("artist") or [None])[0]
+            album = (tags.get("album") or [None])[0]
+            genre = (tags.get("genre") or [None])[0]
+            duration = getattr(audio.info, "length", None)
+    except ImportError:
+        pass
+    except Exception:
+        pass  # Unreadable or unsupported tags; fall back to the file name
+
+    if duration is None and path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as f:
+                duration = f.getnframes() / f.getframerate()
+        except Exception:
+            pass
+
+    # "Artist - Title.mp3" is the most common naming scheme without tags
+    name = os.path.splitext(os.path.basename(path))[0]
+    if not title:
+        if " - " in name:
+            guessed_artist, title = name.split(" - ", 1)
+            artist = artist or guessed_artist
+        else:
+            title = name
+    album = album or os.path.basename(os.path.dirname(path))
+    return title.strip(), artist and artist.strip(), album, genre, duration
+
+
+class MusicLibrary:
+    """SQLite-backed index of the music files under a set of directories."""
+
+    def __init__(self, directories, db_path="jarvis_media.db"):
+        self.directories = [os.path.abspath(d) for d in directories]
+        self.db_path = db_path
+        self.lock = threading.RLock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS tracks (
+                path TEXT PRIMARY KEY, dir TEXT, mtime REAL, size INTEGER, duration REAL,
+                title TEXT, artist TEXT, album TEXT, genre TEXT);
+            CREATE INDEX IF NOT EXISTS tracks_dir ON tracks(dir);
+            CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, parent TEXT, mtime REAL);
+            CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+        """)
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS track_search USING fts5("
+                            "path UNINDEXED, title, artist, album, genre)")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5; searches fall back to LIKE
+        self.db.commit()
+        self.refresh_lock = threading.Lock()  # One scan at a time
+        self.scanned = threading.Event()  # Set once a full scan has finished
+        self.watcher = None
+        self.stop_event = threading.Event()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM tracks").fetchone()[0]
+
+    def refresh(self):
+        """Bring the index up to date, only listing directories whose mtime changed.
+
+        Directory listings and tag reads happen outside self.lock, which is only
+        held for each directory's writes, so searches keep answering during a scan.
+        """
+        started = time.time()
+        added = removed = 0
+        with self.refresh_lock:
+            with self.lock:
+                known_dirs = dict(self.db.execute("SELECT path, mtime FROM dirs"))
+            seen_dirs = set()
+            stack = [(d, None) for d in self.directories]
+            pending = 0
+            while stack:
+                directory, parent = stack.pop()
+                try:
+                    mtime = os.stat(directory).st_mtime
+                except OSError:
+                    continue
+                seen_dirs.add(directory)
+
+                if known_dirs.get(directory) == mtime:
+                    # Nothing was added, removed or renamed here; just descend
+                    with self.lock:
+                        children = self.db.execute("SELECT path FROM dirs WHERE parent = ?", (directory,)).fetchall()
+                    stack.extend((child, directory) for (child,) in children)
+                    continue
+
+                a, r, subdirs = self._scan_directory(directory)
+                added += a
+                removed += r
+                with self.lock:
+                    # Recorded after its tracks, so an interrupted scan resumes here
+                    self.db.execute("INSERT OR REPLACE INTO dirs (path, parent, mtime) VALUES (?, ?, ?)",
+                                    (directory, parent, mtime))
+                    pending += 1
+                    if pending >= 200:
+                        self.db.commit()
+                        pending = 0
+                stack.extend((sub, directory) for sub in subdirs)
+
+            with self.lock:
+                for gone in set(known_dirs) - seen_dirs:
+                    removed += self._delete_tracks("dir = ?", (gone,))
+                    self.db.execute("DELETE FROM dirs WHERE path = ?", (gone,))
+                self.db.commit()
+        self.scanned.set()
+        if added or removed:
+            print(f"Music library updated: {added} added, {removed} removed ({time.time() - started:.1f}s).")
+        return added, removed
+
+    def _scan_directory(self, directory):
+        subdirs = []
+        present = {}
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.path)
+                    elif entry.name.lower().endswith(MUSIC_EXTENSIONS):
+                        stat = entry.stat()
+                        present[entry.path] = (stat.st_mtime, stat.st_size)
+        except OSError:
+            return 0, 0, subdirs
+
+        with self.lock:
+            known = dict(self.db.execute("SELECT path, mtime FROM tracks WHERE dir = ?", (directory,)))
+        changed = [(path, mtime, size, read_tags(path)) for path, (mtime, size) in present.items()
+                   if known.get(path) != mtime]
+
+        removed = 0
+        with self.lock:
+            for path, mtime, size, (title, artist, album, genre, duration) in changed:
+                if path in known:
+                    self._delete_tracks("path = ?", (path,))
+                self.db.execute("INSERT INTO tracks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                (path, directory, mtime, size, duration, title, artist, album, genre))
+                if self.fts:
+                    self.db.execute("INSERT INTO track_search VALUES (?, ?, ?, ?, ?)", (path, title, artist, album, genre))
+            for path in set(known) - set(present):
+                removed += self._delete_tracks("path = ?", (path,))
+        return len(changed), removed, subdirs
+
+    def _delete_tracks(self, where, args):
+        if self.fts:
+            self.db.execute(f"DELETE FROM track_search WHERE path IN (SELECT path FROM tracks WHERE {where})", args)
+        return self.db.execute(f"DELETE FROM tracks WHERE {where}", args).rowcount
+
+    def random_track(self):
+        with self.lock:
+            top = self.db.execute("SELECT MAX(rowid) FROM tracks").fetchone()[0]
+            if not top:
+                return None
+            row = self.db.execute("SELECT path FROM tracks WHERE rowid >= ? ORDER BY rowid LIMIT 1",
+                                  (random.randint(1, top),)).fetchone()
+            return row[0] if row else None
+
+    def search(self, terms, limit=20):
+        """Return paths of tracks whose title, artist, album or genre match all the terms."""
+        if not terms:
+            return []
+        with self.lock:
+            if self.fts:
+                match = " ".join('"' + t.replace('"', "") + '"*' for t in terms)
+                rows = self.db.execute("SELECT path FROM track_search WHERE track_search MATCH ? ORDER BY rank LIMIT ?",
+                                       (match, limit))
+            else:
+                where = " AND ".join("(title LIKE ? OR artist LIKE ? OR album LIKE ? OR genre LIKE ?)" for _ in terms)
+                args = [f"%{t}%" for t in terms for _ in range(4)]
+                rows = self.db.execute(f"SELECT path FROM tracks WHERE {where} LIMIT ?", args + [limit])
+            return [path for (path,) in rows]
+
+    def find(self, query):
+        """Pick a track for a spoken request like 'play some jazz' or 'play music by queen'."""
+        terms = [w for w in re.findall(r"[\w']+", query.lower()) if w not in _FILLER_WORDS]
+        if terms:
+            matches = self.search(terms)
+            if matches:
+                return random.choice(matches)
+        return self.random_track()
+
+    def watch(self, interval=60):
+        """Keep the index current in the background, with watchdog events when available."""
+        if self.watcher:
+            return
+        changed = threading.Event()
+        changed.set()  # Always catch up once at startup
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    changed.set()
+
+            observer = Observer()
+            for directory in self.directories:
+                if os.path.isdir(directory):
+                    observer.schedule(Handler(), directory, recursive=True)
+            observer.daemon = True
+            observer.start()
+        except ImportError:
+            pass  # Poll instead; unchanged directories cost one stat() each
+
+        def run():
+            while not self.stop_event.is_set():
+                changed.wait(interval)
+                changed.clear()
+                self.stop_event.wait(1)  # Let a burst of file events settle
+                try:
+                    self.refresh()
+                except Exception as e:
+                    print(f"Music library refresh failed: {e}")
+                    self.scanned.set()  # Answer from what was indexed rather than "still indexing"
+
+        self.watcher = threading.Thread(target=run, name="jarvis-music-index", daemon=True)
+        self.watcher.start()
+
+
+def _make_tree(root, count):
+    for i in range(count):
+        folder = os.path.join(root, f"Artist {i % 500}", f"Album {i % 37}")
+        os.makedirs(folder, exist_ok=True)
+        open(os.path.join(folder, f"Artist {i % 500} - Song {i}.mp3"), "w").close()
+        if i % 10 == 0:
+            open(os.path.join(folder, f"cover {i}.jpg"), "w").close()
+
+
+def benchmark(count=100000, lookups=200):
+    """Compare walking the tree per request with querying the index, on a synthetic library."""
+    root = tempfile.mkdtemp(prefix="jarvis_music_")
+    try:
+        print(f"Creating {count} files...")
+        _make_tree(root, count)
+
+        started = time.perf_counter()
+        files = []
+        for dirpath, _, names in os.walk(root):
+            files.extend(os.path.join(dirpath, n) for n in names if n.endswith(MUSIC_EXTENSIONS))
+        random.choice(files)
+        walk = time.perf_counter() - started
+        print(f"Cold os.walk per request: {walk * 1000:.0f} ms ({len(files)} tracks)")
+
+        library = MusicLibrary([root], db_path=os.path.join(root, "index.db"))
+        started = time.perf_counter()
+        library.watch()
+        waits = []
+        while not library.scanned.is_set():
+            # Requests made while the first scan runs only wait for one directory's writes
+            asked = time.perf_counter()
+            library.find("play music by artist 7")
+            waits.append(time.perf_counter() - asked)
+            time.sleep(0.01)
+        print(f"Initial index build (once, in the background): {time.perf_counter() - started:.1f} s")
+        if waits:
+            waits.sort()
+            print(f"Lookups during the build: {len(waits)}, median {waits[len(waits) // 2] * 1000:.2f} ms, "
+                  f"max {waits[-1] * 1000:.1f} ms")
+        library.stop_event.set()
+
+        started = time.perf_counter()
+        library.refresh()
+        print(f"Incremental refresh, nothing changed: {(time.perf_counter() - started) * 1000:.0f} ms")
+
+        started = time.perf_counter()
+        for i in range(lookups):
+            library.random_track()
+        print(f"Indexed random pick: {(time.perf_counter() - started) / lookups * 1000:.3f} ms")
+
+        started = time.perf_counter()
+        for i in range(lookups):
+            assert library.find(f"play music by artist {i % 500}")
+        print(f"Indexed artist lookup: {(time.perf_counter() - started) / lookups * 1000:.3f} ms")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,261 @@
+"""Assistant turns as an asyncio pipeline.
+
+Listening, routing and answering run as stages connected by bounded queues,
+so Jarvis can hear the next utterance while it is still working on the last
+one. A full queue holds the stage before it back (backpressure) instead of
+piling up work. A new utterance reaching a preemptive stage cancels the answer
+in flight there; blocking handlers run in worker threads and notice the
+cancellation the next time they call check_cancelled() (say() does).
+"""
+import contextvars
+import sys
+import threading
+import time
+from collections import deque
+
+import tracing
+from startup import lazy_import
+
+asyncio = lazy_import("asyncio")  # Only needed once a pipeline runs; keeps it off the startup path
+
+current_turn = contextvars.ContextVar("current_turn", default=None)
+
+
+class TurnCancelled(BaseException):
+    """Raised in a worker thread whose turn was cancelled, to unwind it.
+
+    A BaseException so the `except Exception` fallbacks along the way (and the
+    API circuit breaker) don't mistake it for a failure.
+    """
+
+
+def check_cancelled():
+    """Raise TurnCancelled if the turn this thread is working on has been cancelled."""
+    turn = current_turn.get()
+    if turn is not None and turn.cancelled.is_set():
+        raise TurnCancelled()
+
+
+class Turn:
+    __slots__ = ("id", "value", "created", "queued", "cancelled", "span")
+
+    def __init__(self, id, value, span=None):
+        self.id = id
+        self.value = value
+        self.created = time.perf_counter()
+        self.queued = self.created
+        self.cancelled = threading.Event()
+        self.span = span if span is not None else tracing.span("turn")  # Parent of the spans of every stage, from listening to the answer
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class Stage:
+    """One step of a turn. `handler(value)` returns the value for the next stage, or None to end the turn."""
+
+    def __init__(self, name, handler, maxsize=2, blocking=True, preemptive=False):
+        self.name = name
+        self.handler = handler
+        self.maxsize = maxsize
+        self.blocking = blocking  # Run the handler in a worker thread
+        self.preemptive = preemptive  # A new turn cancels the one in progress here
+        self.inbox = None
+        self.current = None
+        self.current_turn = None
+        self.processed = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.waits = deque(maxlen=1000)
+        self.service = deque(maxlen=1000)
+
+    async def _call(self, turn):
+        current_turn.set(turn)
+        tracing.attach(turn.span)
+        if self.blocking:
+            return await asyncio.to_thread(self._handle, turn.value)
+        return self._handle(turn.value)
+
+    def _handle(self, value):
+        with tracing.span(self.name):
+            return self.handler(value)
+
+
+_DONE = object()
+
+
+class Pipeline:
+    """Runs `source` (a blocking callable producing utterances) into a chain of stages.
+
+    `running()` is checked before each call to the source; once it returns
+    False the pipeline drains and run() returns. `on_preempt` is called when
+    a turn is cancelled, e.g. to stop speech. `gauges` maps names to callables
+    reporting the depth of queues outside the pipeline, like the speech queue.
+    """
+
+    def __init__(self, source, stages, running=lambda: True, on_preempt=None, gauges=None):
+        self.source = source
+        self.stages = stages
+        self.running = running
+        self.on_preempt = on_preempt
+        self.gauges = gauges or {}
+        self.turns = 0
+        self.source_times = deque(maxlen=1000)
+        self.latencies = deque(maxlen=1000)
+
+    async def run(self):
+        for stage in self.stages:
+            stage.inbox = asyncio.Queue(stage.maxsize)
+        workers = [asyncio.create_task(self._work(i)) for i in range(len(self.stages))]
+        try:
+            await self._produce()
+        finally:
+            await self.stages[0].inbox.put(_DONE)
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    async def _produce(self):
+        while self.running():
+            started = time.perf_counter()
+            span = tracing.span("turn")  # Dropped unfinished if nothing was heard
+            value = await asyncio.to_thread(self._listen, span)
+            if value is None:
+                continue
+            self.source_times.append(time.perf_counter() - started)
+            self.turns += 1
+            await self._forward(0, Turn(self.turns, value, span))
+
+    def _listen(self, span):
+        tracing.attach(span)
+        return self.source()
+
+    async def _forward(self, index, turn):
+        stage = self.stages[index]
+        if stage.preemptive:
+            # Newest wins: drop turns still waiting and cancel the one being answered
+            while not stage.inbox.empty():
+                stale = stage.inbox.get_nowait()
+                if stale is not _DONE:
+                    stage.cancelled += 1
+                    stale.span.end(cancelled=stage.name)
+            if stage.current is not None and not stage.current.done():
+                self._cancel(stage)
+        turn.queued = time.perf_counter()
+        await stage.inbox.put(turn)
+
+    def _cancel(self, stage):
+        stage.current_turn.cancelled.set()
+        stage.current.cancel()
+        if self.on_preempt:
+            self.on_preempt()
+
+    async def _work(self, index):
+        stage = self.stages[index]
+        last = index == len(self.stages) - 1
+        while True:
+            turn = await stage.inbox.get()
+            if turn is _DONE:
+                if not last:
+                    await self.stages[index + 1].inbox.put(_DONE)
+                return
+            if turn.cancelled.is_set():
+                stage.cancelled += 1
+                turn.span.end(cancelled=stage.name)
+                continue
+            started = time.perf_counter()
+            stage.waits.append(started - turn.queued)
+            stage.current_turn = turn
+            stage.current = asyncio.ensure_future(stage._call(turn))
+            try:
+                result = await stage.current
+            except (asyncio.CancelledError, TurnCancelled):
+                stage.cancelled += 1
+                turn.span.end(cancelled=stage.name)
+                continue
+            except Exception as e:
+                print(f"Error in {stage.name} stage: {e}")
+                stage.errors += 1
+                turn.span.end(error=type(e).__name__)
+                continue
+            finally:
+                stage.current = None
+            stage.service.append(time.perf_counter() - started)
+            stage.processed += 1
+            if result is None:
+                turn.span.end()
+                continue
+            if last:
+                self.latencies.append(time.perf_counter() - turn.created)
+                turn.span.end()
+            else:
+                turn.value = result
+                await self._forward(index + 1, turn)
+
+    def stats(self):
+        """Queue depth and latency per stage, in milliseconds."""
+        report = {"listen": {"turns": self.turns, "p50_ms": percentile(self.source_times, 0.5) * 1000,
+                             "p95_ms": percentile(self.source_times, 0.95) * 1000}}
+        for stage in self.stages:
+            report[stage.name] = {
+                "depth": stage.inbox.qsize() if stage.inbox else 0,
+                "processed": stage.processed, "cancelled": stage.cancelled, "errors": stage.errors,
+                "wait_p95_ms": percentile(stage.waits, 0.95) * 1000,
+                "p50_ms": percentile(stage.service, 0.5) * 1000,
+                "p95_ms": percentile(stage.service, 0.95) * 1000}
+        for name, gauge in self.gauges.items():
+            report[name] = {"depth": gauge()}
+        report["turn"] = {"p50_ms": percentile(self.latencies, 0.5) * 1000,
+                          "p95_ms": percentile(self.latencies, 0.95) * 1000}
+        return report
+
+    def report(self):
+        lines = []
+        for name, values in self.stats().items():
+            fields = ", ".join(f"{key} {value:.0f}" if isinstance(value, float) else f"{key} {value}"
+                               for key, value in values.items())
+            lines.append(f"{name:>8}: {fields}")
+        return "\n".join(lines)
+
+
+def benchmark(utterances=20, listen=0.3, recognize=0.2, answer=0.8):
+    """Serial loop vs. pipeline on simulated stage timings, plus an utterance that interrupts an answer."""
+    def run_serial():
+        for _ in range(utterances):
+            time.sleep(listen + recognize)
+            time.sleep(answer)
+
+    started = time.perf_counter()
+    run_serial()
+    serial = time.perf_counter() - started
+    print(f"Serial: {utterances} turns in {serial:.2f}s ({serial / utterances * 1000:.0f} ms/turn)")
+
+    remaining = [utterances]
+
+    def source():
+        time.sleep(listen + recognize)
+        remaining[0] -= 1
+        return "what is the weather"
+
+    def respond(query):
+        for _ in range(8):  # An answer spoken in pieces, checking for cancellation between them
+            time.sleep(answer / 8)
+            check_cancelled()
+        return query
+
+    for label, preemptive in (("Pipeline", False), ("Pipeline, new utterances interrupt", True)):
+        remaining[0] = utterances
+        pipe = Pipeline(source, [Stage("route", lambda q: q, blocking=False),
+                                 Stage("respond", respond, maxsize=4, preemptive=preemptive)],
+                        running=lambda: remaining[0] > 0)
+        started = time.perf_counter()
+        asyncio.run(pipe.run())
+        elapsed = time.perf_counter() - started
+        print(f"{label}: {utterances} turns in {elapsed:.2f}s ({elapsed / utterances * 1000:.0f} ms/turn)")
+        print(pipe.report())
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 20)
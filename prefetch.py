@@ -0,0 +1,427 @@
+"""Speculative prefetch of likely follow-up commands while Jarvis is idle.
+
+Every command is appended to a small usage log (jarvis_usage.jsonl) as an
+intent and, for weather, the city. From it a UsageModel counts which intent
+follows which at each hour of the day, with "start" standing for the first
+command after a long pause. After each command, and periodically while
+nobody is talking, the Prefetcher asks the model for the likely next
+intents and runs their actions: a background HTTP fetch that warms the
+weather/news cache, then pre-synthesizing the replies those answers would
+produce, so the reply is spoken from the TTS cache. Network requests and
+synthesis time are capped per minute with circuit_breaker.RateBudget.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+
+import tracing
+from circuit_breaker import BudgetExceededError, RateBudget
+
+START = "start"  # The state before the first command of a sitting
+
+
+class UsageLog:
+    """JSONL log of the intents the user asked for, compacted to the most recent `max_entries`."""
+
+    def __init__(self, path="jarvis_usage.jsonl", max_entries=5000):
+        self.path = path
+        self.max_entries = max_entries
+        self.lines = None  # Lines in the file, counted on first use
+        self.lock = threading.Lock()
+
+    def load(self):
+        """The logged (time, intent, argument) entries, oldest first; unreadable lines are skipped."""
+        with self.lock:
+            entries, self.lines = self._read()
+        return entries[-self.max_entries:]
+
+    def _read(self):
+        entries, lines = [], 0
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        entries.append((float(record["t"]), record["intent"], record.get("arg")))
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except FileNotFoundError:
+            pass
+        return entries, lines
+
+    def append(self, when, intent, argument=None):
+        record = {"t": round(when, 1), "intent": intent}
+        if argument:
+            record["arg"] = argument
+        with self.lock:
+            try:
+                if self.lines is None:
+                    self.lines = self._read()[1]
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record) + "\n")
+                self.lines += 1
+                # Rewrite with the newest entries once it has doubled, so appends stay cheap on average
+                if self.lines >= 2 * self.max_entries:
+                    self._compact()
+            except OSError as e:
+                print(f"Could not write the usage log: {e}")
+
+    def _compact(self):
+        entries = self._read()[0][-self.max_entries:]
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for when, intent, argument in entries:
+                record = {"t": when, "intent": intent}
+                if argument:
+                    record["arg"] = argument
+                f.write(json.dumps(record) + "\n")
+        os.replace(temp_path, self.path)
+        self.lines = len(entries)
+
+
+class UsageModel:
+    """Intent transition counts per hour of the day."""
+
+    def __init__(self, session_gap=1800):
+        self.session_gap = session_gap  # A pause this long starts a new sitting
+        self.transitions = defaultdict(Counter)  # (previous intent, hour) -> Counter of next intents
+        self.arguments = defaultdict(Counter)  # intent -> Counter of arguments, e.g. cities
+        self.previous = START
+        self.last_time = None
+        self.lock = threading.Lock()
+
+    def state(self, when):
+        """The intent a command at `when` would follow: the last one, or START after a long pause."""
+        with self.lock:
+            if self.last_time is None or when - self.last_time >= self.session_gap:
+                return START
+            return self.previous
+
+    def observe(self, when, intent, argument=None):
+        previous = self.state(when)
+        with self.lock:
+            self.transitions[(previous, time.localtime(when).tm_hour)][intent] += 1
+            if argument:
+                self.arguments[intent][argument] += 1
+            self.previous = intent
+            self.last_time = when
+
+    def predict(self, previous, when, limit=3):
+        """The `limit` likeliest next intents after `previous` at `when`, as (intent, probability).
+
+        Counts from the same hour weigh most, the neighbouring hours half as
+        much, and the rest of the day a little, so a habit seen at 8:50 still
+        counts at 9:05 and a new user gets predictions after a few commands.
+        """
+        hour = time.localtime(when).tm_hour
+        scores = Counter()
+        with self.lock:
+            for h in range(24):
+                distance = min((h - hour) % 24, (hour - h) % 24)
+                weight = 1.0 if distance == 0 else 0.5 if distance == 1 else 0.05
+                for intent, count in self.transitions.get((previous, h), {}).items():
+                    scores[intent] += weight * count
+        total = sum(scores.values())
+        if not total:
+            return []
+        return [(intent, score / total) for intent, score in scores.most_common(limit)]
+
+    def likely_argument(self, intent):
+        with self.lock:
+            counts = self.arguments.get(intent)
+            return counts.most_common(1)[0][0] if counts else None
+
+
+class Action:
+    """How to get ahead of one intent.
+
+    `fetch(argument, allow)` starts warming whatever the answer needs and
+    returns a future, or None when there is nothing to fetch; it calls
+    `allow()` right before starting a request, which charges the network
+    budget and may refuse. `replies(argument)` returns the texts Jarvis would
+    then say, for the TTS cache. `when()` says whether the action is worth
+    anything right now: an answer that won't come from the cache isn't.
+    Any of them may be None.
+    """
+
+    def __init__(self, fetch=None, replies=None, when=None):
+        self.fetch = fetch
+        self.replies = replies
+        self.when = when
+
+
+class Prefetcher:
+    """Warms the caches for the commands the usage model expects next."""
+
+    def __init__(self, model, actions, speech=None, log=None, requests_per_minute=4, tts_ms_per_minute=3000,
+                 min_probability=0.2, fetch_timeout=5.0, clock=time.time):
+        self.model = model
+        self.actions = actions  # intent -> Action
+        self.speech = speech  # tts.SpeechEngine whose cache the replies go into
+        self.log = log
+        # Spend only this much of the network and the CPU on guesses
+        self.network = RateBudget(requests_per_minute, float("inf"))
+        self.synthesis = RateBudget(10 ** 6, tts_ms_per_minute)
+        self.min_probability = min_probability
+        self.fetch_timeout = fetch_timeout
+        self.clock = clock
+        self.running = threading.Lock()  # One round of prefetching at a time
+        self.stopped = threading.Event()
+        self.rounds = 0
+        self.fetches = 0
+        self.warmed = 0
+        self.over_budget = 0
+
+    def record(self, intent, argument=None, background=True):
+        """Learn from a command that was just handled, then prefetch what usually comes next."""
+        when = self.clock()
+        self.model.observe(when, intent, argument)
+        if self.log is not None:
+            self.log.append(when, intent, argument)
+        self.schedule(background)
+
+    def schedule(self, background=True):
+        if not background:
+            return self.prefetch()
+        thread = threading.Thread(target=self.prefetch, name="jarvis-prefetch", daemon=True)
+        thread.start()
+        return thread
+
+    def prefetch(self):
+        """One round: warm the actions of the likely next intents. Skipped while a round is running."""
+        if not self.running.acquire(blocking=False):
+            return []
+        try:
+            when = self.clock()
+            predicted = [(intent, p) for intent, p in self.model.predict(self.model.state(when), when)
+                         if p >= self.min_probability and intent in self.actions]
+            if predicted:
+                self.rounds += 1
+                with tracing.span("prefetch", intents=",".join(intent for intent, _ in predicted)):
+                    for intent, _ in predicted:
+                        self._warm(intent, self.actions[intent])
+            return predicted
+        finally:
+            self.running.release()
+
+    def _allow_request(self):
+        try:
+            self.network.acquire(1, max_wait=0)
+            return True
+        except BudgetExceededError:
+            self.over_budget += 1
+            return False
+
+    def _warm(self, intent, action):
+        if action.when is not None and not action.when():
+            return
+        argument = self.model.likely_argument(intent)
+        try:
+            if action.fetch is not None:
+                refused = []
+
+                def allow():
+                    if self._allow_request():
+                        return True
+                    refused.append(True)
+                    return False
+
+                future = action.fetch(argument, allow)
+                if refused:
+                    return  # Building the replies would fetch anyway, outside the budget
+                if future is not None:
+                    self.fetches += 1
+                    if future.result(timeout=self.fetch_timeout) is None:
+                        return
+            if action.replies is None or self.speech is None:
+                return
+            for text in action.replies(argument) or []:
+                cost_ms = len(text) * self.speech.seconds_per_char() * 1000
+                try:
+                    self.synthesis.acquire(cost_ms, max_wait=0)
+                except BudgetExceededError:
+                    self.over_budget += 1
+                    return
+                self.speech.warm(text)
+                self.warmed += 1
+        except Exception as e:
+            print(f"Prefetch of {intent} failed: {e}")
+
+    def run_idle(self, interval=60):
+        """Prefetch every `interval` seconds until stop(), so the first command of a sitting is ready too."""
+        while not self.stopped.wait(interval):
+            self.prefetch()
+
+    def start(self, interval=60):
+        thread = threading.Thread(target=self.run_idle, args=(interval,), name="jarvis-prefetch-idle", daemon=True)
+        thread.start()
+        return thread
+
+    def stop(self):
+        self.stopped.set()
+
+    def stats(self):
+        return {"rounds": self.rounds, "fetches": self.fetches, "warmed": self.warmed, "over_budget": self.over_budget}
+
+
+def load_model(log, session_gap=1800):
+    """A UsageModel trained on everything in `log`."""
+    model = UsageModel(session_gap)
+    for when, intent, argument in log.load():
+        model.observe(when, intent, argument)
+    return model
+
+
+# Habits for the synthetic trace: (first hour, last hour, chance of a sitting, commands in order)
+_ROUTINES = [
+    (7, 9, 0.9, [("greeting", None), ("news", None), ("weather", "london")]),
+    (12, 13, 0.5, [("weather", "mumbai"), ("tell_time", None)]),
+    (18, 21, 0.7, [("greeting", None), ("weather", "london"), ("news", None), ("joke", None)]),
+]
+_NOISE = ["tell_time", "joke", "thanks", "news", "weather", "date", "chat"]
+
+
+def usage_trace(days=28, seed=11, start=None):
+    """A few weeks of (time, intent, argument) with daily routines and some noise."""
+    rng = random.Random(seed)
+    start = start if start is not None else time.mktime(time.strptime("2026-03-02", "%Y-%m-%d"))
+    trace = []
+    for day in range(days):
+        midnight = start + day * 86400
+        for first, last, chance, commands in _ROUTINES:
+            if rng.random() > chance:
+                continue
+            when = midnight + rng.uniform(first, last) * 3600
+            for intent, argument in commands:
+                if rng.random() < 0.15:
+                    noise = rng.choice(_NOISE)
+                    trace.append((when, noise, rng.choice(["tokyo", "sydney"]) if noise == "weather" else None))
+                    when += rng.uniform(10, 60)
+                if rng.random() < 0.9:
+                    trace.append((when, intent, argument))
+                    when += rng.uniform(10, 60)
+    return trace
+
+
+# What the user says for each intent in the trace
+_QUERIES = {"greeting": "hello jarvis", "news": "tell me the news", "weather": "what's the weather in {}",
+            "tell_time": "what time is it", "joke": "tell me a joke", "thanks": "thank you",
+            "date": "what's the date today", "chat": "tell me about volcanoes"}
+
+
+def benchmark(days=28, train_days=21, online=False, http_latency=0.3, tts_latency=0.15, think=1.0):
+    """Replay the last days of a usage trace through main.py, with and without prefetching.
+
+    Uses harness.Harness, so it is main's own wiring: its usage log, actions,
+    budgets (the defaults unless jarvis_settings.json says otherwise), HTTP
+    cache and speech engine. Weather and news answer after `http_latency`
+    and each sentence takes `tts_latency` to synthesize. A sitting's commands
+    come `think` seconds apart (they are 10-60 s apart in the trace, so the
+    per-minute budgets bite harder here than in real use). The hours between
+    sittings are skipped: the HTTP and speech caches and the budget windows
+    are emptied, as they would have expired, and the idle prefetch that runs
+    every minute gets one round. Reports time to first audio per intent.
+    """
+    import harness
+
+    trace = usage_trace(days)
+    split = trace[0][0] + train_days * 86400
+    history = [entry for entry in trace if entry[0] < split]
+    replay = [entry for entry in trace if entry[0] >= split]
+    workdir = tempfile.mkdtemp(prefix="jarvis-prefetch-")
+    log = UsageLog(os.path.join(workdir, "jarvis_usage.jsonl"))
+    for entry in history:
+        log.append(*entry)
+
+    cwd = os.getcwd()
+    bench = harness.Harness(workdir, http_latency=http_latency, tts_latency=tts_latency,
+                            settings={"response_cache": False})  # Only prefetching differs between the runs
+    jarvis = bench.main
+    jarvis.api_available = online
+    prefetcher = jarvis.get_prefetcher()
+    clock = {"now": replay[0][0]}
+    prefetcher.clock = lambda: clock["now"]
+
+    def forget():
+        """What hours of not using Jarvis would have expired."""
+        jarvis.http.cache.clear()
+        with jarvis.speech.cache.lock:
+            for path in jarvis.speech.cache.entries.values():
+                path.unlink(missing_ok=True)
+            jarvis.speech.cache.entries.clear()
+        prefetcher.network.window.clear()
+        prefetcher.synthesis.window.clear()
+
+    def run(prefetching):
+        jarvis.get_settings()["prefetch"] = prefetching
+        latencies = defaultdict(list)
+        requests = jarvis.http.session.requests
+        previous = None
+        for when, intent, argument in replay:
+            if previous is None or when - previous >= prefetcher.model.session_gap:
+                forget()
+                if prefetching:
+                    clock["now"] = when - 60
+                    prefetcher.prefetch()
+                    jarvis.speech.wait()
+                    time.sleep(0.2)  # Pre-synthesis happens on the speech thread once it's idle
+            previous = clock["now"] = when
+            bench.played.clear()
+            asked = time.perf_counter()
+            jarvis.handle_command(_QUERIES[intent].format(argument or "new york"))
+            jarvis.speech.wait()
+            latencies[intent].append((bench.played[0] if bench.played else time.perf_counter()) - asked)
+            time.sleep(think)  # Listening for the next command; a prefetch round runs meanwhile
+        return latencies, jarvis.http.session.requests - requests
+
+    def percentile(values, p):
+        values = sorted(values)
+        return values[min(len(values) - 1, int(len(values) * p))] * 1000
+
+    try:
+        print(f"Trained on {len(history)} logged commands over {train_days} days, replaying {len(replay)} "
+              f"{'online (answers from the API)' if online else 'offline'}; budgets "
+              f"{jarvis.get_settings()['prefetch_requests_per_minute']} requests and "
+              f"{jarvis.get_settings()['prefetch_tts_ms_per_minute']} ms of synthesis per minute")
+        baseline, requests_before = run(False)
+        prefetched, requests_after = run(True)
+        print(f"{'intent':10} {'count':>5} {'p50 before':>11} {'p50 after':>10} {'p95 before':>11} {'p95 after':>10}")
+        for intent in sorted(baseline, key=lambda i: -len(baseline[i])):
+            before, after = baseline[intent], prefetched[intent]
+            print(f"{intent:10} {len(before):5} {percentile(before, 0.5):9.0f}ms {percentile(after, 0.5):8.0f}ms "
+                  f"{percentile(before, 0.95):9.0f}ms {percentile(after, 0.95):8.0f}ms")
+        before, after = sum(baseline.values(), []), sum(prefetched.values(), [])
+        print(f"{'all':10} {len(before):5} {percentile(before, 0.5):9.0f}ms {percentile(after, 0.5):8.0f}ms "
+              f"{percentile(before, 0.95):9.0f}ms {percentile(after, 0.95):8.0f}ms "
+              f"(mean {sum(before) / len(before) * 1000:.0f} -> {sum(after) / len(after) * 1000:.0f} ms)")
+        print(f"HTTP requests: {requests_before} without prefetching, {requests_after} with; "
+              f"prefetcher {prefetcher.stats()}")
+    finally:
+        bench.close()
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Jarvis usage model and prefetch benchmark")
+    parser.add_argument("--days", type=int, default=28)
+    parser.add_argument("--online", action="store_true", help="answer through the (fake) API instead of offline")
+    parser.add_argument("--http-latency", type=float, default=0.3)
+    parser.add_argument("--predict", metavar="LOG", help="print predictions for now from a usage log")
+    args = parser.parse_args()
+    if args.predict:
+        model = load_model(UsageLog(args.predict))
+        now = time.time()
+        print(f"After {model.state(now)}: {model.predict(model.state(now), now)}")
+        sys.exit(0)
+    benchmark(args.days, online=args.online, http_latency=args.http_latency)
+    sys.stdout.flush()
+    os._exit(0)  # Don't wait for the speech and background threads
@@ -0,0 +1,338 @@
+"""Speech recognition backends for Jarvis.
+
+Every backend hands out a session that is fed audio while the user is still
+speaking. Streaming backends return partial hypotheses from feed(), so command
+routing can start before the phrase is over; all of them return the final
+transcript from finish(). The backend is picked with the "recognizer_backend"
+setting in jarvis_settings.json.
+"""
+import hashlib
+import json
+import sys
+import time
+import wave
+from pathlib import Path
+
+import speech_recognition as sr
+
+
+class RecognitionSession:
+    """One utterance being recognized."""
+
+    def __init__(self, sample_rate, sample_width):
+        self.sample_rate = sample_rate
+        self.sample_width = sample_width
+        self.audio = bytearray()  # Grown in place; `data += chunk` on bytes copied everything per chunk
+
+    @property
+    def data(self):
+        """Everything fed so far, as bytes."""
+        return bytes(self.audio)
+
+    def feed(self, data):
+        """Add audio; return a partial transcript if the backend has a new one, else None."""
+        self.audio += data
+        return None
+
+    def finish(self):
+        """Return the final transcript. Raises sr.UnknownValueError if nothing was understood."""
+        raise NotImplementedError
+
+
+class Recognizer:
+    """Base class for speech recognition backends."""
+
+    name = "base"
+    streaming = False  # True if sessions return partial hypotheses while audio is fed
+
+    def session(self, sample_rate, sample_width):
+        raise NotImplementedError
+
+    def recognize(self, audio):
+        """Recognize a complete sr.AudioData in one go."""
+        session = self.session(audio.sample_rate, audio.sample_width)
+        session.feed(audio.get_raw_data())
+        return session.finish()
+
+
+class GoogleSession(RecognitionSession):
+    def __init__(self, backend, sample_rate, sample_width):
+        super().__init__(sample_rate, sample_width)
+        self.backend = backend
+
+    def finish(self):
+        audio = sr.AudioData(self.data, self.sample_rate, self.sample_width)
+        return self.backend.recognizer.recognize_google(audio, language=self.backend.language)
+
+
+class GoogleRecognizer(Recognizer):
+    """Google Web Speech API; uploads the whole phrase once it is complete."""
+
+    name = "google"
+
+    def __init__(self, language="en-in"):
+        self.language = language
+        self.recognizer = sr.Recognizer()
+
+    def session(self, sample_rate, sample_width):
+        return GoogleSession(self, sample_rate, sample_width)
+
+
+class VoskSession(RecognitionSession):
+    def __init__(self, backend, sample_rate, sample_width):
+        super().__init__(sample_rate, sample_width)
+        self.kaldi = backend.vosk.KaldiRecognizer(backend.model, sample_rate)
+        self.segments = []
+        self.last_partial = ""
+
+    def feed(self, data):
+        if self.sample_width != 2:
+            data = sr.AudioData(data, self.sample_rate, self.sample_width).get_raw_data(convert_width=2)
+        if self.kaldi.AcceptWaveform(data):
+            text = json.loads(self.kaldi.Result()).get("text", "")
+            if text:
+                self.segments.append(text)
+            partial = " ".join(self.segments)
+        else:
+            partial = " ".join(self.segments + [json.loads(self.kaldi.PartialResult()).get("partial", "")]).strip()
+        if partial and partial != self.last_partial:
+            self.last_partial = partial
+            return partial
+        return None
+
+    def finish(self):
+        text = json.loads(self.kaldi.FinalResult()).get("text", "")
+        transcript = " ".join(self.segments + [text]).strip()
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class VoskRecognizer(Recognizer):
+    """Offline recognition with Vosk; decodes while audio is fed and reports partial results."""
+
+    name = "vosk"
+    streaming = True
+
+    def __init__(self, model_path="models/vosk"):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("The offline recognizer needs the 'vosk' package (pip install vosk).")
+        if not Path(model_path).exists():
+            raise RuntimeError(f"No Vosk model found at '{model_path}'. Download one from https://alphacephei.com/vosk/models")
+        vosk.SetLogLevel(-1)
+        self.vosk = vosk
+        self.model = vosk.Model(str(model_path))
+
+    def session(self, sample_rate, sample_width):
+        return VoskSession(self, sample_rate, sample_width)
+
+
+class FakeSession(RecognitionSession):
+    def __init__(self, backend, sample_rate, sample_width):
+        super().__init__(sample_rate, sample_width)
+        self.backend = backend
+        self.transcript = backend.next_transcript()
+        self.revealed = 0
+
+    def feed(self, data):
+        super().feed(data)
+        if self.transcript is None:
+            return None
+        # Reveal words at a steady speaking rate so partials are deterministic
+        seconds = len(self.audio) / (self.sample_rate * self.sample_width)
+        words = self.transcript.split()
+        count = min(len(words), int(seconds * self.backend.words_per_second))
+        if count > self.revealed:
+            self.revealed = count
+            return " ".join(words[:count])
+        return None
+
+    def finish(self):
+        time.sleep(self.backend.latency)
+        transcript = self.transcript
+        if transcript is None and isinstance(self.backend.transcripts, dict):
+            transcript = self.backend.transcripts.get(hashlib.sha1(self.audio).hexdigest())
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class FakeRecognizer(Recognizer):
+    """Deterministic backend for tests and benchmarks.
+
+    `transcripts` is either a list returned one per session in order, or a dict
+    mapping the SHA-1 of the raw audio to its transcript.
+    """
+
+    name = "fake"
+    streaming = True
+
+    def __init__(self, transcripts=None, latency=0.0, words_per_second=2.5):
+        self.transcripts = transcripts if transcripts is not None else {}
+        self.latency = latency
+        self.words_per_second = words_per_second
+        self.queue = list(self.transcripts) if isinstance(self.transcripts, list) else []
+
+    def next_transcript(self):
+        return self.queue.pop(0) if self.queue else None
+
+    def session(self, sample_rate, sample_width):
+        return FakeSession(self, sample_rate, sample_width)
+
+    @classmethod
+    def from_clips(cls, directory, **kwargs):
+        """Build a fake that knows the transcript of every WAV clip with a matching .txt file."""
+        transcripts = {}
+        for path in Path(directory).glob("*.wav"):
+            text_file = path.with_suffix(".txt")
+            if text_file.exists():
+                with wave.open(str(path), "rb") as f:
+                    data = f.readframes(f.getnframes())
+                transcripts[hashlib.sha1(data).hexdigest()] = text_file.read_text().strip()
+        return cls(transcripts, **kwargs)
+
+
+class PooledSession(RecognitionSession):
+    def __init__(self, backend, sample_rate, sample_width):
+        super().__init__(sample_rate, sample_width)
+        self.backend = backend
+
+    def finish(self):
+        data = self.data
+        if self.sample_width != 2:
+            data = sr.AudioData(data, self.sample_rate, self.sample_width).get_raw_data(convert_width=2)
+        transcript = self.backend.pool.run("transcribe", data, self.sample_rate)
+        if not transcript:
+            raise sr.UnknownValueError()
+        return transcript
+
+
+class PooledRecognizer(Recognizer):
+    """Runs another backend in audio_workers processes, off the GIL of Jarvis's own threads.
+
+    The audio is recognized once the utterance is over, so there are no partial
+    transcripts; in exchange capture, routing and speech never wait for it.
+    """
+
+    streaming = False
+
+    def __init__(self, pool, name):
+        self.pool = pool
+        self.name = f"pooled {name}"
+
+    def session(self, sample_rate, sample_width):
+        return PooledSession(self, sample_rate, sample_width)
+
+
+def create_recognizer(settings, fallback=True):
+    """Build the backend named by settings["recognizer_backend"].
+
+    If it can't be started, Google is used instead, unless `fallback` is
+    False: then the error is raised, so audio meant to stay on this machine
+    is never uploaded.
+    """
+    backend = settings.get("recognizer_backend", "google")
+    language = settings.get("recognizer_language", "en-in")
+    try:
+        if backend == "vosk":
+            return VoskRecognizer(settings.get("vosk_model_path", "models/vosk"))
+        if backend == "fake":
+            return FakeRecognizer()
+    except Exception as e:
+        if not fallback:
+            raise
+        print(f"Could not start the {backend} recognizer: {e}. Using Google instead.")
+    return GoogleRecognizer(language)
+
+
+def write_fixtures(directory, sample_rate=16000, seed=11):
+    """Synthetic spoken-command WAVs (vad.synthetic_voice bursts in noise) with .txt transcripts.
+
+    They exercise the harness end to end with the fake backend; real engines
+    won't transcribe them, so measure those on recordings of your own.
+    """
+    import numpy as np
+    from vad import synthetic_voice
+
+    commands = ["what time is it", "open youtube", "play some jazz", "what's the weather in london",
+                "tell me the news", "set a timer for five minutes"]
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    for n, command in enumerate(commands):
+        words = command.split()
+        speech = len(words) / 2.5  # Seconds, at a normal speaking rate
+        t = np.arange(int((speech + 0.8) * sample_rate)) / sample_rate
+        audio = rng.normal(0, 0.003 * (1 + n % 3), len(t))
+        mask = (t >= 0.4) & (t < 0.4 + speech)
+        audio[mask] += synthetic_voice(mask.sum(), sample_rate, rng.uniform(100, 220), t[mask][0])
+        path = directory / f"command_{n}.wav"
+        with wave.open(str(path), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+        path.with_suffix(".txt").write_text(command + "\n")
+
+
+def latency_harness(clips_dir, backends, chunk=1024):
+    """Report time from end of speech to final transcript for each backend on each WAV clip.
+
+    Clips with a .txt transcript next to them are also checked for a match.
+    """
+    clips = sorted(Path(clips_dir).glob("*.wav"))
+    if not clips:
+        print(f"No WAV clips found in {clips_dir}.")
+        return
+    for backend in backends:
+        timings = []
+        matched = labelled = 0
+        for path in clips:
+            with wave.open(str(path), "rb") as f:
+                rate, width = f.getframerate(), f.getsampwidth()
+                data = f.readframes(f.getnframes())
+            session = backend.session(rate, width)
+            for i in range(0, len(data), chunk * width):
+                session.feed(data[i:i + chunk * width])
+            started = time.perf_counter()  # All speech has been fed
+            try:
+                transcript = session.finish()
+            except Exception as e:
+                transcript = f"<{type(e).__name__}>"
+            elapsed = time.perf_counter() - started
+            timings.append(elapsed)
+            text_file = path.with_suffix(".txt")
+            if text_file.exists():
+                labelled += 1
+                matched += transcript.lower() == text_file.read_text().strip().lower()
+            print(f"[{backend.name}] {path.name}: {elapsed * 1000:.1f} ms -> {transcript}")
+        timings.sort()
+        print(f"[{backend.name}] median {timings[len(timings) // 2] * 1000:.1f} ms, max {timings[-1] * 1000:.1f} ms"
+              + (f", {matched} of {labelled} transcripts right" if labelled else ""))
+
+
+if __name__ == "__main__":
+    fixtures_dir = Path(__file__).parent / "fixtures" / "recognizers"
+    if sys.argv[1:] == ["--write-fixtures"]:
+        write_fixtures(fixtures_dir)
+        sys.exit(0)
+    if len(sys.argv) > 1:
+        # python recognizers.py <clips_dir> [google] [vosk] [fake]
+        clips_dir = sys.argv[1]
+        names = sys.argv[2:] or ["fake", "google", "vosk"]
+    else:
+        clips_dir, names = fixtures_dir, ["fake"]  # The committed synthetic clips; only the fake can read them
+    backends = []
+    for name in names:
+        try:
+            if name == "fake":
+                backends.append(FakeRecognizer.from_clips(clips_dir))
+            elif name == "vosk":
+                backends.append(VoskRecognizer())
+            elif name == "google":
+                backends.append(GoogleRecognizer())
+        except Exception as e:
+            print(f"Skipping {name}: {e}")
+    latency_harness(clips_dir, backends)
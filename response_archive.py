@@ -0,0 +1,239 @@
+"""Archive of the answers ai() has given, searchable by topic.
+
+Answers used to be saved as one small text file each under Jarvis_Responses/.
+They are now appended to a single SQLite database with an FTS5 full-text
+index, in batches: ai() hands an answer over and returns, and the batch is
+written in one transaction a moment later (or when it is full). "What did you
+tell me about black holes" is then a single indexed query. Existing
+Jarvis_Responses files are imported once.
+
+    python response_archive.py search black holes   # read old answers
+    python response_archive.py 1000000              # benchmark
+"""
+import datetime
+import os
+import random
+import re
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+# Words that say what kind of question it was, not what it was about
+_STOP_WORDS = {"what", "did", "you", "tell", "told", "say", "said", "me", "about", "the", "a", "an", "of", "to",
+               "on", "is", "was", "are", "and", "or", "in", "for", "jarvis", "please", "again", "remind"}
+
+_FILE_TIMESTAMP = re.compile(r"^(\d{8}_\d{6})_")
+
+
+def search_terms(text):
+    return [w for w in re.findall(r"\w+", text.lower()) if w not in _STOP_WORDS]
+
+
+class ResponseArchive:
+    """Append-only SQLite archive of prompts and answers with full-text search."""
+
+    def __init__(self, db_path="jarvis_responses.db", batch_size=32, flush_interval=2.0):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.RLock()
+        self.pending = []
+        self.timer = None
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # WAL keeps the file consistent; a crash may lose the last batch
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                id INTEGER PRIMARY KEY, created REAL, prompt TEXT, response TEXT, source TEXT);
+            CREATE TABLE IF NOT EXISTS imports (directory TEXT PRIMARY KEY, files INTEGER, imported REAL);
+        """)
+        try:
+            self.db.execute("CREATE VIRTUAL TABLE IF NOT EXISTS response_search USING fts5("
+                            "prompt, response, content='responses', content_rowid='id', tokenize='porter unicode61')")
+            self.fts = True
+        except sqlite3.OperationalError:
+            self.fts = False  # SQLite built without FTS5; searches fall back to LIKE
+        self.db.commit()
+
+    def count(self):
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] + len(self.pending)
+
+    def add(self, prompt, response, created=None, source="ai"):
+        """Queue an answer; it is written with the rest of its batch."""
+        with self.lock:
+            self.pending.append((created or time.time(), prompt, response, source))
+            if len(self.pending) >= self.batch_size:
+                self.flush()
+            elif self.timer is None and self.flush_interval > 0:
+                self.timer = threading.Timer(self.flush_interval, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Write queued answers now, in one transaction."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending:
+                return 0
+            rows, self.pending = self.pending, []
+            with self.db:
+                last = self.db.execute("SELECT COALESCE(MAX(id), 0) FROM responses").fetchone()[0]
+                self.db.executemany("INSERT INTO responses (created, prompt, response, source) VALUES (?, ?, ?, ?)",
+                                    rows)
+                if self.fts:
+                    self.db.execute("INSERT INTO response_search (rowid, prompt, response) "
+                                    "SELECT id, prompt, response FROM responses WHERE id > ?", (last,))
+            return len(rows)
+
+    def search(self, text, limit=3, sources=None):
+        """Matching (created, prompt, response) for a topic, best kind of match and newest first.
+
+        `sources` limits the search to answers added with one of those sources, e.g. one client's.
+        """
+        terms = search_terms(text)
+        if not terms:
+            return []
+        filter_sql, filter_args = "", []
+        if sources:
+            filter_sql = f" AND r.source IN ({', '.join('?' for _ in sources)})"
+            filter_args = list(sources)
+        with self.lock:
+            self.flush()  # Include answers given moments ago
+            if not self.fts:
+                where = " AND ".join("(r.prompt LIKE ? OR r.response LIKE ?)" for _ in terms)
+                args = [f"%{t}%" for t in terms for _ in range(2)]
+                return self.db.execute(f"SELECT r.created, r.prompt, r.response FROM responses r WHERE {where}"
+                                       f"{filter_sql} ORDER BY r.id DESC LIMIT ?", args + filter_args + [limit]
+                                       ).fetchall()
+            quoted = ['"' + t.replace('"', "") + '"*' for t in terms]
+            # The latest answer to a question about the topic; then any answer mentioning every word; then any word.
+            # Newest first rather than by relevance, so FTS5 can stop at the first few matches instead of ranking
+            # all of them.
+            for match in dict.fromkeys((f"prompt : ({' '.join(quoted)})", " ".join(quoted), " OR ".join(quoted))):
+                rows = self.db.execute(
+                    "SELECT r.created, r.prompt, r.response FROM response_search s JOIN responses r ON r.id = s.rowid "
+                    f"WHERE response_search MATCH ?{filter_sql} ORDER BY s.rowid DESC LIMIT ?",
+                    [match] + filter_args + [limit]).fetchall()
+                if rows:
+                    return rows
+            return []
+
+    def import_directory(self, directory="Jarvis_Responses"):
+        """Import the text files ai() used to write, once per directory. Returns how many were imported."""
+        directory = os.path.abspath(directory)
+        with self.lock:
+            if not os.path.isdir(directory) or self.db.execute(
+                    "SELECT 1 FROM imports WHERE directory = ?", (directory,)).fetchone():
+                return 0
+        imported = 0
+        for path in sorted(Path(directory).glob("*.txt")):
+            try:
+                text = path.read_text(encoding="utf-8", errors="replace")
+            except OSError:
+                continue
+            prompt, _, response = text.partition("\n\nResponse:\n")
+            prompt = prompt[len("Query: "):] if prompt.startswith("Query: ") else path.stem
+            stamp = _FILE_TIMESTAMP.match(path.name)
+            try:
+                created = datetime.datetime.strptime(stamp.group(1), "%Y%m%d_%H%M%S").timestamp() if stamp \
+                    else path.stat().st_mtime
+            except (OSError, ValueError):
+                created = None
+            self.add(prompt.strip(), (response or text).strip(), created, source="import")
+            imported += 1
+        with self.lock:
+            self.flush()
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO imports VALUES (?, ?, ?)", (directory, imported, time.time()))
+        if imported:
+            print(f"Imported {imported} saved responses from {directory} into {self.db_path}.")
+        return imported
+
+    def close(self):
+        with self.lock:
+            self.flush()
+            self.db.close()
+
+
+_WORDS = ("galaxy planet river ocean python network protein climate history economy music painting quantum "
+          "battery engine theory language algorithm volcano medicine energy democracy orbit cell memory "
+          "light gravity storm forest desert bridge poetry chess coffee vaccine robot satellite").split()
+_FILLER = "the a of and to in is that it for as with was on by this are from at be".split()
+
+
+def _fake_answer(rng, words=60):
+    return " ".join(rng.choice(_WORDS) if rng.random() < 0.3 else rng.choice(_FILLER) for _ in range(words))
+
+
+def benchmark(entries=1000000, file_sample=5000, queries=200):
+    """Insert and search throughput at `entries` answers, vs. one text file per answer."""
+    rng = random.Random(7)
+    root = tempfile.mkdtemp(prefix="jarvis_archive_")
+    try:
+        # The old way: a file per answer, searched by reading every file
+        folder = os.path.join(root, "Jarvis_Responses")
+        started = time.perf_counter()
+        for i in range(file_sample):
+            if not os.path.exists(folder):
+                os.mkdir(folder)
+            with open(os.path.join(folder, f"20240101_{i:06d}_question_{i}.txt"), "w") as f:
+                f.write(f"Query: tell me about {rng.choice(_WORDS)}\n\nResponse:\n{_fake_answer(rng)}")
+        per_file = (time.perf_counter() - started) / file_sample
+        disk = sum(os.stat(os.path.join(folder, n)).st_blocks * 512 for n in os.listdir(folder)) / file_sample
+        started = time.perf_counter()
+        hits = 0
+        for name in os.listdir(folder):
+            with open(os.path.join(folder, name)) as f:
+                hits += "quantum" in f.read()
+        scan = time.perf_counter() - started
+        print(f"One file per answer: {per_file * 1e6:.0f} us per answer, {disk / 1024:.1f} KB on disk each; "
+              f"searching {file_sample} files takes {scan * 1000:.0f} ms "
+              f"(~{scan * entries / file_sample:.0f} s at {entries})")
+
+        archive = ResponseArchive(os.path.join(root, "archive.db"), batch_size=1000, flush_interval=0)
+        archive.import_directory(folder)
+        started = time.perf_counter()
+        for i in range(entries - file_sample):
+            archive.add(f"tell me about {rng.choice(_WORDS)} and {rng.choice(_WORDS)}", _fake_answer(rng),
+                        created=1.7e9 + i)
+        archive.flush()
+        elapsed = time.perf_counter() - started
+        size = sum(os.path.getsize(p) for p in Path(root).glob("archive.db*"))
+        print(f"Archive: {entries - file_sample} answers in {elapsed:.1f} s ({(entries - file_sample) / elapsed:.0f}/s), "
+              f"{size / entries:.0f} bytes each on disk")
+
+        timings = []
+        found = 0
+        for _ in range(queries):
+            topic = f"what did you tell me about {rng.choice(_WORDS)} {rng.choice(_WORDS)}"
+            started = time.perf_counter()
+            found += bool(archive.search(topic, limit=1))
+            timings.append(time.perf_counter() - started)
+        timings.sort()
+        print(f"Search at {archive.count()} answers: p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+              f"p95 {timings[int(len(timings) * 0.95)] * 1000:.2f} ms, {found}/{queries} found")
+
+        # What ai() sees: add() returns at once, the batch is written later
+        archive.batch_size, archive.flush_interval = 32, 2.0
+        started = time.perf_counter()
+        archive.add("what is a black hole", _fake_answer(rng))
+        print(f"ai() waits {(time.perf_counter() - started) * 1e6:.0f} us to archive an answer")
+        archive.close()
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 2 and sys.argv[1] == "search":
+        archive = ResponseArchive()
+        for created, prompt, response in archive.search(" ".join(sys.argv[2:]), limit=5):
+            print(f"[{datetime.datetime.fromtimestamp(created):%Y-%m-%d %H:%M}] {prompt}\n{response}\n")
+    else:
+        benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,224 @@
+"""Local cache of OpenAI answers for chat() and ai().
+
+Answers are stored in SQLite keyed by the normalized prompt, the system prompt
+and the model. Lookups try the exact key and, when a similarity is set, a
+near-duplicate search over character trigrams, so "what is the capital of
+peru" can reuse the answer to "what's the capital of peru?". A near
+duplicate must also have the same content words and numbers in the same
+order: "convert celsius to fahrenheit" and "convert fahrenheit to celsius"
+share almost every trigram but not their answer. Entries expire after a
+TTL and the least recently used ones are evicted past a size limit.
+"""
+import hashlib
+import sqlite3
+import sys
+import threading
+import time
+from collections import defaultdict
+
+import intents
+
+_CONTRACTIONS = {"what's": "what is", "who's": "who is", "how's": "how is", "where's": "where is",
+                 "it's": "it is", "that's": "that is", "i'm": "i am", "can't": "cannot", "don't": "do not"}
+_FILLER = {"jarvis", "please", "hey", "ok", "okay", "um"}
+# Words a near duplicate may add or drop without changing the question
+_STOPWORDS = {"a", "an", "the", "is", "are", "was", "of", "for", "me", "about", "tell", "can", "could", "you",
+              "what", "do", "does", "some", "this", "that", "it", "i", "am", "my", "your"}
+
+
+def normalize(prompt):
+    """Routing normalization plus expanded contractions and no filler words, so trivially different phrasings share a key."""
+    words = (_CONTRACTIONS.get(word, word) for word in intents.normalize(prompt).split())
+    return " ".join(word for word in words if word not in _FILLER)
+
+
+def content_words(text):
+    """The words that decide what is being asked, numbers included, in order."""
+    return tuple(word for word in text.split() if word not in _STOPWORDS)
+
+
+def trigrams(text):
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class ResponseCache:
+    """SQLite-backed answer cache with TTL, LRU eviction and trigram near-duplicate matching."""
+
+    def __init__(self, db_path="jarvis_cache.db", ttl=24 * 3600, max_entries=1000, similarity=0.0, flush_interval=30.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.similarity = similarity  # Minimum trigram Jaccard for a near-duplicate hit; 0 disables it
+        # Hits only update last_used in memory; written out every flush_interval seconds and before eviction
+        self.flush_interval = flush_interval
+        self.touched = {}
+        self.flushed = time.monotonic()
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(db_path, check_same_thread=False)
+        self.db.execute("""CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, scope TEXT, prompt TEXT, response TEXT, created REAL, last_used REAL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responses_last_used ON responses(last_used)")
+        self.db.commit()
+
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+        # Near-duplicate candidates by (model/system prompt scope, content words), with their trigrams
+        self.grams = {}
+        self.candidates = defaultdict(set)
+        self._expire()
+        for key, scope, prompt in self.db.execute("SELECT key, scope, prompt FROM responses"):
+            self._index(key, scope, prompt)
+
+    @staticmethod
+    def scope(model, system):
+        return hashlib.sha1(f"{model}\0{system}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def make_key(scope, prompt):
+        return hashlib.sha1(f"{scope}\0{prompt}".encode("utf-8")).hexdigest()
+
+    def get(self, prompt, system, model):
+        """Return a cached answer for the prompt, or None."""
+        scope = self.scope(model, system)
+        prompt = normalize(prompt)
+        key = self.make_key(scope, prompt)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                self.hits += 1
+            else:
+                key = self._nearest(scope, prompt)
+                row = key and self.db.execute("SELECT response, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if not row or now - row[1] >= self.ttl:
+                    self.misses += 1
+                    return None
+                self.near_hits += 1
+            self.touched[key] = now
+            if time.monotonic() - self.flushed >= self.flush_interval:
+                self._flush_locked()
+            return row[0]
+
+    def flush(self):
+        """Write the last_used times of recent hits to the database."""
+        with self.lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if self.touched:
+            self.db.executemany("UPDATE responses SET last_used = ? WHERE key = ?",
+                                [(used, key) for key, used in self.touched.items()])
+            self.db.commit()
+            self.touched.clear()
+        self.flushed = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            self._flush_locked()
+            self.db.close()
+
+    def put(self, prompt, system, model, response):
+        if not response:
+            return
+        scope = self.scope(model, system)
+        prompt = normalize(prompt)
+        key = self.make_key(scope, prompt)
+        now = time.time()
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                            (key, scope, prompt, response, now, now))
+            self._index(key, scope, prompt)
+            self.touched.pop(key, None)
+            count = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            if count > self.max_entries:
+                self._flush_locked()  # Evict by up-to-date recency
+                evicted = self.db.execute("SELECT key FROM responses ORDER BY last_used LIMIT ?",
+                                          (count - self.max_entries,)).fetchall()
+                for (old,) in evicted:
+                    self._unindex(old)
+                self.db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+            self.db.commit()
+
+    def _nearest(self, scope, prompt):
+        if not self.similarity:
+            return None
+        grams = trigrams(prompt)
+        best, best_score = None, self.similarity
+        for key in self.candidates.get((scope, content_words(prompt)), ()):
+            other = self.grams[key][1]
+            common = len(grams & other)
+            score = common / (len(grams) + len(other) - common)
+            if score >= best_score:
+                best, best_score = key, score
+        return best
+
+    def _index(self, key, scope, prompt):
+        if not self.similarity:
+            return
+        self._unindex(key)
+        candidates = (scope, content_words(prompt))
+        self.grams[key] = (candidates, trigrams(prompt))
+        self.candidates[candidates].add(key)
+
+    def _unindex(self, key):
+        entry = self.grams.pop(key, None)
+        if entry:
+            candidates = entry[0]
+            self.candidates[candidates].discard(key)
+            if not self.candidates[candidates]:
+                del self.candidates[candidates]
+
+    def _expire(self):
+        with self.lock:
+            self.db.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl,))
+            self.db.commit()
+
+    def summary(self):
+        """One-line session report of hits and API calls saved."""
+        lookups = self.hits + self.near_hits + self.misses
+        saved = self.hits + self.near_hits
+        ratio = saved / lookups if lookups else 0.0
+        return (f"Response cache: {saved}/{lookups} hits ({ratio:.0%}, {self.near_hits} near-duplicate), "
+                f"{saved} API calls saved, {self.bypassed} bypassed")
+
+
+def benchmark(entries=1000, lookups=2000):
+    """Lookup latency and hit ratio for repeated, rephrased and new prompts."""
+    import os
+    import random
+    import tempfile
+
+    rng = random.Random(3)
+    vocabulary = ["quantum", "computing", "roman", "empire", "black", "holes", "machine", "learning", "jazz",
+                  "history", "volcanoes", "photosynthesis", "cricket", "rules", "bitcoin", "mining", "dna",
+                  "sequencing", "climate", "change", "french", "revolution", "neural", "networks", "tides"]
+    topics = sorted({" ".join(rng.sample(vocabulary, 3)) for _ in range(entries * 2)})[:entries]
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ResponseCache(os.path.join(tmp, "cache.db"), max_entries=entries, similarity=0.8)
+        for topic in topics:
+            cache.put(f"what is {topic} using artificial intelligence", "system", "gpt-3.5-turbo", f"About {topic}.")
+        variants = [lambda t: f"What is {t} using artificial intelligence?",  # Repeat
+                    lambda t: f"what's {t} using artificial intelligence",  # Contraction
+                    lambda t: f"Jarvis, what is the {t} using artificial intelligence",  # Near duplicate
+                    lambda t: f"write a poem about {t} using artificial intelligence",  # Different question
+                    lambda t: f"what is {' '.join(reversed(t.split()))} using artificial intelligence"]  # Reordered
+        started = time.perf_counter()
+        for _ in range(lookups):
+            cache.get(rng.choice(variants)(rng.choice(topics)), "system", "gpt-3.5-turbo")
+        elapsed = time.perf_counter() - started
+        print(f"{lookups} lookups over {len(topics)} entries: {elapsed / lookups * 1000:.3f} ms each")
+        print(cache.summary())
+        cache.put("explain how to convert celsius to fahrenheit using artificial intelligence", "system",
+                  "gpt-3.5-turbo", "Multiply C by 9/5 and add 32.")
+        cache.put("population of peru in 2020", "system", "gpt-3.5-turbo", "About 33 million.")
+        for question in ("explain how to convert fahrenheit to celsius using artificial intelligence",
+                         "population of peru in 2010"):
+            assert cache.get(question, "system", "gpt-3.5-turbo") is None, f"{question!r} reused another answer"
+        cache.close()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000)
@@ -0,0 +1,171 @@
+"""Listening state of the assistant, shared safely between threads.
+
+The assistant is in exactly one state at a time:
+
+    manual     -- listening for commands directly
+    waiting    -- continuous mode, waiting for the wake word
+    active     -- continuous mode, handling commands after the wake word
+    stopped    -- shutting down
+
+State changes go through transition(), under one lock, and wake every thread
+waiting on them. Each mode has one long-lived worker thread that sleeps while
+its mode is inactive, so switching modes never starts another thread, and a
+worker only begins once the previous mode's worker has let go of the
+microphone.
+"""
+import sys
+import threading
+import time
+
+MANUAL = "manual"
+WAITING = "waiting"
+ACTIVE = "active"
+STOPPED = "stopped"
+
+_TRANSITIONS = {
+    MANUAL: {WAITING, STOPPED},
+    WAITING: {MANUAL, ACTIVE, STOPPED},
+    ACTIVE: {MANUAL, WAITING, STOPPED},
+    STOPPED: set(),
+}
+
+_MODES = {MANUAL: "manual", WAITING: "continuous", ACTIVE: "continuous", STOPPED: None}
+
+
+class AssistantRuntime:
+    """State machine for the listening modes, with one worker thread per mode."""
+
+    def __init__(self, mode="manual"):
+        self.state = WAITING if mode == "continuous" else MANUAL
+        self.changed = threading.Condition()
+        self.workers = {}  # mode -> (work function, thread)
+        self.running_mode = None  # Mode whose work function is running right now
+        self.transitions = 0
+
+    @property
+    def mode(self):
+        return _MODES[self.state]
+
+    def is_mode(self, mode):
+        return self.mode == mode
+
+    def transition(self, state):
+        """Move to `state`. Returns False if already there or the change isn't allowed from the current state."""
+        with self.changed:
+            if state == self.state or state not in _TRANSITIONS[self.state]:
+                return False
+            self.state = state
+            self.transitions += 1
+            self.changed.notify_all()
+            return True
+
+    def set_mode(self, mode):
+        """Switch between "manual" and "continuous". Returns False if already in that mode."""
+        with self.changed:
+            if self.mode == mode:
+                return False
+            return self.transition(WAITING if mode == "continuous" else MANUAL)
+
+    def stop(self):
+        self.transition(STOPPED)
+
+    def wait_until_stopped(self, timeout=None):
+        with self.changed:
+            return self.changed.wait_for(lambda: self.state == STOPPED, timeout)
+
+    def wait_for_change(self, state, timeout=None):
+        """Block until the state is no longer `state`. Returns the new state."""
+        with self.changed:
+            self.changed.wait_for(lambda: self.state != state, timeout)
+            return self.state
+
+    def add_worker(self, mode, work):
+        """Register `work()` to run whenever `mode` is active; it should return once the mode changes."""
+        with self.changed:
+            if mode in self.workers:
+                raise ValueError(f"a worker for {mode} mode is already registered")
+            thread = threading.Thread(target=self._serve, args=(mode, work), name=f"jarvis-{mode}", daemon=True)
+            self.workers[mode] = (work, thread)
+        thread.start()
+
+    def _serve(self, mode, work):
+        while True:
+            with self.changed:
+                # Wait for our mode, and for the previous mode's worker to finish
+                self.changed.wait_for(lambda: self.state == STOPPED or
+                                      (self.mode == mode and self.running_mode is None))
+                if self.state == STOPPED:
+                    return
+                self.running_mode = mode
+            try:
+                work()
+            except Exception as e:
+                print(f"Error in {mode} mode: {e}")
+            finally:
+                with self.changed:
+                    self.running_mode = None
+                    self.changed.notify_all()
+            if self.is_mode(mode):
+                # The work returned without a mode change (an error); don't spin
+                with self.changed:
+                    self.changed.wait(timeout=1)
+
+
+def stress_test(toggles=5000):
+    """Toggle modes from several threads and check the thread count stays bounded."""
+    runtime = AssistantRuntime()
+    runs = {"manual": 0, "continuous": 0}
+    overlaps = 0
+    active = set()
+    lock = threading.Lock()
+
+    def worker(mode):
+        def work():
+            nonlocal overlaps
+            with lock:
+                runs[mode] += 1
+                if active:
+                    overlaps += 1
+                active.add(mode)
+            try:
+                while runtime.is_mode(mode):
+                    if mode == "continuous" and runtime.state == WAITING and runs[mode] % 3 == 0:
+                        runtime.transition(ACTIVE)  # The wake word was heard
+                    runtime.wait_for_change(runtime.state, timeout=0.05)
+            finally:
+                with lock:
+                    active.discard(mode)
+        return work
+
+    runtime.add_worker("manual", worker("manual"))
+    runtime.add_worker("continuous", worker("continuous"))
+
+    def count_threads():
+        return sum(1 for thread in threading.enumerate() if not thread.name.startswith("toggler"))
+
+    baseline = count_threads()
+    peak = baseline
+
+    def toggler(offset):
+        nonlocal peak
+        for i in range(toggles // 4):
+            runtime.set_mode("continuous" if (i + offset) % 2 else "manual")
+            peak = max(peak, count_threads())
+            time.sleep(0.0002)  # Give the workers a chance to pick the mode up
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=toggler, args=(i,), name=f"toggler-{i}") for i in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    runtime.stop()
+    print(f"{toggles} mode toggles from 4 threads in {elapsed:.2f}s: {runtime.transitions} transitions, "
+          f"worker runs {runs}, threads {baseline} -> peak {peak}, overlapping workers {overlaps}")
+    assert peak <= baseline, "mode changes started extra threads"
+    assert overlaps == 0, "two mode workers ran at once"
+
+
+if __name__ == "__main__":
+    stress_test(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,410 @@
+"""Serve Jarvis to several clients at once over HTTP.
+
+One process holds the OpenAI client, HTTP pool, answer cache and archive;
+each client gets a session with its own name, settings, conversation and
+recall history (see sessions.py). Commands from different sessions run
+concurrently, up to `workers` at a time; commands within a session run in
+order. Replies come back as text for the client to speak, and pages to open
+come back as actions for the client to perform.
+
+There is no authentication: "user" is only a label. What a client can recall
+is keyed on the "recall_key" returned when its first session is created;
+sending it back when creating later sessions keeps that history, and nobody
+without it can read it.
+
+    POST   /sessions                {"user": "tony", "settings": {"user_name": "Tony"}, "recall_key": "..."}
+    POST   /sessions/<id>/text      {"text": "what's the weather in london"}
+    POST   /sessions/<id>/audio     a mono 16-bit WAV file
+    DELETE /sessions/<id>
+    GET    /stats
+
+    python server.py serve --port 8765
+    python server.py bench --sessions 1,4,16,64      # load test with fake services
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import wave
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipeline import percentile
+from sessions import Session, active
+
+# Settings a client may set for its own session
+CLIENT_SETTINGS = {"user_name", "favorite_sites", "stream_responses", "context_token_budget", "summary_trigger_tokens",
+                   "cache_bypass_intents"}
+
+_SESSION_PATH = re.compile(r"^/sessions/([\w-]+)(?:/(text|audio))?$")
+_RECALL_KEY = re.compile(r"^[\w-]{22,}$")  # As issued by secrets.token_urlsafe(16); guessable keys are refused
+
+
+class SessionLimitError(Exception):
+    pass
+
+
+class SessionManager:
+    """Creates, runs and expires client sessions on top of the shared Jarvis module."""
+
+    def __init__(self, jarvis, max_sessions=200, idle_timeout=1800, workers=32):
+        self.jarvis = jarvis
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(workers)  # Commands running at once, across sessions
+        self.latencies = deque(maxlen=10000)
+        self.commands = 0
+        self.errors = 0
+
+    def create(self, user=None, overrides=None, recall_key=None):
+        if overrides is not None and not isinstance(overrides, dict):
+            raise ValueError("settings must be a JSON object")
+        unknown = set(overrides or {}) - CLIENT_SETTINGS
+        if unknown:
+            raise ValueError(f"Unknown or shared settings: {', '.join(sorted(unknown))}")
+        if recall_key is not None and not _RECALL_KEY.match(str(recall_key)):
+            raise ValueError("Invalid recall_key; leave it out to be issued a new one")
+        self.expire()
+        session = Session(self.jarvis.get_settings(), overrides, user=user, recall_key=recall_key)
+        with self.lock:
+            if len(self.sessions) >= self.max_sessions:
+                raise SessionLimitError(f"Already serving {self.max_sessions} sessions")
+            self.sessions[session.id] = session
+        if "favorite_sites" in session.settings.overrides:
+            with active(session):
+                self.jarvis.update_site_phrases()
+        return session
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def close(self, session_id):
+        with self.lock:
+            return self.sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        """Drop sessions that have been idle for longer than idle_timeout."""
+        cutoff = time.monotonic() - self.idle_timeout
+        with self.lock:
+            for session_id in [s.id for s in self.sessions.values() if s.last_active < cutoff]:
+                del self.sessions[session_id]
+
+    def transcribe(self, wav_bytes):
+        """The transcript of an uploaded WAV file, or None if nothing was understood."""
+        with wave.open(io.BytesIO(wav_bytes), "rb") as f:
+            if f.getnchannels() != 1 or f.getsampwidth() != 2:
+                raise ValueError("Send mono 16-bit WAV audio")
+            rate, width, audio = f.getframerate(), f.getsampwidth(), f.readframes(f.getnframes())
+        recognition = self.jarvis.get_speech_backend().session(rate, width)
+        chunk = 1024 * width
+        try:
+            for start in range(0, len(audio), chunk):
+                recognition.feed(audio[start:start + chunk])
+            return recognition.finish()
+        except Exception as e:
+            print(f"Could not recognize audio: {e}")
+            return None
+
+    def run(self, session, text=None, audio=None):
+        """Handle one command as `session`; returns what to send back to the client."""
+        with session.lock, self.slots, active(session):
+            started = time.perf_counter()
+            session.last_active = time.monotonic()
+            heard = text if audio is None else self.transcribe(audio)
+            intent = None
+            try:
+                if heard:
+                    intent = self.jarvis.current_router().route(heard)
+                    self.jarvis.handle_command(heard, intent)
+                else:
+                    self.jarvis.say("Sorry, I didn't catch that.")
+            except Exception as e:
+                with self.lock:
+                    self.errors += 1
+                print(f"Error in session {session.id}: {e}")
+                self.jarvis.say("Something went wrong while answering that.")
+            replies, actions = session.drain()
+            elapsed = time.perf_counter() - started
+            session.commands += 1
+            with self.lock:  # Shared by every session; session.lock only orders one client's commands
+                self.commands += 1
+            self.latencies.append(elapsed)
+        if session.ended:
+            self.close(session.id)
+        return {"heard": heard, "intent": intent, "replies": replies, "actions": actions, "ended": session.ended,
+                "ms": round(elapsed * 1000, 1)}
+
+    def stats(self):
+        latencies = list(self.latencies)
+        with self.lock:
+            count, commands, errors = len(self.sessions), self.commands, self.errors
+        return {"sessions": count, "commands": commands, "errors": errors,
+                "latency_ms": {f"p{int(q * 100)}": percentile(latencies, q) * 1000 for q in (0.5, 0.95, 0.99)}}
+
+
+class JarvisHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so a client reuses its connection
+    manager = None
+
+    def send_json(self, status, body=None):
+        data = json.dumps(body).encode() if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length") or 0))
+
+    def read_json(self):
+        """The request's JSON object; raises ValueError for anything else."""
+        body = self.read_body()
+        data = json.loads(body) if body else {}
+        if not isinstance(data, dict):
+            raise ValueError("Send a JSON object")
+        return data
+
+    def do_GET(self):
+        if self.path == "/stats":
+            self.send_json(200, self.manager.stats())
+        else:
+            self.send_json(404, {"error": "Not found"})
+
+    def do_POST(self):
+        try:
+            if self.path == "/sessions":
+                body = self.read_json()
+                session = self.manager.create(body.get("user"), body.get("settings"), body.get("recall_key"))
+                self.send_json(201, {"session": session.id, "user_name": session.settings["user_name"],
+                                     "recall_key": session.recall_key})
+                return
+            match = _SESSION_PATH.match(self.path)
+            session = self.manager.get(match.group(1)) if match and match.group(2) else None
+            if session is None:
+                self.read_body()
+                self.send_json(404, {"error": "No such session"})
+            elif match.group(2) == "text":
+                text = str(self.read_json().get("text", "")).strip()
+                self.send_json(200, self.manager.run(session, text=text))
+            else:
+                self.send_json(200, self.manager.run(session, audio=self.read_body()))
+        except SessionLimitError as e:
+            self.send_json(503, {"error": str(e)})
+        except (ValueError, wave.Error, EOFError) as e:
+            self.send_json(400, {"error": str(e)})
+
+    def do_DELETE(self):
+        match = _SESSION_PATH.match(self.path)
+        if match and not match.group(2) and self.manager.close(match.group(1)):
+            self.send_json(204)
+        else:
+            self.send_json(404, {"error": "No such session"})
+
+    def log_message(self, *args):
+        pass
+
+
+class JarvisServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Clients connecting at once; the default of 5 resets connections under load
+
+
+def start_server(manager, host="127.0.0.1", port=8765):
+    """Serve `manager` from a background thread; returns (server, base_url)."""
+    handler = type("Handler", (JarvisHandler,), {"manager": manager})
+    server = JarvisServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="jarvis-server", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def serve(args):
+    import main as jarvis
+
+    manager = SessionManager(jarvis, args.max_sessions, args.idle_timeout, args.workers)
+    server, url = start_server(manager, args.host, args.port)
+    jarvis.get_settings().on_change(jarvis.apply_settings)
+    jarvis.get_settings().watch()
+    threading.Thread(target=jarvis.import_saved_responses, name="jarvis-archive-import", daemon=True).start()
+    print(f"Jarvis is serving clients at {url}")
+    try:
+        while True:
+            time.sleep(60)
+            manager.expire()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(manager.stats()))
+    return 0
+
+
+# The load test's command mix, minus what only works on the server's own computer
+LOAD_SCRIPT = ["what time is it", "what's the weather in london", "tell me the news", "open youtube", "hello jarvis",
+               "what is quantum computing", "explain black holes simply", "call me Tony",
+               "write a poem about rivers using artificial intelligence", "what did you tell me about rivers",
+               "search for python tutorials", "tell me a joke"]
+
+
+def script_clips(sample_rate=16000):
+    """{command: (raw int16 audio, WAV file)} for LOAD_SCRIPT, as synthetic speech."""
+    from harness import speak_transcript
+
+    clips = {}
+    for i, text in enumerate(LOAD_SCRIPT):
+        audio = speak_transcript(text, sample_rate, seed=i)
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(audio)
+        clips[text] = (audio, buffer.getvalue())
+    return clips
+
+
+def load_client(url, index, deadline, think, audio_share, clips, results):
+    """One simulated user: a session, then commands with `think` seconds between them until `deadline`."""
+    import requests
+
+    http = requests.Session()
+    try:
+        created = http.post(f"{url}/sessions", json={"user": f"user{index}"}, timeout=30)
+    except requests.RequestException as e:
+        results.append({"error": str(e)})
+        return
+    if created.status_code != 201:
+        results.append({"error": created.status_code})
+        return
+    session = created.json()["session"]
+    step = index  # Users start at different points of the script
+    while time.perf_counter() < deadline:
+        text = LOAD_SCRIPT[step % len(LOAD_SCRIPT)]
+        step += 1
+        started = time.perf_counter()
+        try:
+            if (step * 7919) % 100 < audio_share * 100:
+                response = http.post(f"{url}/sessions/{session}/audio", data=clips[text][1], timeout=60)
+            else:
+                response = http.post(f"{url}/sessions/{session}/text", json={"text": text}, timeout=60)
+        except requests.RequestException as e:
+            results.append({"error": str(e)})
+            continue
+        elapsed = time.perf_counter() - started
+        body = response.json() if response.status_code == 200 else {}
+        results.append({"ms": elapsed * 1000, "ok": response.status_code == 200 and body.get("heard") == text})
+        time.sleep(think)
+    try:
+        http.delete(f"{url}/sessions/{session}", timeout=10)
+    except requests.RequestException:
+        pass
+
+
+def load_test(url, levels, duration=5.0, think=0.5, audio_share=0.2, slo_ms=2500):
+    """Step up the number of concurrent sessions and report throughput and latency at each level."""
+    sustained = 0
+    report = []
+    clips = script_clips() if audio_share > 0 else {}
+    for sessions in levels:
+        results = []
+        deadline = time.perf_counter() + duration
+        threads = [threading.Thread(target=load_client, args=(url, i, deadline, think, audio_share, clips, results),
+                                    daemon=True) for i in range(sessions)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        latencies = [r["ms"] for r in results if "ms" in r]
+        failed = sum(not r.get("ok") for r in results)
+        level = {"sessions": sessions, "commands": len(latencies), "commands_per_second": len(latencies) / elapsed,
+                 "failed": failed, **{f"p{int(q * 100)}_ms": percentile(latencies, q) for q in (0.5, 0.95, 0.99)}}
+        level["within_slo"] = not failed and level["p95_ms"] <= slo_ms
+        if level["within_slo"]:
+            sustained = sessions
+        report.append(level)
+        print(f"{sessions:>4} sessions: {level['commands']:>5} commands, {level['commands_per_second']:6.1f}/s, "
+              f"p50 {level['p50_ms']:6.0f} ms, p95 {level['p95_ms']:6.0f} ms, p99 {level['p99_ms']:6.0f} ms, "
+              f"{failed} failed{'' if level['within_slo'] else '  <- over the SLO'}")
+    print(f"Sessions sustained with p95 under {slo_ms:.0f} ms: {sustained}")
+    return sustained, report
+
+
+def bench(args):
+    levels = [int(n) for n in args.sessions.split(",")]
+    if args.url:
+        load_test(args.url, levels, args.duration, args.think, args.audio_share, args.slo_ms)
+        return 0
+
+    from harness import Harness
+    import recognizers
+
+    with tempfile.TemporaryDirectory(prefix="jarvis_server_") as workdir:
+        cwd = os.getcwd()
+        try:
+            harness = Harness(workdir, openai_latency=args.openai_latency, token_delay=args.token_delay,
+                              http_latency=args.http_latency,
+                              settings={"tracing": False, "response_cache": args.response_cache,
+                                        # The fake API has no rate limits; a real account's are shared by all sessions
+                                        "api_requests_per_minute": 10 ** 6, "api_tokens_per_minute": 10 ** 9})
+            jarvis = harness.main
+            # Uploaded clips are recognized by their content, since sessions upload them concurrently
+            jarvis.speech_backend = recognizers.FakeRecognizer(
+                {hashlib.sha1(audio).hexdigest(): text for text, (audio, _) in script_clips().items()},
+                latency=args.stt_latency)
+            manager = SessionManager(jarvis, max_sessions=max(levels) * 2, workers=args.workers)
+            server, url = start_server(manager)
+            print(f"Fake services: OpenAI {args.openai_latency * 1000:.0f} ms + {args.token_delay * 1000:.0f} ms/token, "
+                  f"HTTP {args.http_latency * 1000:.0f} ms, STT {args.stt_latency * 1000:.0f} ms; "
+                  f"{args.workers} workers, {args.think:g}s think time")
+            sustained, _ = load_test(url, levels, args.duration, args.think, args.audio_share, args.slo_ms)
+            server.shutdown()
+            harness.close()
+        finally:
+            os.chdir(cwd)
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve Jarvis to several clients, or load test the server.")
+    commands = parser.add_subparsers(dest="command")
+    serve_parser = commands.add_parser("serve", help="serve clients over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--max-sessions", type=int, default=200)
+    serve_parser.add_argument("--idle-timeout", type=float, default=1800, help="seconds before an idle session ends")
+    serve_parser.add_argument("--workers", type=int, default=32, help="commands answered at once")
+    bench_parser = commands.add_parser("bench", help="load test with simulated users")
+    bench_parser.add_argument("--url", help="load test a running server instead of one with fake services")
+    bench_parser.add_argument("--sessions", default="1,4,16,64,128", help="concurrent sessions at each step")
+    bench_parser.add_argument("--duration", type=float, default=5.0, help="seconds per step")
+    bench_parser.add_argument("--think", type=float, default=0.5, help="seconds a user waits between commands")
+    bench_parser.add_argument("--audio-share", type=float, default=0.2, help="fraction of commands sent as synthetic speech (only the fake recognizer understands it)")
+    bench_parser.add_argument("--slo-ms", type=float, default=2500, help="p95 latency a step must stay under")
+    bench_parser.add_argument("--workers", type=int, default=32)
+    bench_parser.add_argument("--response-cache", action="store_true",
+                              help="share cached answers between the simulated users, who all ask the same things")
+    bench_parser.add_argument("--openai-latency", type=float, default=0.3)
+    bench_parser.add_argument("--token-delay", type=float, default=0.01)
+    bench_parser.add_argument("--http-latency", type=float, default=0.05)
+    bench_parser.add_argument("--stt-latency", type=float, default=0.05)
+    args = parser.parse_args(argv)
+    if args.command == "bench":
+        return bench(args)
+    if args.command is None:
+        args = parser.parse_args(["serve"] + (argv or []))
+    return serve(args)
+
+
+if __name__ == "__main__":
+    code = main()
+    sys.stdout.flush()
+    os._exit(code)  # Don't wait for the speech and background threads
@@ -0,0 +1,104 @@
+"""Per-client state for serving several users from one Jarvis process.
+
+main.py keeps one user's name, conversation and settings in module globals.
+In server mode each command runs with its client's Session set in a context
+variable, and main.py's accessors (user_name(), current_settings(),
+current_conversation(), current_router()) return the session's state when
+there is one and the globals otherwise. Everything expensive - the OpenAI
+client, the HTTP pool, the answer cache and the archive - stays shared.
+"""
+import contextlib
+import contextvars
+import secrets
+import threading
+import time
+from collections.abc import MutableMapping
+
+from conversation import Conversation
+
+_current = contextvars.ContextVar("session", default=None)
+
+
+class SessionSettings(MutableMapping):
+    """A client's settings: its own values over the shared settings, which it never writes to."""
+
+    def __init__(self, shared, overrides=None):
+        self.shared = shared
+        self.overrides = dict(overrides or {})
+        self.lock = threading.RLock()
+
+    def __getitem__(self, key):
+        with self.lock:
+            if key in self.overrides:
+                return self.overrides[key]
+        return self.shared[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.overrides[key] = value
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.overrides[key]
+
+    def __iter__(self):
+        with self.lock:
+            return iter(set(self.shared) | set(self.overrides))
+
+    def __len__(self):
+        return len(set(self.shared) | set(self.overrides))
+
+    def save(self):
+        pass  # A client's settings last as long as its session
+
+
+class Session:
+    """One client: its conversation, settings and the replies to its current command."""
+
+    def __init__(self, shared_settings, overrides=None, user=None, max_messages=200, recall_key=None,
+                 keep_answers=True):
+        self.id = secrets.token_urlsafe(12)
+        self.user = user or self.id  # Only a label; clients are not authenticated
+        # Recall only finds answers archived under this key. The server issues it and
+        # the client keeps it to recall across sessions, so it has to stay secret: a
+        # client-chosen name would let anyone read another user's answers.
+        self.recall_key = recall_key or secrets.token_urlsafe(16)
+        self.archive_source = f"client:{self.recall_key}"
+        self.keep_answers = keep_answers  # False: use neither the answer cache nor the archive
+        self.settings = SessionSettings(shared_settings, overrides)
+        self.conversation = Conversation(max_messages)
+        self.router = None  # Its own intent router once it has favorite sites of its own
+        self.lock = threading.Lock()  # One command at a time, in order
+        self.replies = []
+        self.actions = []
+        self.ended = False
+        self.commands = 0
+        self.created = self.last_active = time.monotonic()
+
+    def reply(self, text):
+        self.replies.append(text)
+
+    def act(self, action, **details):
+        """Something for the client to do on its side, like opening a page in its browser."""
+        self.actions.append(dict(details, action=action))
+
+    def drain(self):
+        """The replies and actions of the command that just ran."""
+        replies, actions = self.replies, self.actions
+        self.replies, self.actions = [], []
+        return replies, actions
+
+
+def current():
+    """The session whose command this thread is running, or None outside server mode."""
+    return _current.get()
+
+
+@contextlib.contextmanager
+def active(session):
+    """Run a `with` block as `session`."""
+    token = _current.set(session)
+    try:
+        yield session
+    finally:
+        _current.reset(token)
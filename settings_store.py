@@ -0,0 +1,293 @@
+"""Settings for Jarvis, kept in memory and persisted safely.
+
+The settings file is merged over the defaults on load, so files written by
+older versions gain new keys instead of failing. Changes are written back in
+batches, a moment after the first change, through a temporary file that
+replaces the old one atomically: a crash leaves either the old or the new
+file, never half of one. Edits made to the file by hand are picked up while
+Jarvis is running, and merged with changes still waiting to be saved: keys
+edited in the file take the file's value, the rest keep ours.
+"""
+import copy
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections.abc import MutableMapping
+from pathlib import Path
+
+
+def atomic_write(path, text):
+    """Write `text` to `path` so readers see either the old or the new content."""
+    path = Path(path)
+    fd, temp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent or ".")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.unlink(temp)
+        except OSError:
+            pass
+        raise
+
+
+class SettingsStore(MutableMapping):
+    """Dict-like settings with defaults, debounced atomic saves and hot reload.
+
+    Assigning a key schedules a save. Nested values (like favorite_sites)
+    changed in place need an explicit save(). Listeners registered with
+    on_change(callback) get the set of changed keys after an external edit
+    has been reloaded.
+    """
+
+    def __init__(self, path="jarvis_settings.json", defaults=None, save_delay=1.0, watch_interval=2.0):
+        self.path = Path(path)
+        self.defaults = defaults or {}
+        self.save_delay = save_delay
+        self.watch_interval = watch_interval
+        self.lock = threading.RLock()  # Hold it to change several keys (or nested values) together
+        self.listeners = []
+        self.timer = None
+        self.signature = None  # (mtime, size) of the file as we last wrote or read it
+        self.watcher = None
+        self.stop_event = threading.Event()
+        self.updates = 0
+        self.writes = 0
+        self.bytes_written = 0
+        self.data, complete = self._load()
+        self.base = copy.deepcopy(self.data)  # The file's content as last read or written, for merging edits
+        if not complete:
+            self.flush()  # Create the file, or add keys introduced since it was written
+
+    def _load(self):
+        """Return the file merged over the defaults, and whether the file had every key."""
+        data = copy.deepcopy(self.defaults)
+        try:
+            text = self.path.read_text(encoding="utf-8")
+            self.signature = self._stat()
+            loaded = json.loads(text)
+            data.update(loaded)
+            return data, not (self.defaults.keys() - loaded.keys())
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            # Keep the broken file for inspection instead of silently overwriting it
+            broken = self.path.with_name(f"{self.path.name}.broken-{int(time.time())}")
+            print(f"Could not read {self.path} ({e}); using defaults. The old file is kept as {broken.name}.")
+            try:
+                os.replace(self.path, broken)
+            except OSError:
+                pass
+        return data, False
+
+    def _stat(self):
+        try:
+            stat = self.path.stat()
+            return stat.st_mtime_ns, stat.st_size
+        except OSError:
+            return None
+
+    def __getitem__(self, key):
+        with self.lock:
+            return self.data[key]
+
+    def __setitem__(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.save()
+
+    def __delitem__(self, key):
+        with self.lock:
+            del self.data[key]
+            self.save()
+
+    def __iter__(self):
+        with self.lock:
+            return iter(list(self.data))
+
+    def __len__(self):
+        return len(self.data)
+
+    def save(self):
+        """Schedule a write; changes made within `save_delay` of each other go out together."""
+        with self.lock:
+            self.updates += 1
+            if self.save_delay <= 0:
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(self.save_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        """Write pending changes now, merged with any edit made to the file since it was last read."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            changed = self._merge_file()
+            text = json.dumps(self.data, indent=4)
+            try:
+                atomic_write(self.path, text)
+            except OSError as e:
+                print(f"Could not save settings: {e}")
+                return
+            self.signature = self._stat()
+            self.base = copy.deepcopy(self.data)
+            self.writes += 1
+            self.bytes_written += len(text.encode("utf-8"))
+        self._notify(changed)
+
+    def on_change(self, callback):
+        self.listeners.append(callback)
+
+    def reload(self):
+        """Re-read the file if someone else changed it. Returns the changed keys."""
+        with self.lock:
+            changed = self._merge_file()
+        self._notify(changed)
+        return changed
+
+    def _merge_file(self):
+        """Take the keys edited in the file since we last read or wrote it; keep our values for the rest.
+
+        Changes still waiting for the debounced save are kept, not
+        overwritten, and the edit is not lost when that save goes out.
+        Returns the keys whose values changed here. Call with the lock held.
+        """
+        signature = self._stat()
+        if signature is None or signature == self.signature:
+            return set()  # Unchanged or gone
+        try:
+            loaded = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return set()  # Probably caught mid-edit by a non-atomic editor; try again next time
+        self.signature = signature
+        disk = copy.deepcopy(self.defaults)
+        disk.update(loaded)
+        missing = object()
+        changed = set()
+        for key in disk.keys() | self.base.keys():
+            theirs, base, ours = disk.get(key, missing), self.base.get(key, missing), self.data.get(key, missing)
+            if theirs == base or theirs == ours:
+                continue  # Not edited in the file, or edited to what we have
+            if ours != base:
+                print(f"Setting '{key}' was changed both here and in {self.path.name}; keeping the file's value.")
+            if theirs is missing:
+                del self.data[key]
+            else:
+                self.data[key] = copy.deepcopy(theirs)
+            changed.add(key)
+        self.base = disk
+        return changed
+
+    def _notify(self, changed):
+        if not changed:
+            return
+        for callback in self.listeners:
+            try:
+                callback(changed)
+            except Exception as e:
+                print(f"Error applying settings change: {e}")
+
+    def watch(self):
+        """Reload external edits in the background, with watchdog events when available."""
+        if self.watcher:
+            return
+        changed = threading.Event()
+        try:
+            from watchdog.events import FileSystemEventHandler
+            from watchdog.observers import Observer
+
+            path = str(self.path.resolve())
+
+            class Handler(FileSystemEventHandler):
+                def on_any_event(self, event):
+                    if path in (getattr(event, "src_path", None), getattr(event, "dest_path", None)):
+                        changed.set()
+
+            observer = Observer()
+            observer.schedule(Handler(), str(self.path.resolve().parent), recursive=False)
+            observer.daemon = True
+            observer.start()
+        except ImportError:
+            pass  # Poll instead; one stat() per interval
+
+        def run():
+            while not self.stop_event.is_set():
+                changed.wait(self.watch_interval)
+                changed.clear()
+                self.reload()
+
+        self.watcher = threading.Thread(target=run, name="jarvis-settings", daemon=True)
+        self.watcher.start()
+
+    def close(self):
+        self.stop_event.set()
+        if self.timer is not None:
+            self.flush()
+
+
+def benchmark(updates=2000, interval=0.0005):
+    """Bytes and writes per update: rewrite-on-every-change vs. the debounced store, plus hot-reload latency."""
+    defaults = {"user_name": "Sir", "favorite_sites": {f"site{i}": f"https://site{i}.example" for i in range(50)},
+                "favorite_apps": {}, "voice_speed": 200}
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.json")
+        settings = copy.deepcopy(defaults)
+        written = 0
+        started = time.perf_counter()
+        for i in range(updates):
+            settings["voice_speed"] = 150 + i % 100
+            text = json.dumps(settings, indent=4)
+            with open(legacy_path, "w") as f:
+                f.write(text)
+            written += len(text)
+            time.sleep(interval)
+        legacy_elapsed = time.perf_counter() - started
+        print(f"Rewrite per change: {updates} writes, {written / 1e6:.1f} MB, "
+              f"{written / updates:.0f} bytes/update, {legacy_elapsed:.2f}s")
+
+        store = SettingsStore(os.path.join(tmp, "settings.json"), defaults, save_delay=0.2, watch_interval=0.05)
+        store.writes = store.bytes_written = 0
+        started = time.perf_counter()
+        for i in range(updates):
+            store["voice_speed"] = 150 + i % 100
+            time.sleep(interval)
+        store.flush()
+        elapsed = time.perf_counter() - started
+        print(f"Debounced store:    {store.writes} writes, {store.bytes_written / 1e6:.3f} MB, "
+              f"{store.bytes_written / updates:.0f} bytes/update, {elapsed:.2f}s "
+              f"(write amplification {written / max(1, store.bytes_written):.0f}x lower)")
+
+        # An external edit, the way a user would make one in a text editor
+        reloaded = threading.Event()
+        store.on_change(lambda keys: reloaded.set())
+        store.watch()
+        time.sleep(0.1)
+        edited = dict(store.data, user_name="Tony")
+        started = time.perf_counter()
+        atomic_write(store.path, json.dumps(edited))
+        reloaded.wait(5)
+        print(f"External edit picked up after {(time.perf_counter() - started) * 1000:.0f} ms: "
+              f"user_name = {store['user_name']}")
+
+        # An edit to the file while our own change is still waiting to be saved
+        store["voice_speed"] = 175
+        atomic_write(store.path, json.dumps(dict(json.loads(store.path.read_text()), user_name="Pepper")))
+        time.sleep(store.save_delay + 0.2)
+        on_disk = json.loads(store.path.read_text())
+        print(f"Edit during a pending save: file has user_name = {on_disk['user_name']}, "
+              f"voice_speed = {on_disk['voice_speed']}")
+        assert on_disk["user_name"] == "Pepper" and on_disk["voice_speed"] == 175
+        store.close()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
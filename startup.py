@@ -0,0 +1,137 @@
+"""Fast startup for main.py.
+
+Heavy modules (openai, speech_recognition, numpy, requests) are imported
+lazily, on first use, so Jarvis can greet the user before they have loaded.
+The microphone calibration runs in the background and its result is cached
+on disk, so the next start applies last time's values right away.
+"""
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+
+class LazyModule(types.ModuleType):
+    """Stands in for a module until an attribute is first read, then imports it and forwards to it.
+
+    importlib.util.LazyLoader isn't thread-safe before Python 3.12: two
+    threads touching a module at once (calibration, app index, archive
+    import, prefetch) could both execute it. Here the first touch goes
+    through importlib.import_module, whose per-module import locks make the
+    other threads wait for the one import, and sys.modules holds the real
+    module.
+    """
+
+    def __getattr__(self, attr):
+        module = self.__dict__.get("_module")
+        if module is None:
+            module = self.__dict__["_module"] = importlib.import_module(self.__name__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """Return module `name`, imported on first attribute access rather than now."""
+    if name in sys.modules:
+        return sys.modules[name]
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    return LazyModule(name)
+
+
+class CalibrationCache:
+    """Microphone calibration results from earlier runs, per audio format."""
+
+    def __init__(self, path="jarvis_calibration.json", max_age=7 * 24 * 3600):
+        self.path = Path(path)
+        self.max_age = max_age  # Rooms change; older results are recalibrated before use
+
+    def load(self, device):
+        try:
+            entry = json.loads(self.path.read_text()).get(device)
+        except (OSError, ValueError):
+            return None
+        if not entry or time.time() - entry.get("saved", 0) > self.max_age:
+            return None
+        return entry
+
+    def save(self, device, **values):
+        try:
+            entries = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            entries = {}
+        entries[device] = dict(values, saved=time.time())
+        temp = self.path.with_suffix(".tmp")
+        temp.write_text(json.dumps(entries, indent=4))
+        os.replace(temp, self.path)
+
+
+# Run in a scratch directory: imports main, then starts it up against a fake
+# microphone (PyAudio may not be installed) and reports the phase timings.
+_CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+import speech_recognition
+from audio_stream import FakeMicrophone
+speech_recognition.Microphone = lambda: FakeMicrophone(open_delay=0.1)
+patched = time.perf_counter()
+
+if hasattr(main, "start_calibration"):
+    main.start_calibration()
+else:
+    main.adjust_mic_sensitivity()
+main.say("Jarvis A.I is online and ready.")
+ready = time.perf_counter() - (patched - imported)
+print("RESULT " + json.dumps({"import": imported - started, "ready": ready - started}))
+sys.stdout.flush()
+main.os._exit(0)
+"""
+
+
+def measure(repo_dir, runs=3):
+    """Import time of main, its slowest imports and time-to-ready for the tree at `repo_dir`."""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [str(repo_dir), os.environ.get("PYTHONPATH")])))
+    # Modules the interpreter loads by itself (site, .pth files) aren't main's doing
+    bare = subprocess.run([sys.executable, "-X", "importtime", "-c", "pass"], env=env, capture_output=True, text=True)
+    preloaded = {row.split("|")[-1].strip() for row in bare.stderr.splitlines() if row.startswith("import time:")}
+    timings = []
+    modules = {}
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as scratch:
+            result = subprocess.run([sys.executable, "-X", "importtime", "-c", _CHILD], cwd=scratch, env=env,
+                                    capture_output=True, text=True, timeout=120)
+        line = next((l for l in result.stdout.splitlines() if l.startswith("RESULT ")), None)
+        if line is None:
+            raise RuntimeError(f"startup failed:\n{result.stderr[-2000:]}")
+        timings.append(json.JSONDecoder().raw_decode(line[7:])[0])  # The speech thread may print on the same line
+        for row in result.stderr.splitlines():
+            if not row.startswith("import time:") or "self [us]" in row:
+                continue
+            _, cumulative, name = row[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip()) - 1) // 2
+            if depth == 0 and name.strip() == "main":
+                break  # Children are listed before their parent; main's are done
+            if depth == 1 and name.strip() not in preloaded:
+                modules.setdefault(name.strip(), []).append(int(cumulative) / 1e6)
+    best = min(timings, key=lambda t: t["ready"])
+    slowest = sorted(((min(v), k) for k, v in modules.items()), reverse=True)[:8]
+    return best, slowest
+
+
+def benchmark(*repo_dirs):
+    """Compare startup of one or more checkouts (default: this one) under python -X importtime."""
+    for repo_dir in repo_dirs or (Path(__file__).resolve().parent,):
+        best, slowest = measure(repo_dir)
+        print(f"{repo_dir}: import main {best['import'] * 1000:.0f} ms, ready {best['ready'] * 1000:.0f} ms")
+        print("  slowest imports: " + ", ".join(f"{name} {seconds * 1000:.0f} ms" for seconds, name in slowest))
+
+
+if __name__ == "__main__":
+    benchmark(*sys.argv[1:])
@@ -0,0 +1,128 @@
+"""Streaming chat completions spoken sentence by sentence.
+
+Instead of waiting for the whole completion, tokens are read as they arrive,
+cut into sentences, and each finished sentence is handed to speech right away.
+The first words are spoken after the first sentence rather than the last.
+"""
+import re
+import sys
+import time
+
+from circuit_breaker import is_api_error
+
+# End of a sentence: . ! ? (optionally followed by a closing quote/bracket) and
+# whitespace, but not after common abbreviations or single initials
+_BOUNDARY = re.compile(r"(?<=[.!?])[\"')\]]?\s+|\n+")
+_ABBREVIATIONS = ("mr.", "mrs.", "ms.", "dr.", "prof.", "e.g.", "i.e.", "etc.", "vs.", "st.", "no.")
+
+
+class SentenceSplitter:
+    """Accumulates streamed text and returns sentences as soon as they are complete."""
+
+    def __init__(self, min_length=20):
+        self.buffer = ""
+        self.min_length = min_length  # Very short fragments are merged with what follows
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        for match in _BOUNDARY.finditer(self.buffer):
+            candidate = self.buffer[start:match.end()].strip()
+            words = candidate.split()
+            if not words or words[-1].lower() in _ABBREVIATIONS or re.fullmatch(r"[A-Z]\.", words[-1]):
+                continue
+            if len(candidate) < self.min_length and "\n" not in match.group():
+                continue
+            sentences.append(candidate)
+            start = match.end()
+        self.buffer = self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        rest = self.buffer.strip()
+        self.buffer = ""
+        return [rest] if rest else []
+
+
+class StreamResult:
+    __slots__ = ("text", "first_audio", "total", "streamed")
+
+    def __init__(self, text, first_audio, total, streamed):
+        self.text = text
+        self.first_audio = first_audio  # Seconds from request to the first sentence handed to speech
+        self.total = total
+        self.streamed = streamed
+
+
+def speak_completion(client, speak, stream=True, **request):
+    """Run a chat completion, passing each sentence of the answer to `speak` as soon as it is complete.
+
+    Falls back to a regular request if the stream itself breaks before any
+    text arrived. API errors (rate limits, timeouts, auth) and anything after
+    the first text are raised, so the caller's circuit breaker alone decides
+    whether to try again.
+    """
+    started = time.perf_counter()
+    first_audio = None
+    parts = []
+
+    def emit(sentence):
+        nonlocal first_audio
+        if first_audio is None:
+            first_audio = time.perf_counter() - started
+        speak(sentence)
+
+    if stream:
+        splitter = SentenceSplitter()
+        try:
+            for chunk in client.chat.completions.create(stream=True, **request):
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    parts.append(delta)
+                    for sentence in splitter.feed(delta):
+                        emit(sentence)
+        except Exception as e:
+            if parts or is_api_error(e):
+                raise
+            print(f"Streaming failed ({e}); retrying without streaming.")
+            stream = False
+        else:
+            for sentence in splitter.flush():
+                emit(sentence)
+
+    if not stream:
+        response = client.chat.completions.create(**request)
+        text = response.choices[0].message.content.strip()
+        parts = [text]
+        for sentence in SentenceSplitter().feed(text + "\n"):
+            emit(sentence)
+
+    return StreamResult("".join(parts).strip(), first_audio, time.perf_counter() - started, stream)
+
+
+def benchmark(runs=5, token_delay=0.03):
+    """Time to first audio, streamed vs. not, against a local fake OpenAI server."""
+    import openai
+    from fake_openai import FakeOpenAIServer
+
+    server = FakeOpenAIServer(token_delay=token_delay, min_words=60, max_words=120).start()
+    client = openai.OpenAI(api_key="fake", base_url=server.base_url)
+    request = {"model": "gpt-3.5-turbo", "max_tokens": 200,
+               "messages": [{"role": "user", "content": "Explain how rainbows form."}]}
+    for label, stream in (("non-streaming", False), ("streaming", True)):
+        first, total = [], []
+        for i in range(runs):
+            request["messages"][0]["content"] = f"Explain how rainbows form, take {i}."
+            result = speak_completion(client, lambda sentence: None, stream=stream, **request)
+            first.append(result.first_audio)
+            total.append(result.total)
+        print(f"{label:>14}: time to first audio {sum(first) / runs * 1000:.0f} ms, "
+              f"full answer {sum(total) / runs * 1000:.0f} ms")
+    server.stop()
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
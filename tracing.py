@@ -0,0 +1,259 @@
+"""Where the time goes in a voice command.
+
+Spans time the steps of a command (capture, voice detection, speech
+recognition, routing, HTTP and OpenAI calls, speech synthesis) and nest
+through a context variable, so an OpenAI call made while answering a command
+is recorded under it. Finished spans are appended to a JSONL file, one per
+line, and summarized as p50/p95/p99 per span name at shutdown.
+
+Tracing is off until configure() turns it on; until then span() hands back
+one shared object that does nothing, so the instrumentation costs a function
+call and a comparison.
+"""
+import contextvars
+import functools
+import itertools
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+
+_current = contextvars.ContextVar("current_span", default=None)
+_ids = itertools.count(1)
+_tracer = None
+
+
+class Span:
+    __slots__ = ("name", "id", "trace", "parent", "attrs", "start", "started", "token", "ended")
+
+    def __init__(self, name, parent, attrs):
+        self.name = name
+        self.id = next(_ids)
+        self.parent = parent.id if parent else None
+        self.trace = parent.trace if parent else self.id
+        self.attrs = attrs
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.token = None
+        self.ended = False
+
+    def set(self, **attrs):
+        """Attach details learned while the span runs, like a status code."""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.end()
+        return False
+
+    def end(self, **attrs):
+        """Finish a span that isn't used as a `with` block, e.g. one that spans pipeline stages."""
+        if self.ended:
+            return
+        self.ended = True
+        self.attrs.update(attrs)
+        tracer = _tracer
+        if tracer is not None:
+            tracer.finish(self, time.perf_counter() - self.started)
+
+
+class _NoopSpan:
+    __slots__ = ()
+
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def end(self, **attrs):
+        pass
+
+
+_NOOP = _NoopSpan()
+
+
+class Tracer:
+    """Writes finished spans to `path` and keeps recent durations per span name."""
+
+    def __init__(self, path="jarvis_trace.jsonl", keep=10000):
+        self.path = path
+        self.file = open(path, "a", encoding="utf-8")
+        self.lock = threading.Lock()
+        self.durations = {}
+        self.keep = keep
+
+    def finish(self, span, seconds):
+        record = {"trace": span.trace, "span": span.id, "parent": span.parent, "name": span.name,
+                  "start": round(span.start, 6), "ms": round(seconds * 1000, 3),
+                  "thread": threading.current_thread().name}
+        record.update(span.attrs)
+        line = json.dumps(record, default=str) + "\n"
+        with self.lock:
+            if span.name not in self.durations:
+                self.durations[span.name] = deque(maxlen=self.keep)
+            self.durations[span.name].append(seconds)
+            if not self.file.closed:
+                self.file.write(line)
+
+    def summary(self):
+        """{span name: {"count", "p50_ms", "p95_ms", "p99_ms"}}"""
+        with self.lock:
+            durations = {name: sorted(values) for name, values in self.durations.items()}
+        return {name: {"count": len(values),
+                       **{f"p{q}_ms": values[min(len(values) - 1, len(values) * q // 100)] * 1000
+                          for q in (50, 95, 99)}}
+                for name, values in durations.items()}
+
+    def report(self):
+        lines = [f"{'span':>14} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"]
+        for name, s in sorted(self.summary().items(), key=lambda item: -item[1]["p50_ms"]):
+            lines.append(f"{name:>14} {s['count']:>6} {s['p50_ms']:>9.1f} {s['p95_ms']:>9.1f} {s['p99_ms']:>9.1f}")
+        return "\n".join(lines)
+
+    def close(self):
+        with self.lock:
+            self.file.close()
+
+
+def configure(enabled=True, path="jarvis_trace.jsonl"):
+    """Turn tracing on (writing to `path`) or off. Returns the active tracer, if any."""
+    global _tracer
+    previous = _tracer
+    if enabled and previous is not None and previous.path == path:
+        return previous
+    _tracer = Tracer(path) if enabled else None
+    if previous is not None:
+        previous.close()
+    return _tracer
+
+
+def enabled():
+    return _tracer is not None
+
+
+def current_span():
+    """The span this code runs under; pass it as `parent` to continue the trace on another thread."""
+    return _current.get()
+
+
+def attach(span):
+    """Make `span` the parent of spans started from here on in this context (thread or task)."""
+    if isinstance(span, Span):
+        _current.set(span)
+
+
+def span(name, parent=None, **attrs):
+    """Time a `with` block as a span named `name`, nested under the current span (or `parent`)."""
+    if _tracer is None:
+        return _NOOP
+    return Span(name, parent or _current.get(), attrs)
+
+
+def annotate(**attrs):
+    """Attach details to the current span, if tracing is on."""
+    current = _current.get()
+    if current is not None:
+        current.set(**attrs)
+
+
+def record(name, seconds, **attrs):
+    """Add a span measured elsewhere (e.g. summed over a loop) under the current span."""
+    tracer = _tracer
+    if tracer is None:
+        return
+    finished = Span(name, _current.get(), attrs)
+    finished.start -= seconds
+    tracer.finish(finished, seconds)
+
+
+def traced(name):
+    """Decorator: run the function inside span(name)."""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return fn(*args, **kwargs)
+            with Span(name, _current.get(), {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def summary():
+    """Per-span percentiles so far (see Tracer.summary), or {} when tracing is off."""
+    tracer = _tracer
+    return tracer.summary() if tracer is not None else {}
+
+
+def shutdown():
+    """Print the per-span summary and close the trace file."""
+    tracer = _tracer
+    if tracer is None:
+        return
+    configure(False)
+    if tracer.durations:
+        print(f"Latency by stage (trace in {tracer.path}):")
+        print(tracer.report())
+
+
+def benchmark(calls=200000):
+    """Overhead of an instrumented call with tracing off and on, and a sample summary."""
+    def work():
+        pass
+
+    instrumented = traced("work")(work)
+
+    def timed(fn):
+        started = time.perf_counter()
+        for _ in range(calls):
+            fn()
+        return (time.perf_counter() - started) / calls * 1e9
+
+    def with_block():
+        with span("work"):
+            pass
+
+    bare = timed(work)
+    configure(False)
+    off_decorator, off_block = timed(instrumented), timed(with_block)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "trace.jsonl")
+        configure(True, path)
+        on_decorator = timed(instrumented)
+        print(f"Plain call {bare:.0f} ns; tracing off: decorator +{off_decorator - bare:.0f} ns, "
+              f"with-block +{off_block - bare:.0f} ns; tracing on: decorator +{on_decorator - bare:.0f} ns "
+              f"(span written to JSONL)")
+
+        # A command shaped like a real one, to show the nesting and the summary
+        configure(False)
+        configure(True, path)
+        for i in range(50):
+            with span("handle_command", intent="weather"):
+                record("vad", 0.0005, frames=150)
+                with span("route"):
+                    time.sleep(0.0002)
+                with span("http", host="wttr.in"):
+                    time.sleep(0.002 + 0.001 * (i % 10 == 0))
+        tracer = _tracer
+        shutdown()
+        with open(path) as f:
+            lines = f.readlines()
+        print(f"{len(lines)} spans in the trace, e.g. {lines[-3].strip()}")
+        assert tracer.summary()["http"]["count"] == 50
+
+
+if __name__ == "__main__":
+    benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,337 @@
+"""Text-to-speech for Jarvis.
+
+Text is queued and spoken by a single worker thread that owns the one
+synthesizer instance for the process, so say() returns immediately. Speech is
+synthesized to audio files that are kept in a small LRU disk cache, because
+the same greetings, prompts and jokes are spoken over and over. Playback can
+be interrupted at any time, e.g. when the user starts talking.
+"""
+import hashlib
+import os
+import platform
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import wave
+from collections import OrderedDict, deque
+from pathlib import Path
+
+import tracing
+
+
+class SpeechCache:
+    """LRU cache of synthesized audio files keyed by (text, voice, speed)."""
+
+    def __init__(self, directory="tts_cache", max_entries=200):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Oldest first, rebuilt from file modification times on startup
+        files = sorted(self.directory.glob("*.*"), key=lambda p: p.stat().st_mtime)
+        self.entries = OrderedDict((p.stem, p) for p in files if not p.name.startswith("."))
+
+    @staticmethod
+    def key(text, voice, speed):
+        return hashlib.sha1(f"{text}\0{voice}\0{speed}".encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            path = self.entries.get(key)
+            if path is None or not path.exists():
+                self.entries.pop(key, None)
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+        try:
+            os.utime(path)  # Keep the LRU order across restarts
+        except OSError:
+            pass
+        return path
+
+    def put(self, key, temp_path):
+        """Move a freshly synthesized file into the cache and return its cached path."""
+        path = self.directory / f"{key}{Path(temp_path).suffix}"
+        os.replace(temp_path, path)
+        with self.lock:
+            self.entries[key] = path
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                _, old = self.entries.popitem(last=False)
+                try:
+                    old.unlink()
+                except OSError:
+                    pass
+        return path
+
+
+class Synthesizer:
+    """Renders text to an audio file and plays audio files back."""
+
+    extension = ".wav"
+    renders_audio = True  # False: nothing is synthesized, so nothing goes into the cache
+
+    def __init__(self, voice=None, speed=200):
+        self.voice = voice
+        self.speed = speed
+
+    def synthesize(self, text, path):
+        raise NotImplementedError
+
+    def play(self, path, stop_event):
+        """Play `path`, returning early if `stop_event` gets set."""
+        raise NotImplementedError
+
+    @staticmethod
+    def _run_player(command, stop_event):
+        process = subprocess.Popen(command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        while process.poll() is None:
+            if stop_event.wait(0.02):
+                process.terminate()
+                break
+
+
+class MacSynthesizer(Synthesizer):
+    extension = ".aiff"
+
+    def synthesize(self, text, path):
+        command = ["say", "-r", str(self.speed), "-o", str(path)]
+        if self.voice:
+            command += ["-v", self.voice]
+        subprocess.run(command + [text], check=True)
+
+    def play(self, path, stop_event):
+        self._run_player(["afplay", str(path)], stop_event)
+
+
+class EspeakSynthesizer(Synthesizer):
+    def __init__(self, voice=None, speed=200):
+        super().__init__(voice, speed)
+        self.binary = shutil.which("espeak-ng") or shutil.which("espeak")
+        if not self.binary:
+            raise RuntimeError("espeak is not installed")
+        self.player = next((p for p in (["paplay"], ["aplay", "-q"], ["ffplay", "-nodisp", "-autoexit", "-loglevel", "quiet"])
+                            if shutil.which(p[0])), None)
+        if not self.player:
+            raise RuntimeError("no audio player (paplay, aplay or ffplay) found")
+
+    def synthesize(self, text, path):
+        command = [self.binary, "-s", str(self.speed), "-w", str(path)]
+        if self.voice:
+            command += ["-v", self.voice]
+        subprocess.run(command + [text], check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def play(self, path, stop_event):
+        self._run_player(self.player + [str(path)], stop_event)
+
+
+class SapiSynthesizer(Synthesizer):
+    """Windows SAPI voice, created once and reused for every phrase."""
+
+    def __init__(self, voice=None, speed=200):
+        super().__init__(voice, speed)
+        import pythoncom
+        from win32com.client import Dispatch
+        pythoncom.CoInitialize()  # The engine lives on the speech worker thread
+        self.Dispatch = Dispatch
+        self.engine = Dispatch("SAPI.SpVoice")
+        # SAPI rates go from -10 to 10, with 0 being roughly 180 words per minute
+        self.engine.Rate = max(-10, min(10, round((speed - 180) / 20)))
+        if voice:
+            for token in self.engine.GetVoices():
+                if voice.lower() in token.GetDescription().lower():
+                    self.engine.Voice = token
+                    break
+
+    def synthesize(self, text, path):
+        stream = self.Dispatch("SAPI.SpFileStream")
+        stream.Open(str(path), 3)  # SSFMCreateForWrite
+        self.engine.AudioOutputStream = stream
+        try:
+            self.engine.Speak(text)
+        finally:
+            stream.Close()
+            self.engine.AudioOutputStream = None
+
+    def play(self, path, stop_event):
+        import winsound
+        with wave.open(str(path), "rb") as f:
+            duration = f.getnframes() / f.getframerate()
+        winsound.PlaySound(str(path), winsound.SND_FILENAME | winsound.SND_ASYNC)
+        if stop_event.wait(duration):
+            winsound.PlaySound(None, 0)
+
+
+class PowerShellSynthesizer(Synthesizer):
+    """Fallback for Windows machines without pywin32."""
+
+    def synthesize(self, text, path):
+        text = text.replace("'", "''")
+        rate = max(-10, min(10, round((self.speed - 180) / 20)))
+        script = ("Add-Type -AssemblyName System.Speech; "
+                  "$s = New-Object System.Speech.Synthesis.SpeechSynthesizer; "
+                  f"$s.Rate = {rate}; $s.SetOutputToWaveFile('{path}'); $s.Speak('{text}'); $s.Dispose()")
+        subprocess.run(["powershell", "-command", script], check=True)
+
+    def play(self, path, stop_event):
+        SapiSynthesizer.play(self, path, stop_event)
+
+
+class PrintSynthesizer(Synthesizer):
+    """Used when no speech synthesizer is available; the text is already printed."""
+
+    renders_audio = False
+
+    def synthesize(self, text, path):
+        pass
+
+    def play(self, path, stop_event):
+        pass
+
+
+def create_synthesizer(voice=None, speed=200):
+    """Pick the synthesizer for this OS."""
+    system = platform.system()
+    try:
+        if system == "Darwin":
+            return MacSynthesizer(voice, speed)
+        if system == "Windows":
+            try:
+                return SapiSynthesizer(voice, speed)
+            except ImportError:
+                return PowerShellSynthesizer(voice, speed)
+        return EspeakSynthesizer(voice, speed)
+    except Exception as e:
+        print(f"Could not find a speech synthesizer ({e}). Text-to-speech is unavailable.")
+        return PrintSynthesizer(voice, speed)
+
+
+class SpeechEngine:
+    """Speaks queued text on a background thread."""
+
+    def __init__(self, voice=None, speed=200, cache_dir="tts_cache", cache_size=200, synthesizer_factory=create_synthesizer):
+        self.voice = voice
+        self.speed = speed
+        self.cache = SpeechCache(cache_dir, cache_size)
+        self.synthesizer_factory = synthesizer_factory
+        self.queue = queue.Queue()
+        self.stop_event = threading.Event()
+        self.generation = 0  # Bumped by interrupt(); older queued text is skipped
+        self.warmup = deque()  # Text to synthesize ahead of time, when there is nothing to say
+        self.synth_seconds = 0.0
+        self.synth_chars = 0
+        self.pending = 0
+        self.pending_lock = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="jarvis-speech", daemon=True)
+        self.thread.start()
+
+    def say(self, text):
+        """Queue `text` to be spoken and return immediately."""
+        with self.pending_lock:
+            self.pending += 1
+            generation = self.generation
+        self.queue.put((generation, text, tracing.current_span(), time.perf_counter()))
+
+    def busy(self):
+        with self.pending_lock:
+            return self.pending > 0
+
+    def wait(self, timeout=None):
+        """Block until everything queued so far has been spoken. Returns False on timeout."""
+        with self.pending_lock:
+            return self.pending_lock.wait_for(lambda: self.pending == 0, timeout)
+
+    def interrupt(self):
+        """Stop the current sentence and drop everything still queued (barge-in)."""
+        with self.pending_lock:
+            self.generation += 1
+        dropped = 0
+        try:
+            while True:
+                if self.queue.get_nowait() is not None:
+                    dropped += 1
+        except queue.Empty:
+            pass
+        self.stop_event.set()
+        self._done(dropped)
+
+    def warm(self, text):
+        """Synthesize `text` into the cache once nothing is queued to be spoken; it is not played.
+
+        The synthesizer belongs to the speech thread (SAPI can't be shared
+        across threads), so the work is done there, between sentences.
+        """
+        self.warmup.append(text)
+        self.queue.put(None)  # Wake the speech thread
+
+    def seconds_per_char(self, default=0.002):
+        """Average synthesis time per character so far, for budgeting warm()."""
+        return self.synth_seconds / self.synth_chars if self.synth_chars else default
+
+    def prepare(self, text):
+        """Synthesize `text` into the cache without speaking it; returns the cached path.
+
+        Returns None without touching the cache when the synthesizer produces no audio.
+        """
+        if not self.synthesizer.renders_audio:
+            return None
+        key = SpeechCache.key(text, self.voice, self.speed)
+        path = self.cache.get(key)
+        if path is None:
+            started = time.perf_counter()
+            fd, temp_path = tempfile.mkstemp(suffix=self.synthesizer.extension, dir=self.cache.directory, prefix=".")
+            os.close(fd)
+            try:
+                self.synthesizer.synthesize(text, temp_path)
+                path = self.cache.put(key, temp_path)
+                self.synth_seconds += time.perf_counter() - started
+                self.synth_chars += len(text)
+            except Exception:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+                raise
+        return path
+
+    def _done(self, count=1):
+        with self.pending_lock:
+            self.pending = max(0, self.pending - count)
+            self.pending_lock.notify_all()
+
+    def _run(self):
+        self.synthesizer = self.synthesizer_factory(self.voice, self.speed)
+        while True:
+            item = self.queue.get()
+            if item is None:
+                self._warm_up()
+                continue
+            generation, text, parent, queued = item
+            try:
+                if generation != self.generation:
+                    continue  # Interrupted before it was spoken
+                self.stop_event.clear()
+                with tracing.span("tts", parent, chars=len(text),
+                                  queued_ms=round((time.perf_counter() - queued) * 1000, 1)):
+                    path = self.prepare(text)
+                if generation == self.generation:
+                    with tracing.span("playback", parent):
+                        self.synthesizer.play(path, self.stop_event)
+            except Exception as e:
+                print(f"Speech error: {e}")
+            finally:
+                self._done()
+
+    def _warm_up(self):
+        # One phrase at a time, so something to say never waits for more than one
+        while self.warmup and self.queue.empty():
+            text = self.warmup.popleft()
+            try:
+                with tracing.span("tts_warm", chars=len(text)):
+                    self.prepare(text)
+            except Exception as e:
+                print(f"Speech error: {e}")
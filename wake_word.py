@@ -0,0 +1,350 @@
+"""Local wake word detection on raw microphone frames.
+
+Instead of sending every phrase to Google just to look for the wake word,
+frames are turned into MFCC features and compared against templates built from
+a few enrolled recordings of the wake word. Only when a template matches does
+audio go on to full speech recognition.
+"""
+import os
+import sys
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+SAMPLES_DIR = "wake_word_samples"
+
+
+def read_wav(path):
+    """Read a mono or stereo 16-bit WAV file as float samples in [-1, 1] plus its sample rate."""
+    with wave.open(str(path), "rb") as f:
+        rate = f.getframerate()
+        channels = f.getnchannels()
+        data = np.frombuffer(f.readframes(f.getnframes()), dtype="<i2").astype(np.float32) / 32768.0
+    if channels > 1:
+        data = data.reshape(-1, channels).mean(axis=1)
+    return data, rate
+
+
+def resample(samples, from_rate, to_rate):
+    """Linear-interpolation resampler, good enough for feature extraction."""
+    if from_rate == to_rate or len(samples) == 0:
+        return samples
+    duration = len(samples) / from_rate
+    target = np.arange(int(duration * to_rate)) / to_rate
+    return np.interp(target, np.arange(len(samples)) / from_rate, samples).astype(np.float32)
+
+
+class MFCC:
+    """Frame-level MFCC extractor with precomputed window, mel filterbank and DCT matrices."""
+
+    def __init__(self, sample_rate, frame_ms=25, hop_ms=10, n_filters=26, n_mfcc=13):
+        self.sample_rate = sample_rate
+        self.frame_len = int(sample_rate * frame_ms / 1000)
+        self.hop = int(sample_rate * hop_ms / 1000)
+        self.n_fft = 1 << (self.frame_len - 1).bit_length()
+        self.window = np.hamming(self.frame_len).astype(np.float32)
+
+        # Triangular mel filterbank
+        mel_max = 2595 * np.log10(1 + (sample_rate / 2) / 700)
+        hz_points = 700 * (10 ** (np.linspace(0, mel_max, n_filters + 2) / 2595) - 1)
+        bins = np.floor((self.n_fft + 1) * hz_points / sample_rate).astype(int)
+        self.filters = np.zeros((n_filters, self.n_fft // 2 + 1), dtype=np.float32)
+        for m in range(1, n_filters + 1):
+            left, center, right = bins[m - 1], bins[m], bins[m + 1]
+            for k in range(left, center):
+                self.filters[m - 1, k] = (k - left) / max(center - left, 1)
+            for k in range(center, right):
+                self.filters[m - 1, k] = (right - k) / max(right - center, 1)
+
+        # DCT-II basis; coefficient 0 (overall loudness) is dropped for robustness
+        n = np.arange(n_filters)
+        self.dct = np.cos(np.pi / n_filters * (n + 0.5)[None, :] * np.arange(1, n_mfcc)[:, None]).astype(np.float32)
+
+    def __call__(self, samples):
+        """Return an array of shape (frames, n_mfcc - 1) for the given samples."""
+        if len(samples) < self.frame_len:
+            return np.zeros((0, self.dct.shape[0]), dtype=np.float32)
+        emphasized = np.append(samples[0], samples[1:] - 0.97 * samples[:-1])
+        count = 1 + (len(emphasized) - self.frame_len) // self.hop
+        index = np.arange(self.frame_len)[None, :] + self.hop * np.arange(count)[:, None]
+        frames = emphasized[index] * self.window
+        power = np.abs(np.fft.rfft(frames, self.n_fft)) ** 2 / self.n_fft
+        energies = np.log(power @ self.filters.T + 1e-10)
+        return energies @ self.dct.T
+
+
+def subsequence_dtw(template, window):
+    """Best average alignment cost of `template` against any stretch of `window`.
+
+    Uses a slope-constrained step pattern (each template frame advances the
+    window by 0, 1 or 2 frames) so every row can be computed with vector ops.
+    """
+    cost = np.sqrt(((template[:, None, :] - window[None, :, :]) ** 2).sum(axis=2))
+    acc = cost[0].copy()
+    for i in range(1, len(template)):
+        prev = acc
+        shifted1 = np.concatenate(([np.inf], prev[:-1]))
+        shifted2 = np.concatenate(([np.inf, np.inf], prev[:-2]))
+        acc = cost[i] + np.minimum(prev, np.minimum(shifted1, shifted2))
+    return float(acc.min()) / len(template)
+
+
+class WakeWordEngine:
+    """A wake word stage that looks at raw audio frames and reports when the wake word was heard."""
+
+    def process(self, frame):
+        """Feed one chunk of 16-bit PCM audio; return True if the wake word ends in it."""
+        return False
+
+    def reset(self):
+        """Forget buffered audio, e.g. after a command was handled."""
+
+
+class TemplateWakeWord(WakeWordEngine):
+    """Matches MFCC templates of enrolled wake word recordings against live audio."""
+
+    def __init__(self, templates, sample_rate, sensitivity=0.5, check_every_ms=100, refractory_s=1.5):
+        self.features = MFCC(sample_rate)
+        self.sample_rate = sample_rate
+        self.templates = [t for t in templates if len(t)]
+        if not self.templates:
+            raise ValueError("At least one non-empty wake word template is needed.")
+        self.longest = max(len(t) for t in self.templates)
+        self.window_frames = int(self.longest * 1.5)
+        self.check_every = max(1, check_every_ms // 10)
+        self.refractory = int(refractory_s * 100)
+        self.threshold = self._threshold(sensitivity)
+        self.reset()
+
+    def _threshold(self, sensitivity):
+        """Match threshold from the spread between enrolled samples, scaled by sensitivity (0-1)."""
+        if len(self.templates) > 1:
+            spread = max(subsequence_dtw(a, b) for a in self.templates for b in self.templates if a is not b)
+        else:
+            spread = 12.0  # Typical same-speaker distance for these features
+        return spread * (0.8 + 0.8 * min(max(sensitivity, 0.0), 1.0))
+
+    def set_sensitivity(self, sensitivity):
+        self.threshold = self._threshold(sensitivity)
+
+    def reset(self):
+        self.pending = np.zeros(0, dtype=np.float32)
+        self.history = np.zeros((0, self.templates[0].shape[1]), dtype=np.float32)
+        self.since_check = 0
+        self.cooldown = 0
+        self.noise_floor = None
+        self.last_voiced = self.window_frames + 1
+
+    def process(self, frame):
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32) / 32768.0
+        self.pending = np.concatenate((self.pending, samples))
+        features = self.features(self.pending)
+        if len(features) == 0:
+            return False
+        self.pending = self.pending[len(features) * self.features.hop:]
+        self.history = np.concatenate((self.history, features))[-self.window_frames:]
+
+        # Cheap energy gate: only run the template match if something louder
+        # than the noise floor was heard within the last window
+        energy = float(np.mean(samples ** 2)) + 1e-12
+        if self.noise_floor is None:
+            self.noise_floor = energy
+        if energy > self.noise_floor * 3:
+            self.last_voiced = 0
+        else:
+            self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+            self.last_voiced += len(features)
+
+        self.since_check += len(features)
+        self.cooldown = max(0, self.cooldown - len(features))
+        if (self.since_check < self.check_every or self.cooldown or self.last_voiced > self.window_frames
+                or len(self.history) < self.longest // 2):
+            return False
+        self.since_check = 0
+
+        score = min(subsequence_dtw(t, self.history) for t in self.templates)
+        if score <= self.threshold:
+            self.cooldown = self.refractory
+            return True
+        return False
+
+    @classmethod
+    def from_directory(cls, directory, sample_rate, sensitivity=0.5):
+        """Build templates from every WAV file in `directory`."""
+        extractor = MFCC(sample_rate)
+        templates = []
+        for path in sorted(Path(directory).glob("*.wav")):
+            samples, rate = read_wav(path)
+            templates.append(extractor(trim_silence(resample(samples, rate, sample_rate), sample_rate)))
+        return cls(templates, sample_rate, sensitivity)
+
+
+def trim_silence(samples, sample_rate, frame_ms=10):
+    """Cut leading and trailing silence from an enrollment recording."""
+    frame = max(1, int(sample_rate * frame_ms / 1000))
+    count = len(samples) // frame
+    if count == 0:
+        return samples
+    energy = (samples[:count * frame].reshape(count, frame) ** 2).mean(axis=1)
+    voiced = np.nonzero(energy > max(energy.max() * 0.02, 1e-7))[0]
+    if len(voiced) == 0:
+        return samples
+    return samples[voiced[0] * frame:(voiced[-1] + 1) * frame]
+
+
+def samples_directory(wake_word):
+    return Path(SAMPLES_DIR) / wake_word.lower().replace(" ", "_")
+
+
+def load_wake_word_engine(settings, sample_rate):
+    """Return a local wake word engine for the configured wake word, or None if none is enrolled."""
+    if settings.get("wake_word_engine", "local") != "local":
+        return None
+    directory = samples_directory(settings["wake_word"])
+    if not directory.exists() or not any(directory.glob("*.wav")):
+        return None
+    try:
+        return TemplateWakeWord.from_directory(directory, sample_rate, settings.get("wake_word_sensitivity", 0.5))
+    except Exception as e:
+        print(f"Could not load wake word samples: {e}")
+        return None
+
+
+def enroll(source, recognizer, wake_word, count=3):
+    """Record `count` samples of the wake word from an audio source into the samples directory."""
+    directory = samples_directory(wake_word)
+    directory.mkdir(parents=True, exist_ok=True)
+    saved = []
+    for i in range(count):
+        print(f"Say '{wake_word}' ({i + 1}/{count})...")
+        audio = recognizer.listen(source, timeout=5, phrase_time_limit=2)
+        path = directory / f"sample_{int(time.time())}_{i}.wav"
+        with open(path, "wb") as f:
+            f.write(audio.get_wav_data())
+        saved.append(path)
+    return saved
+
+
+# Formants (Hz) of the vowels the synthetic words are made of, and the words as (sound, seconds)
+_FORMANTS = {"a": (730, 1090, 2440), "e": (530, 1840, 2480), "i": (270, 2290, 3010),
+             "o": (570, 840, 2410), "u": (300, 870, 2240)}
+_WORDS = {"jarvis": [("a", 0.24), ("i", 0.16), ("s", 0.12)], "hello": [("e", 0.16), ("o", 0.26)],
+          "music": [("u", 0.18), ("i", 0.14), ("s", 0.1)], "okay": [("o", 0.16), ("e", 0.24)]}
+
+
+def _synthetic_word(word, sample_rate, pitch, rng, stretch=1.0):
+    """A word as voiced vowels (harmonics of `pitch` shaped by formants) and a hissed "s"."""
+    parts = []
+    for sound, length in _WORDS[word]:
+        n = int(length * stretch * sample_rate)
+        t = np.arange(n) / sample_rate
+        if sound == "s":
+            spectrum = np.fft.rfft(rng.normal(0, 1, n))
+            spectrum[np.fft.rfftfreq(n, 1 / sample_rate) < 3500] = 0
+            audio = 0.03 * np.fft.irfft(spectrum, n)
+        else:
+            audio = np.zeros(n)
+            for k in range(1, int(sample_rate / 2 / pitch)):
+                gain = sum(1 / (1 + ((pitch * k - f) / 80) ** 2) for f in _FORMANTS[sound])
+                audio += gain * np.sin(2 * np.pi * pitch * k * t) / k ** 0.5
+            audio *= 0.08 / (np.abs(audio).max() + 1e-9)
+        edge = min(n // 4, int(0.02 * sample_rate))
+        envelope = np.ones(n)
+        envelope[:edge] = np.linspace(0, 1, edge)
+        envelope[n - edge:] = np.linspace(1, 0, edge)
+        parts.append(audio * envelope)
+    return np.concatenate(parts)
+
+
+def write_fixtures(directory, count=4, sample_rate=16000, seed=3):
+    """Synthetic enrollment samples of "jarvis" and clips mixing it with other words, with .labels files.
+
+    The samples go in `directory`/samples; each clip's .labels file marks where
+    "jarvis" was said, so detections can be scored.
+    """
+    def write(path, audio):
+        with wave.open(str(path), "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes((np.clip(audio, -1, 1) * 32767).astype("<i2").tobytes())
+
+    rng = np.random.default_rng(seed)
+    directory = Path(directory)
+    (directory / "samples").mkdir(parents=True, exist_ok=True)
+    for n in range(3):
+        word = _synthetic_word("jarvis", sample_rate, rng.uniform(110, 150), rng, rng.uniform(0.85, 1.15))
+        audio = np.concatenate((np.zeros(int(0.15 * sample_rate)), word, np.zeros(int(0.15 * sample_rate))))
+        write(directory / "samples" / f"jarvis_{n}.wav", audio + rng.normal(0, rng.uniform(0.003, 0.008), len(audio)))
+    for n in range(count):
+        audio = rng.normal(0, 0.003 * (1 + n % 3), int(5.0 * sample_rate))
+        labels = []
+        start = 0.5 + rng.uniform(0, 0.3)
+        for name in rng.permutation(["jarvis", "hello", "music", "jarvis", "okay"]):
+            word = _synthetic_word(name, sample_rate, rng.uniform(100, 200), rng, rng.uniform(0.85, 1.15))
+            offset = int(start * sample_rate)
+            if offset + len(word) > len(audio):
+                break
+            audio[offset:offset + len(word)] += word
+            if name == "jarvis":
+                labels.append((start, start + len(word) / sample_rate))
+            start += len(word) / sample_rate + rng.uniform(0.4, 0.7)
+        path = directory / f"clip_{n}.wav"
+        write(path, audio)
+        path.with_suffix(".labels").write_text("".join(f"{a:.3f}\t{b:.3f}\tjarvis\n" for a, b in labels))
+
+
+def benchmark(samples_dir, fixtures, sensitivity=0.5, chunk=1024):
+    """Report CPU time per second of audio and detections for each WAV fixture.
+
+    A fixture with a .labels file next to it is also scored: a detection up to
+    0.5 s after a labelled wake word counts as a hit, any other as a false alarm.
+    """
+    from vad import read_labels
+
+    total_audio = 0.0
+    total_cpu = 0.0
+    hits = misses = false_alarms = 0
+    for path in fixtures:
+        samples, rate = read_wav(path)
+        engine = TemplateWakeWord.from_directory(samples_dir, rate, sensitivity)
+        pcm = (np.clip(samples, -1, 1) * 32767).astype("<i2").tobytes()
+        detections = []
+        started = time.process_time()
+        for i in range(0, len(pcm), chunk * 2):
+            if engine.process(pcm[i:i + chunk * 2]):
+                detections.append(min(i + chunk * 2, len(pcm)) / 2 / rate)
+        cpu = time.process_time() - started
+        seconds = len(samples) / rate
+        total_audio += seconds
+        total_cpu += cpu
+        scored = ""
+        labels_path = Path(path).with_suffix(".labels")
+        if labels_path.exists():
+            labels = read_labels(labels_path)
+            found = [any(a <= d <= b + 0.5 for d in detections) for a, b in labels]
+            extra = sum(not any(a <= d <= b + 0.5 for a, b in labels) for d in detections)
+            hits += sum(found)
+            misses += len(found) - sum(found)
+            false_alarms += extra
+            scored = f" ({sum(found)} of {len(labels)} wake words, {extra} false)"
+        print(f"{os.path.basename(path)}: {len(detections)} detection(s){scored}, "
+              f"{cpu / seconds * 1000:.1f} ms CPU per second of audio")
+    if total_audio:
+        print(f"Overall: {total_cpu / total_audio * 1000:.1f} ms CPU per second of audio")
+    if hits or misses or false_alarms:
+        print(f"Labelled: {hits} hits, {misses} misses, {false_alarms} false alarms")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "--write-fixtures":
+        write_fixtures(Path(__file__).parent / "fixtures" / "wake_word")
+    elif len(sys.argv) >= 3:
+        benchmark(sys.argv[1], sys.argv[2:])
+    else:
+        # The committed synthetic fixtures, unless enrolled samples and recordings are passed:
+        # python wake_word.py <samples_dir> <fixture.wav> [...]
+        fixtures_dir = Path(__file__).parent / "fixtures" / "wake_word"
+        benchmark(fixtures_dir / "samples", sorted(fixtures_dir.glob("clip_*.wav")))